@@ -8,7 +8,8 @@ https://github.com/MrFjellstad/norgesnett
 import asyncio
 import importlib
 import logging
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from typing import Optional
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
@@ -22,18 +23,37 @@ import voluptuous as vol
 from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
 
-from .api import NorgesnettApiClient
+from .api import NorgesnettApiClient, split_meteringpoint_ids
+from .backfill import HistoryBackfill
 from .const import (
+    CAPACITY_STORAGE_KEY,
     CONF_CUSTOMER_ID,
+    CONF_MAX_STALENESS,
     CONF_METERINGPOINT_ID,
+    CONF_PUBLISH_HOUR,
+    DEFAULT_MAX_STALENESS,
+    DEFAULT_PUBLISH_HOUR,
     DOMAIN,
+    HISTORY_FILE,
     PLATFORMS,
+    REGISTRY,
     STARTUP_MESSAGE,
+    STORAGE_KEY,
+    STORAGE_VERSION,
 )
+from .history import TariffHistory
+from .model import TariffData, TariffParseError
+from .scheduler import BoundaryScheduler, RefreshSchedule
+from .services import async_setup_services
+from .statistics import async_import_statistics
 
 SCAN_INTERVAL = timedelta(days=1)
+RETRY_INTERVAL = timedelta(minutes=5)
+MAX_RETRY_INTERVAL = timedelta(hours=1)
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
@@ -49,7 +69,8 @@ CONFIG_SCHEMA = (
 
 
 async def async_setup(hass: HomeAssistant, config: Config):
-    """Set up this integration using YAML is not supported."""
+    """Set up the services, setting up using YAML is not supported."""
+    async_setup_services(hass)
     return True
 
 
@@ -59,18 +80,25 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         hass.data.setdefault(DOMAIN, {})
         _LOGGER.info(STARTUP_MESSAGE)
 
-    customer_id = entry.data.get(CONF_CUSTOMER_ID)
-    meteringpoint_id = entry.data.get(CONF_METERINGPOINT_ID)
-
-    session = async_get_clientsession(hass)
-    client = NorgesnettApiClient(customer_id, meteringpoint_id, session)
-
-    coordinator = NorgesnettDataUpdateCoordinator(hass, client=client)
-    coordinator.entry_id = entry.entry_id
-    await coordinator.async_refresh()
-
-    if not coordinator.last_update_success:
-        raise ConfigEntryNotReady
+    registry = hass.data[DOMAIN].setdefault(REGISTRY, CoordinatorRegistry(hass))
+    coordinator, created = registry.attach(entry)
+    meteringpoint_ids = split_meteringpoint_ids(entry.data.get(CONF_METERINGPOINT_ID))
+
+    if created and await coordinator.async_load_stored_data():
+        # Entities start from today's stored tariffs, the API is queried later.
+        hass.async_create_task(coordinator.async_refresh())
+    elif created or any(
+        meteringpoint_id not in coordinator.tariff.points
+        for meteringpoint_id in meteringpoint_ids
+    ):
+        await coordinator.async_refresh()
+
+        if any(
+            meteringpoint_id not in coordinator.tariff.points
+            for meteringpoint_id in meteringpoint_ids
+        ):
+            await registry.async_detach(entry)
+            raise ConfigEntryNotReady
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
@@ -79,24 +107,104 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     ]
     await hass.config_entries.async_forward_entry_setups(entry, platforms)
 
+    # Past tariffs missing from the history are fetched in the background.
+    entry.async_create_background_task(
+        hass,
+        registry.backfill.async_run(coordinator.api, meteringpoint_ids),
+        f"{DOMAIN} history backfill",
+    )
+
     entry.add_update_listener(async_reload_entry)
     return True
 
 
 class NorgesnettDataUpdateCoordinator(DataUpdateCoordinator):
-    """Class to manage fetching data from the API."""
+    """Class to manage fetching data from the API.
+
+    Each refresh fetches today's and tomorrow's tariffs, so ``tariff`` is a
+    rolling window and the day rollover needs no request. After a successful
+    refresh the next one is planned by :class:`RefreshSchedule`, aligned to
+    ``publish_time``.
+
+    When a refresh fails, ``stale`` is set and the last good data is kept
+    while its periods still cover the current time, and for at least
+    ``max_staleness`` after it was fetched. The API is retried with an
+    exponential backoff from ``RETRY_INTERVAL`` up to ``MAX_RETRY_INTERVAL``.
+    Once the data is past both, the update fails and the entities go
+    unavailable, while the retries go on with the same backoff.
+    """
 
     def __init__(
         self,
         hass: HomeAssistant,
         client: NorgesnettApiClient,
+        storage_id: Optional[str] = None,
+        max_staleness: timedelta = timedelta(hours=DEFAULT_MAX_STALENESS),
+        publish_time: time = time(DEFAULT_PUBLISH_HOUR),
+        history: Optional[TariffHistory] = None,
     ) -> None:
         """Initialize."""
         self.api = client
+        self.history = history
         self.platforms = []
+        self.max_staleness = max_staleness
+        self.last_fetched: Optional[datetime] = None
+        self.stale = False
+        self.tariff = TariffData([])
+        self.refresh_schedule = RefreshSchedule(
+            publish_time, RETRY_INTERVAL, MAX_RETRY_INTERVAL
+        )
+        self.boundaries = BoundaryScheduler(
+            hass, lambda when: self.tariff.next_boundary(when)
+        )
+        self._retries = 0
+        self._store = (
+            Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{storage_id}")
+            if storage_id
+            else None
+        )
 
         super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=SCAN_INTERVAL)
 
+    @property
+    def data_age(self) -> Optional[timedelta]:
+        """Return how long ago the current data was fetched from the API."""
+        if self.last_fetched is None:
+            return None
+        return dt_util.utcnow() - self.last_fetched
+
+    async def async_load_stored_data(self) -> bool:
+        """Load the last good payload from storage if it is still current.
+
+        That is if it was fetched today, or covers the rest of today because
+        tomorrow's tariffs were prefetched. Returns True if the coordinator
+        now has data.
+        """
+        if self._store is None:
+            return False
+        stored = await self._store.async_load()
+        if not stored:
+            return False
+        fetched = dt_util.parse_datetime(stored["fetched"])
+        try:
+            tariff = TariffData.parse(stored["data"])
+        except TariffParseError as exception:
+            _LOGGER.warning("Norgesnett: ignoring stored tariffs: %s", exception)
+            return False
+        today = dt_util.now().date()
+        if dt_util.as_local(fetched).date() != today and (
+            tariff.covered_until is None
+            or tariff.covered_until
+            < dt_util.start_of_local_day(today + timedelta(days=1))
+        ):
+            return False
+        _LOGGER.debug("Norgesnett: using stored tariffs from %s", fetched)
+        self.last_fetched = fetched
+        self.tariff = tariff
+        self.boundaries.async_rearm()
+        self.async_set_updated_data(stored["data"])
+        return True
+
     async def _async_update_data(self):
         """Update data via library."""
 
@@ -109,10 +217,147 @@ class NorgesnettDataUpdateCoordinator(DataUpdateCoordinator):
             collections = result.get("gridTariffCollections") or []
             if not collections:
                 raise UpdateFailed("Ingen gridTariffCollections i respons")
-            return result
+            tariff = TariffData.parse(result)
         except Exception as exception:
             self.logger.error(exception)
-            raise UpdateFailed() from exception
+            self._retries += 1
+            self.update_interval = min(
+                RETRY_INTERVAL * 2 ** (self._retries - 1), MAX_RETRY_INTERVAL
+            )
+            age = self.data_age
+            covered_until = self.tariff.covered_until
+            if (
+                self.data is None
+                or age is None
+                or (
+                    age >= self.max_staleness
+                    and (covered_until is None or covered_until <= dt_util.utcnow())
+                )
+            ):
+                raise UpdateFailed() from exception
+            self.stale = True
+            _LOGGER.warning(
+                "Norgesnett: keeping tariffs fetched %s ago, retrying in %s",
+                age,
+                self.update_interval,
+            )
+            return self.data
+
+        self.stale = False
+        self._retries = 0
+        self.update_interval = self.refresh_schedule.next_interval(
+            dt_util.now(), tariff.covered_until
+        )
+        self.last_fetched = dt_util.utcnow()
+        self.tariff = tariff
+        self.boundaries.async_rearm()
+        self.hass.async_create_task(
+            async_import_statistics(self.hass, self.history, tariff)
+        )
+        if self.history is not None:
+            self.hass.async_create_task(self.history.async_append_tariff(tariff))
+        if self._store is not None:
+            await self._store.async_save(
+                {"fetched": self.last_fetched.isoformat(), "data": result}
+            )
+        return result
+
+
+class CoordinatorRegistry:
+    """Hand out one reference-counted coordinator per customer.
+
+    Every entry of a customer attaches to the same coordinator, whose client
+    fetches the metering points of all attached entries in one refresh. The
+    coordinator is dropped when its last entry detaches. It stores its
+    tariffs per customer and takes ``max_staleness`` and the publish hour
+    from the entry attached last, so changing them on any entry applies.
+    All coordinators append to the same :class:`TariffHistory`, which is
+    closed when the last one is dropped.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize without any coordinators."""
+        self._hass = hass
+        self._coordinators: dict[str, NorgesnettDataUpdateCoordinator] = {}
+        self._entries: dict[str, dict[str, list[str]]] = {}
+        self.history = TariffHistory(hass, hass.config.path(HISTORY_FILE))
+        self.backfill = HistoryBackfill(hass, self.history)
+
+    def get(self, customer_id: str) -> Optional[NorgesnettDataUpdateCoordinator]:
+        """Return the coordinator of ``customer_id``, if any entry uses it."""
+        return self._coordinators.get(customer_id)
+
+    def meteringpoint_ids(self, customer_id: str) -> list[str]:
+        """Return the metering points of all entries of ``customer_id``."""
+        meteringpoint_ids = []
+        for entry_ids in self._entries.get(customer_id, {}).values():
+            for meteringpoint_id in entry_ids:
+                if meteringpoint_id not in meteringpoint_ids:
+                    meteringpoint_ids.append(meteringpoint_id)
+        return meteringpoint_ids
+
+    def attach(
+        self, entry: ConfigEntry
+    ) -> tuple[NorgesnettDataUpdateCoordinator, bool]:
+        """Attach ``entry`` to its customer's coordinator.
+
+        Returns the coordinator and whether it was created for this entry.
+        """
+        customer_id = entry.data.get(CONF_CUSTOMER_ID)
+        entries = self._entries.setdefault(customer_id, {})
+        entries[entry.entry_id] = split_meteringpoint_ids(
+            entry.data.get(CONF_METERINGPOINT_ID)
+        )
+        client = self._client(customer_id)
+
+        max_staleness = timedelta(
+            hours=entry.options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS)
+        )
+        publish_time = time(entry.options.get(CONF_PUBLISH_HOUR, DEFAULT_PUBLISH_HOUR))
+
+        coordinator = self._coordinators.get(customer_id)
+        if coordinator is not None:
+            coordinator.api = client
+            coordinator.max_staleness = max_staleness
+            coordinator.refresh_schedule.publish_time = publish_time
+            return coordinator, False
+
+        coordinator = NorgesnettDataUpdateCoordinator(
+            self._hass,
+            client=client,
+            storage_id=customer_id,
+            max_staleness=max_staleness,
+            publish_time=publish_time,
+            history=self.history,
+        )
+        self._coordinators[customer_id] = coordinator
+        return coordinator, True
+
+    async def async_detach(self, entry: ConfigEntry) -> None:
+        """Undo :meth:`attach`, shutting down the coordinator after its last entry."""
+        customer_id = entry.data.get(CONF_CUSTOMER_ID)
+        entries = self._entries.get(customer_id, {})
+        entries.pop(entry.entry_id, None)
+        if entries:
+            self._coordinators[customer_id].api = self._client(customer_id)
+            return
+        self._entries.pop(customer_id, None)
+        coordinator = self._coordinators.pop(customer_id, None)
+        if coordinator is not None:
+            await coordinator.async_shutdown()
+            coordinator.boundaries.async_shutdown()
+        if not self._coordinators:
+            await self.history.async_close()
+
+    def _client(self, customer_id: str) -> NorgesnettApiClient:
+        """Return a client for all metering points of ``customer_id``."""
+        meteringpoint_ids = self.meteringpoint_ids(customer_id)
+        return NorgesnettApiClient(
+            customer_id,
+            meteringpoint_ids[0],
+            async_get_clientsession(self._hass),
+            meteringpoint_ids=meteringpoint_ids,
+        )
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -129,10 +374,30 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
     if unloaded:
         hass.data[DOMAIN].pop(entry.entry_id)
+        await hass.data[DOMAIN][REGISTRY].async_detach(entry)
 
     return unloaded
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the entry's stored data.
+
+    The capacity peaks belong to the entry, the stored tariffs are removed
+    once the customer's last entry is deleted.
+    """
+    await Store(
+        hass, STORAGE_VERSION, f"{CAPACITY_STORAGE_KEY}.{entry.entry_id}"
+    ).async_remove()
+    customer_id = entry.data.get(CONF_CUSTOMER_ID)
+    if any(
+        other.data.get(CONF_CUSTOMER_ID) == customer_id
+        for other in hass.config_entries.async_entries(DOMAIN)
+        if other.entry_id != entry.entry_id
+    ):
+        return
+    await Store(hass, STORAGE_VERSION, f"{STORAGE_KEY}.{customer_id}").async_remove()
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
     await async_unload_entry(hass, entry)
@@ -1,76 +1,348 @@
 """Sample API Client."""
 
 import asyncio
+import json
 import logging
+import random
 import socket
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 from typing import Optional
 
 import aiohttp
 import async_timeout
+from homeassistant.util import dt as dt_util
 
 from .const import API_AUTH_URL, API_TARIFFS_URL
 
+# Seconds a request may take in all, retries and waits between them included
 TIMEOUT = 20
+MAX_RETRY_DELAY = 8.0
+API_KEY_TTL = 3600
+BATCH_SIZE = 10
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 HEADERS = {"Content-type": "application/json; charset=UTF-8"}
 
+AUTH_ERROR_STATUSES = (401, 403)
+RETRY_STATUSES = (408, 429)
+
+
+def retry_after(exception: aiohttp.ClientResponseError) -> Optional[float]:
+    """Return the seconds to wait from a ``Retry-After`` header, if any."""
+    value = (exception.headers or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - dt_util.utcnow()).total_seconds())
+
+
+class RetryPolicy:
+    """Decide which failed requests are tried again, and after how long.
+
+    Timeouts, connection errors, 408, 429 and 5xx responses are retried.
+    Other responses, such as 400, 401 and 404, will not change by asking
+    again and are raised at once; a rejected apiKey is renewed by the caller.
+    Waits use decorrelated jitter, a random delay between ``base_delay`` and
+    three times the previous one capped at ``max_delay``, unless the server
+    sent a ``Retry-After``. All attempts share one ``deadline``: no attempt
+    runs past it, and no wait is started that would end after it. Calls
+    made of several requests share it through :meth:`until`.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = MAX_RETRY_DELAY,
+        deadline: float = TIMEOUT,
+    ) -> None:
+        """Initialize the policy."""
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @staticmethod
+    def is_retryable(exception: Exception) -> bool:
+        """Return True if a request that failed with ``exception`` may succeed."""
+        if isinstance(exception, aiohttp.ClientResponseError):
+            return exception.status in RETRY_STATUSES or exception.status >= 500
+        return isinstance(
+            exception, (asyncio.TimeoutError, aiohttp.ClientError, socket.gaierror)
+        )
+
+    def expires(self) -> float:
+        """Return the event loop time the deadline of a call started now ends."""
+        return asyncio.get_running_loop().time() + self.deadline
+
+    def until(self, expires: float) -> "RetryPolicy":
+        """Return a copy whose deadline is the time left until ``expires``.
+
+        Used to share one deadline between the requests of a logical call.
+        """
+        return RetryPolicy(
+            self.max_attempts,
+            self.base_delay,
+            self.max_delay,
+            max(0.0, expires - asyncio.get_running_loop().time()),
+        )
+
+    def delay(self, previous: float, exception: Exception) -> float:
+        """Return the seconds to wait before the next attempt."""
+        if isinstance(exception, aiohttp.ClientResponseError):
+            wait = retry_after(exception)
+            if wait is not None:
+                return wait
+        return min(
+            self.max_delay,
+            random.uniform(self.base_delay, max(self.base_delay, previous * 3)),
+        )
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+class ApiKeyCache:
+    """Process-wide cache of apiKeys keyed by (customer_id, meteringpoint_id)."""
+
+    def __init__(self, ttl: float = API_KEY_TTL) -> None:
+        """Initialize an empty cache where keys live for ``ttl`` seconds."""
+        self._ttl = ttl
+        self._entries: dict[tuple[str, str], tuple[str, float]] = {}
+
+    def get(self, key: tuple[str, str]) -> Optional[str]:
+        """Return the cached apiKey for ``key`` unless it has expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        api_key, expires = entry
+        if time.monotonic() >= expires:
+            self._entries.pop(key, None)
+            return None
+        return api_key
+
+    def set(self, key: tuple[str, str], api_key: str) -> None:
+        """Store ``api_key`` for ``key``."""
+        self._entries[key] = (api_key, time.monotonic() + self._ttl)
+
+    def invalidate(self, key: tuple[str, str]) -> None:
+        """Forget the apiKey for ``key``, forcing a new auth on next use."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget all cached apiKeys."""
+        self._entries.clear()
+
+
+API_KEY_CACHE = ApiKeyCache()
+
+
+def split_meteringpoint_ids(value: str) -> list[str]:
+    """Split a comma separated list of metering point ids."""
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+class RequestCoalescer:
+    """Share one in-flight request between concurrent identical callers.
+
+    Requests are identical when method, URL and the canonical JSON body
+    match. Callers that arrive while such a request is running await the
+    same task and receive the same response object, so they must not mutate
+    it. ``calls`` counts every request and ``coalesced`` those that were
+    served by a request already in flight; both are logged at debug level
+    whenever a request is coalesced.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no requests in flight."""
+        self._in_flight: dict[tuple[str, str, str], asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def request_key(method: str, url: str, data: Optional[dict]) -> tuple:
+        """Return the key identifying a request."""
+        body = json.dumps(data or {}, sort_keys=True, separators=(",", ":"))
+        return (method, url, body)
+
+    async def async_run(self, key: tuple, factory) -> dict:
+        """Await the in-flight request for ``key``, starting it if needed."""
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            _LOGGER.debug(
+                "Coalescing request %s %s, %s of %s requests coalesced so far",
+                key[0],
+                key[1],
+                self.coalesced,
+                self.calls,
+            )
+        return await asyncio.shield(task)
+
+    def reset(self) -> None:
+        """Reset the counters."""
+        self.calls = 0
+        self.coalesced = 0
+
+
+REQUEST_COALESCER = RequestCoalescer()
+
 
 class NorgesnettApiClient:
     def __init__(
-        self, customer_id: str, meteringpoint_id: str, session: aiohttp.ClientSession
+        self,
+        customer_id: str,
+        meteringpoint_id: str,
+        session: aiohttp.ClientSession,
+        meteringpoint_ids: Optional[list[str]] = None,
     ) -> None:
-        """Sample API Client."""
+        """Sample API Client.
+
+        ``meteringpoint_id`` is used to authenticate. :meth:`async_get_data`
+        fetches all of ``meteringpoint_ids``, by default only that point.
+        """
         self._customer_id = customer_id
         self._meteringpoint_id = meteringpoint_id
+        self._meteringpoint_ids = meteringpoint_ids or [meteringpoint_id]
         self._session = session
 
-    async def async_get_auth(self) -> dict:
-        """Get data from the API."""
+    @property
+    def cache_key(self) -> tuple[str, str]:
+        """Return the key used for this client in :data:`API_KEY_CACHE`."""
+        return (self._customer_id, self._meteringpoint_id)
+
+    async def async_get_auth(self, policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> dict:
+        """Authenticate against the API and cache the returned apiKey."""
         url = API_AUTH_URL
         auth_info = await self.api_wrapper(
             "post",
             url,
-            {
+            data={
                 "customerId": self._customer_id,
                 "meteringPointId": self._meteringpoint_id,
             },
+            headers=HEADERS,
+            policy=policy,
         )
         apiKey = auth_info["apiKey"]
         _LOGGER.debug("apiKey: %s", apiKey)
+        API_KEY_CACHE.set(self.cache_key, apiKey)
         return auth_info
 
+    async def async_get_api_key(
+        self, policy: RetryPolicy = DEFAULT_RETRY_POLICY
+    ) -> str:
+        """Return a cached apiKey, authenticating only when none is valid."""
+        apiKey = API_KEY_CACHE.get(self.cache_key)
+        if apiKey is None:
+            auth_info = await self.async_get_auth(policy)
+            apiKey = auth_info["apiKey"]
+        return apiKey
+
     async def async_get_data(self) -> dict:
-        """Get data from the API."""
-        url = API_AUTH_URL
-        auth_info = await self.api_wrapper(
-            "post",
-            url,
-            data={
-                "customerId": self._customer_id,
-                "meteringPointId": self._meteringpoint_id,
-            },
-            headers=HEADERS,
-        )
-        apiKey = auth_info["apiKey"]
+        """Get data from the API.
+
+        All metering points are fetched in requests of at most ``BATCH_SIZE``
+        ids and the collections are merged into one response. The requests
+        share one deadline.
+        """
+        expires = DEFAULT_RETRY_POLICY.expires()
+        tariffs = None
+        for start in range(0, len(self._meteringpoint_ids), BATCH_SIZE):
+            chunk = await self.async_fetch_tariffs(
+                self._meteringpoint_ids[start : start + BATCH_SIZE], expires=expires
+            )
+            if tariffs is None:
+                tariffs = {**chunk}
+            else:
+                tariffs["gridTariffCollections"] = (
+                    tariffs.get("gridTariffCollections") or []
+                ) + (chunk.get("gridTariffCollections") or [])
+        return tariffs
+
+    async def async_fetch_tariffs(
+        self,
+        meteringpoint_ids: list[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        expires: Optional[float] = None,
+    ) -> dict:
+        """Fetch tariffs for ``meteringpoint_ids`` in one request.
+
+        The tariffs from ``start`` to ``end`` are fetched, by default today's
+        and tomorrow's. A cached apiKey is reused between calls. If the API
+        rejects it with 401/403 the key is dropped and the request is retried
+        once with a fresh one. Authenticating and fetching share the deadline
+        ending at event loop time ``expires``, by default one from now.
+        """
+        if expires is None:
+            expires = DEFAULT_RETRY_POLICY.expires()
+        try:
+            return await self._async_get_tariffs(
+                await self.async_get_api_key(DEFAULT_RETRY_POLICY.until(expires)),
+                meteringpoint_ids,
+                start,
+                end,
+                DEFAULT_RETRY_POLICY.until(expires),
+            )
+        except aiohttp.ClientResponseError as exception:
+            if exception.status not in AUTH_ERROR_STATUSES:
+                raise
+            _LOGGER.debug("apiKey rejected (%s), re-authenticating", exception.status)
+            API_KEY_CACHE.invalidate(self.cache_key)
+            return await self._async_get_tariffs(
+                await self.async_get_api_key(DEFAULT_RETRY_POLICY.until(expires)),
+                meteringpoint_ids,
+                start,
+                end,
+                DEFAULT_RETRY_POLICY.until(expires),
+            )
+
+    async def _async_get_tariffs(
+        self,
+        apiKey: str,
+        meteringpoint_ids: list[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    ) -> dict:
+        """Fetch tariffs for ``meteringpoint_ids`` using ``apiKey``.
+
+        Without ``start`` and ``end`` the request covers today and tomorrow,
+        so the periods of the next day are at hand before midnight.
+        """
         headers = {
             "X-API-Key": apiKey,
             "Accept": "application/json",
             "Content-Type": "application/json",
         }
-        now = datetime.now()
-        iso_string = now.replace(microsecond=0).isoformat()
-        # Get the tariff data
+        # Today's and tomorrow's tariffs, tomorrow's once they are published
+        start = start or dt_util.start_of_local_day()
+        end = end or dt_util.start_of_local_day(start.date() + timedelta(days=2))
         request = {
-            "range": "today",
-            "startTime": iso_string,
-            "endTime": iso_string,
-            "meteringPointIds": [self._meteringpoint_id],
+            "startTime": start.isoformat(),
+            "endTime": end.isoformat(),
+            "meteringPointIds": meteringpoint_ids,
         }
         url = API_TARIFFS_URL
-        tariffs = await self.api_wrapper("post", url, data=request, headers=headers)
+        tariffs = await self.api_wrapper(
+            "post", url, data=request, headers=headers, policy=policy
+        )
         return tariffs
 
     async def async_set_title(self, value: str) -> None:
@@ -84,18 +356,39 @@ class NorgesnettApiClient:
         url: str,
         data: Optional[dict] = None,
         headers: Optional[dict] = None,
-        max_attempts: int = 3,
-        base_delay: float = 1.0,
+        policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    ) -> dict:
+        """Get information from the API, retrying as ``policy`` allows.
+
+        Concurrent identical requests share one call through
+        :data:`REQUEST_COALESCER`.
+        """
+        return await REQUEST_COALESCER.async_run(
+            REQUEST_COALESCER.request_key(method, url, data),
+            lambda: self._api_wrapper(method, url, data, headers, policy),
+        )
+
+    async def _api_wrapper(
+        self,
+        method: str,
+        url: str,
+        data: Optional[dict],
+        headers: Optional[dict],
+        policy: RetryPolicy,
     ) -> dict:
-        """Get information from the API with retry and exponential backoff."""
+        """Run one request, retrying within the deadline of ``policy``."""
         _LOGGER.info("api_wrapper: %s %s", method, url)
         data = {} if data is None else data
         headers = {} if headers is None else headers
 
-        delay = base_delay
-        for attempt in range(1, max_attempts + 1):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        delay = policy.base_delay
+        for attempt in range(1, policy.max_attempts + 1):
+            if loop.time() >= deadline:
+                raise asyncio.TimeoutError(f"No time left to request {url}")
             try:
-                async with async_timeout.timeout(TIMEOUT):
+                async with async_timeout.timeout(deadline - loop.time()):
                     if method == "get":
                         response = await self._session.get(url, headers=headers)
                         response.raise_for_status()
@@ -130,17 +423,19 @@ class NorgesnettApiClient:
                 _LOGGER.error(
                     "Attempt %s/%s error fetching information from %s - %s",
                     attempt,
-                    max_attempts,
+                    policy.max_attempts,
                     url,
                     exception,
                 )
-                if attempt == max_attempts:
+                if not policy.is_retryable(exception):
+                    raise
+                delay = policy.delay(delay, exception)
+                if attempt == policy.max_attempts or loop.time() + delay >= deadline:
                     _LOGGER.error(
                         "All attempts to fetch information from %s failed", url
                     )
                     raise
                 await asyncio.sleep(delay)
-                delay *= 2
             except (KeyError, TypeError) as exception:
                 _LOGGER.error(
                     "Error parsing information from %s - %s",
@@ -0,0 +1,187 @@
+"""Backfill of the Norgesnett tariff history from the API."""
+
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .api import NorgesnettApiClient
+from .const import (
+    BACKFILL_BURST,
+    BACKFILL_CONCURRENCY,
+    BACKFILL_DAYS,
+    BACKFILL_RATE,
+    BACKFILL_STORAGE_KEY,
+    BACKFILL_WINDOW_DAYS,
+    STORAGE_VERSION,
+)
+from .history import TariffHistory
+from .model import PriceIndex, TariffData
+from .statistics import async_import_prices
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class TokenBucket:
+    """Limit how often something may happen, shared by all its users.
+
+    Tokens refill at ``rate`` a second up to ``capacity``. Taking a token
+    reserves it right away, going into debt if there is none, and then
+    sleeps until the debt is paid, so callers are served in order without
+    a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Initialize with a full bucket."""
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated: Optional[float] = None
+
+    async def async_acquire(self) -> None:
+        """Take a token, waiting until it is available."""
+        now = time.monotonic()
+        if self._updated is not None:
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def clear(self) -> None:
+        """Fill the bucket again."""
+        self._tokens = self.capacity
+        self._updated = None
+
+
+# All backfills share one budget of requests to the API
+API_RATE_LIMITER = TokenBucket(BACKFILL_RATE, BACKFILL_BURST)
+
+
+def request_windows(days: list[date], size: int) -> list[tuple[date, date]]:
+    """Group sorted days into runs of consecutive days of at most ``size``.
+
+    Returns the first day of every run and the day after its last.
+    """
+    windows: list[tuple[date, date]] = []
+    for day in days:
+        if windows:
+            first, last = windows[-1]
+            if day == last and (last - first).days < size:
+                windows[-1] = (first, day + timedelta(days=1))
+                continue
+        windows.append((day, day + timedelta(days=1)))
+    return windows
+
+
+class HistoryBackfill:
+    """Fetch the days missing from the tariff history.
+
+    The days a metering point has no periods for are grouped into request
+    windows, which a few workers fetch at a time under the shared
+    :data:`API_RATE_LIMITER`. Each response is parsed and written to the
+    history, and to the price statistics, as it arrives. It is the only
+    path by which past tariffs are fetched. The days fetched are
+    checkpointed, so a run that is stopped resumes where it was, and days
+    the API has no tariffs for are not asked for again. A window that
+    fails is tried on the next run.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        history: TariffHistory,
+        concurrency: int = BACKFILL_CONCURRENCY,
+        limiter: TokenBucket = API_RATE_LIMITER,
+    ) -> None:
+        """Initialize without loading the checkpoint."""
+        self._hass = hass
+        self._history = history
+        self._concurrency = concurrency
+        self._limiter = limiter
+        self._store = Store(hass, STORAGE_VERSION, BACKFILL_STORAGE_KEY)
+        self._checkpoint: Optional[dict[str, list[str]]] = None
+
+    async def async_run(
+        self,
+        client: NorgesnettApiClient,
+        meteringpoint_ids: list[str],
+        days: int = BACKFILL_DAYS,
+    ) -> None:
+        """Fetch the missing days of the ``days`` before today."""
+        if self._checkpoint is None:
+            self._checkpoint = await self._store.async_load() or {}
+        today = dt_util.now().date()
+        first = today - timedelta(days=days)
+        queue: asyncio.Queue = asyncio.Queue()
+        for meteringpoint_id in meteringpoint_ids:
+            done = {
+                day
+                for day in self._checkpoint.get(meteringpoint_id, [])
+                if day >= first.isoformat()
+            }
+            self._checkpoint[meteringpoint_id] = sorted(done)
+            done |= await self._history.async_days(
+                meteringpoint_id,
+                dt_util.start_of_local_day(first),
+                dt_util.start_of_local_day(today),
+            )
+            missing = [
+                first + timedelta(days=offset)
+                for offset in range(days)
+                if (first + timedelta(days=offset)).isoformat() not in done
+            ]
+            for window in request_windows(missing, BACKFILL_WINDOW_DAYS):
+                queue.put_nowait((meteringpoint_id, *window))
+        if queue.empty():
+            return
+        _LOGGER.debug("Norgesnett: henter %s vinduer med historikk", queue.qsize())
+        await asyncio.gather(
+            *(
+                self._async_worker(client, queue)
+                for _ in range(min(self._concurrency, queue.qsize()))
+            )
+        )
+
+    async def _async_worker(
+        self, client: NorgesnettApiClient, queue: asyncio.Queue
+    ) -> None:
+        """Fetch and store windows until the queue is empty."""
+        while not queue.empty():
+            meteringpoint_id, first, last = queue.get_nowait()
+            start = dt_util.start_of_local_day(first)
+            end = dt_util.start_of_local_day(last)
+            await self._limiter.async_acquire()
+            try:
+                result = await client.async_fetch_tariffs(
+                    [meteringpoint_id], start, end
+                )
+                prices = TariffData.parse(result).point(meteringpoint_id).prices
+                periods = prices.periods(start, end)
+                await self._history.async_append(meteringpoint_id, periods)
+                await async_import_prices(
+                    self._hass, meteringpoint_id, PriceIndex(periods)
+                )
+            except Exception as exception:  # pylint: disable=broad-except
+                _LOGGER.warning(
+                    "Norgesnett: could not backfill %s from %s to %s: %s",
+                    meteringpoint_id,
+                    first,
+                    last,
+                    exception,
+                )
+                continue
+            self._checkpoint[meteringpoint_id].extend(
+                (first + timedelta(days=offset)).isoformat()
+                for offset in range((last - first).days)
+            )
+            await self._store.async_save(
+                {key: sorted(days) for key, days in self._checkpoint.items()}
+            )
@@ -0,0 +1,201 @@
+"""Monthly capacity tier (effekttrinn) tracking for Norgesnett."""
+
+from datetime import date, datetime, timedelta
+from heapq import heappush, heapreplace, nlargest
+from typing import Optional
+
+from homeassistant.util import dt as dt_util
+
+from .model import TariffCollection
+
+# Number of daily peaks the monthly capacity charge is averaged over
+PEAK_DAYS = 3
+
+HOUR = timedelta(hours=1)
+
+
+class CapacityTracker:
+    """Track the highest daily peaks of the month from live samples.
+
+    A daily peak is the day's highest hourly consumption in kWh, and the
+    fixed monthly charge follows the mean of the :data:`PEAK_DAYS` highest
+    of them. Samples are folded in as they arrive: a power sample is held
+    until the next one and integrated into the hour it covers, an energy
+    meter reading spreads its increase evenly since the previous reading,
+    so the hours between two readings are only closed by the later one.
+    Finished days go into a min-heap of at most :data:`PEAK_DAYS` entries,
+    so nothing else of the month has to be kept or queried.
+
+    Hours are kept in UTC, which has the same hour boundaries as Norwegian
+    local time; days and months are local.
+    """
+
+    __slots__ = (
+        "hour",
+        "hour_energy",
+        "day_peak",
+        "peaks",
+        "_last_time",
+        "_last_power",
+        "_last_meter",
+        "_meter_time",
+    )
+
+    def __init__(self) -> None:
+        """Initialize without any samples."""
+        self.hour: Optional[datetime] = None
+        self.hour_energy = 0.0
+        self.day_peak = 0.0
+        self.peaks: list[tuple[float, str]] = []
+        self._last_time: Optional[datetime] = None
+        self._last_power: Optional[float] = None
+        self._last_meter: Optional[float] = None
+        self._meter_time: Optional[datetime] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CapacityTracker":
+        """Restore a tracker saved with :meth:`as_dict`."""
+        tracker = cls()
+        hour = data.get("hour")
+        tracker.hour = dt_util.parse_datetime(hour) if hour else None
+        tracker.hour_energy = data.get("hour_energy", 0.0)
+        tracker.day_peak = data.get("day_peak", 0.0)
+        tracker.peaks = [(kwh, day) for kwh, day in data.get("peaks", [])]
+        return tracker
+
+    def as_dict(self) -> dict:
+        """Return the month so far, without the last sample, for storage."""
+        return {
+            "hour": self.hour.isoformat() if self.hour else None,
+            "hour_energy": self.hour_energy,
+            "day_peak": self.day_peak,
+            "peaks": [list(peak) for peak in self.peaks],
+        }
+
+    def add_power(self, when: datetime, kw: Optional[float]) -> None:
+        """Add a power sample in kW, None when the source is unavailable."""
+        self.flush(when)
+        self._last_power = kw
+
+    def add_energy(self, when: datetime, kwh: float) -> None:
+        """Add an energy meter reading in kWh.
+
+        A reading below the previous one is taken as a meter reset and only
+        starts a new interval.
+        """
+        when = dt_util.as_utc(when)
+        start = self._meter_time
+        if (
+            self._last_meter is not None
+            and kwh >= self._last_meter
+            and start is not None
+            and when > start
+        ):
+            hours = (when - start).total_seconds() / 3600
+            self._integrate(start, when, (kwh - self._last_meter) / hours)
+        self._advance(when)
+        if start is None or when > start:
+            self._meter_time = when
+        self._last_meter = kwh
+
+    def flush(self, when: datetime) -> None:
+        """Integrate the held power sample up to ``when``.
+
+        The hours since the last energy meter reading are left open, the
+        next reading spreads its increase over them.
+        """
+        when = dt_util.as_utc(when)
+        if self._last_time is not None and self._last_power is not None:
+            self._integrate(self._last_time, when, self._last_power)
+        if self._meter_time is None:
+            self._advance(when)
+        if self._last_time is None or when > self._last_time:
+            self._last_time = when
+
+    def _integrate(self, start: datetime, end: datetime, kw: float) -> None:
+        """Add ``kw`` from ``start`` to ``end`` to the hours it falls in."""
+        while start < end:
+            self._advance(start)
+            until = min(end, self.hour + HOUR)
+            self.hour_energy += kw * (until - start).total_seconds() / 3600
+            start = until
+
+    def _advance(self, when: datetime) -> None:
+        """Close the current hour, day and month if ``when`` is past them."""
+        hour = when.replace(minute=0, second=0, microsecond=0)
+        if self.hour is None:
+            self.hour = hour
+            return
+        if hour <= self.hour:
+            return
+        self.day_peak = max(self.day_peak, self.hour_energy)
+        self.hour_energy = 0.0
+        day, new_day = self._day(self.hour), self._day(hour)
+        if new_day != day:
+            self._push(self.day_peak, day)
+            self.day_peak = 0.0
+            if (new_day.year, new_day.month) != (day.year, day.month):
+                self.peaks = []
+        self.hour = hour
+
+    def _push(self, kwh: float, day: date) -> None:
+        """Keep ``kwh`` if it is one of the month's highest daily peaks."""
+        peak = (kwh, day.isoformat())
+        if len(self.peaks) < PEAK_DAYS:
+            heappush(self.peaks, peak)
+        elif peak > self.peaks[0]:
+            heapreplace(self.peaks, peak)
+
+    @staticmethod
+    def _day(hour: datetime) -> date:
+        """Return the local day ``hour`` is in."""
+        return dt_util.as_local(hour).date()
+
+    @property
+    def today_peak(self) -> float:
+        """Return the highest hourly consumption of the current day so far."""
+        return max(self.day_peak, self.hour_energy)
+
+    def top_peaks(self) -> list[tuple[float, str]]:
+        """Return the highest daily peaks of the month, today's included."""
+        if self.hour is None:
+            return []
+        today = (self.today_peak, self._day(self.hour).isoformat())
+        return nlargest(PEAK_DAYS, [*self.peaks, today])
+
+    @property
+    def average(self) -> float:
+        """Return the mean of the highest daily peaks, what the tier follows."""
+        peaks = self.top_peaks()
+        if not peaks:
+            return 0.0
+        return sum(kwh for kwh, _ in peaks) / len(peaks)
+
+    def forecast(self, collection: Optional[TariffCollection]) -> dict:
+        """Return the tier the month lands in if it ended now.
+
+        ``headroom`` is how far the average is below the next level's
+        ``value_min``, and ``today_limit`` the highest hourly consumption
+        the current day can reach without crossing it.
+        """
+        average = self.average
+        level = collection.level_for_value(average) if collection else None
+        following = collection.adjacent_levels(level.id)[2] if level else None
+        threshold = following.value_min if following else None
+        forecast = {
+            "level": level.id if level else None,
+            "next_threshold": threshold,
+            "headroom": None,
+            "today_limit": None,
+            "peaks": [
+                {"day": day, "kwh": round(kwh, 3)}
+                for kwh, day in sorted(self.top_peaks(), key=lambda peak: peak[1])
+            ],
+        }
+        if threshold is not None:
+            others = nlargest(PEAK_DAYS - 1, (kwh for kwh, _ in self.peaks))
+            forecast["headroom"] = round(threshold - average, 3)
+            forecast["today_limit"] = round(
+                threshold * (len(others) + 1) - sum(others), 3
+            )
+        return forecast
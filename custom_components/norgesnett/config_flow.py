@@ -5,10 +5,28 @@ import logging
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
+from homeassistant.helpers import selector
 from homeassistant.helpers.aiohttp_client import async_create_clientsession
 
-from .api import NorgesnettApiClient
-from .const import CONF_CUSTOMER_ID, CONF_METERINGPOINT_ID, DOMAIN, PLATFORMS
+from .api import NorgesnettApiClient, split_meteringpoint_ids
+from .const import (
+    CONF_CUSTOMER_ID,
+    CONF_MAX_STALENESS,
+    CONF_METERINGPOINT_ID,
+    CONF_POWER_SENSOR,
+    CONF_PUBLISH_HOUR,
+    CONF_SPOT_PRICE_SENSOR,
+    CONF_SUBSIDY_RATE,
+    CONF_SUBSIDY_THRESHOLD,
+    CONF_SUPPLIER_MARKUP,
+    DEFAULT_MAX_STALENESS,
+    DEFAULT_PUBLISH_HOUR,
+    DEFAULT_SUBSIDY_RATE,
+    DEFAULT_SUBSIDY_THRESHOLD,
+    DEFAULT_SUPPLIER_MARKUP,
+    DOMAIN,
+    PLATFORMS,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -80,11 +98,17 @@ class NorgesnettFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         )
 
     async def _test_credentials(self, customer_id, meteringpoint_id):
-        """Return true if credentials is valid."""
+        """Return true if credentials is valid.
+
+        ``meteringpoint_id`` may list several ids separated by commas (hub
+        mode), the first one is used to authenticate.
+        """
         _LOGGER.debug("Tester credentials")
         try:
             session = async_create_clientsession(self.hass)
-            client = NorgesnettApiClient(customer_id, meteringpoint_id, session)
+            client = NorgesnettApiClient(
+                customer_id, split_meteringpoint_ids(meteringpoint_id)[0], session
+            )
             retval = await client.async_get_auth()
             _LOGGER.debug("Auth OK: %s", retval)
             return True
@@ -116,18 +140,63 @@ class NorgesnettOptionsFlowHandler(config_entries.OptionsFlow):
         """Handle a flow initialized by the user."""
         self._errors = {}
         if user_input is not None:
+            # A cleared sensor is left out of the input
+            for key in (CONF_POWER_SENSOR, CONF_SPOT_PRICE_SENSOR):
+                self.options.pop(key, None)
             self.options.update(user_input)
             return await self._update_options()
 
-        return self.async_show_form(
-            step_id="user",
-            data_schema=vol.Schema(
-                {
-                    vol.Required(x, default=self.options.get(x, True)): bool
-                    for x in sorted(PLATFORMS)
-                }
-            ),
-        )
+        schema = {
+            vol.Required(x, default=self.options.get(x, True)): bool
+            for x in sorted(PLATFORMS)
+        }
+        schema[
+            vol.Required(
+                CONF_MAX_STALENESS,
+                default=self.options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS),
+            )
+        ] = vol.All(vol.Coerce(int), vol.Range(min=0))
+        schema[
+            vol.Required(
+                CONF_PUBLISH_HOUR,
+                default=self.options.get(CONF_PUBLISH_HOUR, DEFAULT_PUBLISH_HOUR),
+            )
+        ] = vol.All(vol.Coerce(int), vol.Range(min=0, max=23))
+        schema[
+            vol.Optional(
+                CONF_POWER_SENSOR,
+                description={"suggested_value": self.options.get(CONF_POWER_SENSOR)},
+            )
+        ] = selector.EntitySelector(selector.EntitySelectorConfig(domain="sensor"))
+        schema[
+            vol.Optional(
+                CONF_SPOT_PRICE_SENSOR,
+                description={
+                    "suggested_value": self.options.get(CONF_SPOT_PRICE_SENSOR)
+                },
+            )
+        ] = selector.EntitySelector(selector.EntitySelectorConfig(domain="sensor"))
+        schema[
+            vol.Required(
+                CONF_SUBSIDY_THRESHOLD,
+                default=self.options.get(
+                    CONF_SUBSIDY_THRESHOLD, DEFAULT_SUBSIDY_THRESHOLD
+                ),
+            )
+        ] = vol.All(vol.Coerce(float), vol.Range(min=0))
+        schema[
+            vol.Required(
+                CONF_SUBSIDY_RATE,
+                default=self.options.get(CONF_SUBSIDY_RATE, DEFAULT_SUBSIDY_RATE),
+            )
+        ] = vol.All(vol.Coerce(float), vol.Range(min=0, max=1))
+        schema[
+            vol.Required(
+                CONF_SUPPLIER_MARKUP,
+                default=self.options.get(CONF_SUPPLIER_MARKUP, DEFAULT_SUPPLIER_MARKUP),
+            )
+        ] = vol.Coerce(float)
+        return self.async_show_form(step_id="user", data_schema=vol.Schema(schema))
 
     async def _update_options(self):
         """Update config entry options."""
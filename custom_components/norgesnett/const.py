@@ -27,9 +27,51 @@ PLATFORMS = [SENSOR]
 CONF_ENABLED = "enabled"
 CONF_CUSTOMER_ID = "customer_id"
 CONF_METERINGPOINT_ID = "meteringpoint_id"
+CONF_MAX_STALENESS = "max_staleness"
+CONF_PUBLISH_HOUR = "publish_hour"
+CONF_POWER_SENSOR = "power_sensor"
+CONF_SPOT_PRICE_SENSOR = "spot_price_sensor"
+CONF_SUBSIDY_THRESHOLD = "subsidy_threshold"
+CONF_SUBSIDY_RATE = "subsidy_rate"
+CONF_SUPPLIER_MARKUP = "supplier_markup"
 
 # Defaults
 DEFAULT_NAME = DOMAIN
+# Hours the last good tariffs are served while the API is failing
+DEFAULT_MAX_STALENESS = 24
+# Local hour when tomorrow's tariffs are expected to be published
+DEFAULT_PUBLISH_HOUR = 13
+
+# Strømstøtte: share of the spot price above the threshold (NOK/kWh incl.
+# VAT) that is covered, and the supplier's markup in NOK/kWh
+DEFAULT_SUBSIDY_THRESHOLD = 0.9375
+DEFAULT_SUBSIDY_RATE = 0.9
+DEFAULT_SUPPLIER_MARKUP = 0.0
+
+# Hours of total prices published from the start of today
+TOTAL_PRICE_HOURS = 48
+
+# Durations in hours of the cheapest window sensors
+CHEAPEST_WINDOW_HOURS = (1, 2, 3)
+
+# Storage
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.tariffs"
+CAPACITY_STORAGE_KEY = f"{DOMAIN}.capacity"
+# SQLite database in the config dir with the tariff history
+HISTORY_FILE = f"{DOMAIN}_history.db"
+BACKFILL_STORAGE_KEY = f"{DOMAIN}.backfill"
+
+# History backfill: days back, days per request, requests at a time, and
+# requests per second on average in bursts of at most BACKFILL_BURST
+BACKFILL_DAYS = 31
+BACKFILL_WINDOW_DAYS = 7
+BACKFILL_CONCURRENCY = 3
+BACKFILL_RATE = 1.0
+BACKFILL_BURST = 3
+
+# Key of the per-customer coordinator registry in hass.data[DOMAIN]
+REGISTRY = "registry"
 
 API_AUTH_URL = "https://gridtariff-api.norgesnett.no/api/v1.01/Auth/Generate"
 API_TARIFFS_URL = "https://gridtariff-api.norgesnett.no/api/v1.01/TariffQuery/MeteringPointsGridTariffs"
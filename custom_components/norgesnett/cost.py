@@ -0,0 +1,144 @@
+"""Grid rent of metered consumption for Norgesnett."""
+
+from datetime import date, datetime, timedelta
+from heapq import nlargest
+from typing import Optional
+
+from homeassistant.util import dt as dt_util
+
+from .capacity import PEAK_DAYS
+from .model import TariffCollection
+
+Period = tuple[float, float, Optional[float]]
+
+
+def _month_start(day: date) -> float:
+    """Return the timestamp of the local start of ``day``'s month."""
+    return dt_util.start_of_local_day(day.replace(day=1)).timestamp()
+
+
+class MonthCost:
+    """The consumption and energy cost of one month, summed period by period.
+
+    ``peaks`` holds the highest hourly consumption of every day with
+    consumption, from which the month's capacity level follows.
+    """
+
+    __slots__ = ("month", "start", "end", "energy", "energy_cost", "unpriced", "peaks")
+
+    def __init__(self, day: date) -> None:
+        """Initialize an empty month for the month of ``day``."""
+        self.month = day.strftime("%Y-%m")
+        self.start = _month_start(day)
+        following = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        self.end = _month_start(following)
+        self.energy = 0.0
+        self.energy_cost = 0.0
+        self.unpriced = 0.0
+        self.peaks: list[float] = []
+
+    @property
+    def peak_average(self) -> float:
+        """Return the mean of the month's highest daily peaks."""
+        peaks = nlargest(PEAK_DAYS, self.peaks)
+        return sum(peaks) / len(peaks) if peaks else 0.0
+
+    def as_dict(
+        self, collection: Optional[TariffCollection], start: float, end: float
+    ) -> dict:
+        """Return the month's costs between ``start`` and ``end``.
+
+        The fixed cost is the monthly total of the level the peaks fall in,
+        in proportion to how much of the month is between ``start`` and
+        ``end``. It is None without price levels.
+        """
+        average = self.peak_average
+        level = collection.level_for_value(average) if collection else None
+        fixed_cost = None
+        if level is not None and level.monthly_total is not None:
+            covered = min(end, self.end) - max(start, self.start)
+            fixed_cost = level.monthly_total * covered / (self.end - self.start)
+        return {
+            "month": self.month,
+            "energy_kwh": round(self.energy, 3),
+            "unpriced_kwh": round(self.unpriced, 3),
+            "energy_cost": round(self.energy_cost, 2),
+            "peak_average": round(average, 3),
+            "level": level.id if level else None,
+            "fixed_cost": round(fixed_cost, 2) if fixed_cost is not None else None,
+        }
+
+
+def grid_cost(
+    consumption: list[Period],
+    prices: list[Period],
+    collection: Optional[TariffCollection],
+    start: datetime,
+    end: datetime,
+) -> dict:
+    """Return the energy and fixed cost of ``consumption`` per month.
+
+    ``consumption`` holds ``(start, end, kWh)`` periods and ``prices`` the
+    ``(start, end, price)`` tariff periods, both sorted by start and of any
+    length. Both are walked once side by side: a consumption period is
+    priced by the tariff periods it overlaps, in proportion to the overlap,
+    and its energy counts towards its hour, day and month as it goes.
+    Energy without a price is summed as ``unpriced_kwh``.
+    """
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    months: list[MonthCost] = []
+    month: Optional[MonthCost] = None
+    day_end = hour = None
+    hour_energy = day_peak = 0.0
+    count = len(prices)
+    first = 0
+    for period_start, period_end, energy in consumption:
+        if energy is None or period_end <= start_ts or period_start >= end_ts:
+            continue
+
+        if period_start - period_start % 3600 != hour:
+            day_peak = max(day_peak, hour_energy)
+            hour_energy = 0.0
+            hour = period_start - period_start % 3600
+        if day_end is None or period_start >= day_end:
+            if month is not None:
+                month.peaks.append(day_peak)
+            day_peak = 0.0
+            day = dt_util.as_local(dt_util.utc_from_timestamp(period_start)).date()
+            day_end = dt_util.start_of_local_day(day + timedelta(days=1)).timestamp()
+            if month is None or period_start >= month.end:
+                month = MonthCost(day)
+                months.append(month)
+        hour_energy += energy
+        month.energy += energy
+
+        while first < count and prices[first][1] <= period_start:
+            first += 1
+        index, priced, length = first, 0.0, period_end - period_start
+        while index < count and prices[index][0] < period_end:
+            price_start, price_end, price = prices[index]
+            overlap = min(period_end, price_end) - max(period_start, price_start)
+            if overlap > 0 and price is not None:
+                share = energy * overlap / length
+                month.energy_cost += share * price
+                priced += share
+            index += 1
+        month.unpriced += energy - priced
+
+    if month is not None:
+        month.peaks.append(max(day_peak, hour_energy))
+
+    breakdown = [month.as_dict(collection, start_ts, end_ts) for month in months]
+    energy_cost = sum(month["energy_cost"] for month in breakdown)
+    fixed_costs = [month["fixed_cost"] for month in breakdown]
+    fixed_cost = None if None in fixed_costs else sum(fixed_costs)
+    return {
+        "energy_kwh": round(sum(month["energy_kwh"] for month in breakdown), 3),
+        "unpriced_kwh": round(sum(month["unpriced_kwh"] for month in breakdown), 3),
+        "energy_cost": round(energy_cost, 2),
+        "fixed_cost": round(fixed_cost, 2) if fixed_cost is not None else None,
+        "total_cost": (
+            round(energy_cost + fixed_cost, 2) if fixed_cost is not None else None
+        ),
+        "months": breakdown,
+    }
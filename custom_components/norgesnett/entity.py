@@ -1,14 +1,51 @@
 """NorgesnettEntity class"""
 
+from homeassistant.core import callback
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import ATTRIBUTION, DOMAIN, NAME, VERSION
+from .api import split_meteringpoint_ids
+from .const import (
+    ATTRIBUTION,
+    CONF_METERINGPOINT_ID,
+    DEFAULT_NAME,
+    DOMAIN,
+    NAME,
+    VERSION,
+)
 
 
 class NorgesnettEntity(CoordinatorEntity):
-    def __init__(self, coordinator, config_entry):
+    def __init__(self, coordinator, config_entry, meteringpoint_id=None):
         super().__init__(coordinator)
         self.config_entry = config_entry
+        # Set in hub mode, None for the entry's own metering point
+        self.meteringpoint_id = meteringpoint_id
+        # Attributes cached until the next coordinator update
+        self._attributes = None
+        # The coordinator may be shared with other entries of the customer
+        self._point_id = meteringpoint_id or next(
+            iter(split_meteringpoint_ids(config_entry.data.get(CONF_METERINGPOINT_ID))),
+            None,
+        )
+
+    @property
+    def name_prefix(self):
+        """Return the start of entity names, with the metering point in hub mode."""
+        if self.meteringpoint_id is None:
+            return DEFAULT_NAME
+        return f"{DEFAULT_NAME}_{self.meteringpoint_id}"
+
+    @property
+    def unique_id_prefix(self):
+        """Return the start of unique ids, with the metering point in hub mode."""
+        if self.meteringpoint_id is None:
+            return self.config_entry.entry_id
+        return f"{self.config_entry.entry_id}_{self.meteringpoint_id}"
+
+    @property
+    def tariff_point(self):
+        """Return the parsed tariff of this entity's metering point."""
+        return self.coordinator.tariff.point(self._point_id)
 
     @property
     def unique_id(self):
@@ -18,6 +55,13 @@ class NorgesnettEntity(CoordinatorEntity):
 
     @property
     def device_info(self):
+        if self.meteringpoint_id is not None:
+            return {
+                "identifiers": {(DOMAIN, self.meteringpoint_id)},
+                "name": f"{NAME} {self.meteringpoint_id}",
+                "model": VERSION,
+                "manufacturer": NAME,
+            }
         return {
             "identifiers": {(DOMAIN, self.config_entry.entry_id)},
             "name": NAME,
@@ -25,11 +69,26 @@ class NorgesnettEntity(CoordinatorEntity):
             "manufacturer": NAME,
         }
 
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Drop the cached attributes and write the updated state."""
+        self._attributes = None
+        super()._handle_coordinator_update()
+
     @property
     def extra_state_attributes(self):
-        """Return the extra state attributes."""
+        """Return the extra state attributes, built once per update."""
+        if self._attributes is None:
+            self._attributes = self._build_extra_state_attributes()
+        return self._attributes
+
+    def _build_extra_state_attributes(self):
+        """Build the extra state attributes."""
+        last_fetched = getattr(self.coordinator, "last_fetched", None)
         return {
             "attribution": ATTRIBUTION,
             "id": str(self.coordinator.data.get("id")),
             "integration": DOMAIN,
+            "last_fetched": last_fetched.isoformat() if last_fetched else None,
+            "stale": getattr(self.coordinator, "stale", False),
         }
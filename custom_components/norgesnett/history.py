@@ -0,0 +1,229 @@
+"""Local history of the Norgesnett tariffs."""
+
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Optional
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .model import TariffData
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+Period = tuple[float, float, Optional[float]]
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS periods (
+        metering_point TEXT NOT NULL,
+        start_time REAL NOT NULL,
+        end_time REAL NOT NULL,
+        price REAL,
+        PRIMARY KEY (metering_point, start_time)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS levels (
+        metering_point TEXT NOT NULL,
+        day TEXT NOT NULL,
+        level TEXT,
+        PRIMARY KEY (metering_point, day)
+    ) WITHOUT ROWID""",
+)
+
+
+class TariffHistory:
+    """Append-only SQLite store of the tariffs of every metering point.
+
+    ``periods`` holds each tariff period once, keyed and indexed on
+    ``(metering_point, start_time)``; a period that is already stored is
+    never replaced. ``levels`` holds the capacity level a metering point was
+    on, per day it was seen. The database is opened on first use and used
+    from the executor one job at a time. Queries walk a cursor, so they do
+    not load more of the history than they return.
+    """
+
+    def __init__(self, hass: HomeAssistant, path: str) -> None:
+        """Initialize for the database at ``path``, without opening it."""
+        self._hass = hass
+        self._path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the connection, opening the database if needed."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._path, check_same_thread=False)
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+        return self._connection
+
+    def _execute(self, job, *args):
+        """Run ``job`` with the connection while holding the lock."""
+        with self._lock:
+            return job(self._connect(), *args)
+
+    async def async_append(
+        self,
+        meteringpoint_id: str,
+        periods: Iterable[Period],
+        level: Optional[str] = None,
+        day: Optional[str] = None,
+    ) -> int:
+        """Store new periods, and the level seen on ``day``.
+
+        Returns the number of periods that were not stored before.
+        """
+
+        def append(connection: sqlite3.Connection) -> int:
+            with connection:
+                added = connection.executemany(
+                    "INSERT OR IGNORE INTO periods VALUES (?, ?, ?, ?)",
+                    ((meteringpoint_id, *period) for period in periods),
+                ).rowcount
+                if day is not None:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO levels VALUES (?, ?, ?)",
+                        (meteringpoint_id, day, level),
+                    )
+            return added
+
+        return await self._hass.async_add_executor_job(self._execute, append)
+
+    async def async_append_tariff(self, tariff: TariffData) -> None:
+        """Store the periods and today's level of every metering point."""
+        day = dt_util.now().date().isoformat()
+        try:
+            for meteringpoint_id, point in tariff.points.items():
+                if meteringpoint_id is None:
+                    continue
+                await self.async_append(
+                    meteringpoint_id,
+                    point.prices.periods(),
+                    point.metering_point.level_id,
+                    day,
+                )
+        except sqlite3.Error as exception:
+            _LOGGER.warning("Norgesnett: could not store tariff history: %s", exception)
+
+    async def async_periods(
+        self, meteringpoint_id: str, start: datetime, end: datetime
+    ) -> list[Period]:
+        """Return the stored periods starting between ``start`` and ``end``."""
+
+        def periods(connection: sqlite3.Connection) -> list[Period]:
+            return connection.execute(
+                "SELECT start_time, end_time, price FROM periods "
+                "WHERE metering_point = ? AND start_time >= ? AND start_time < ? "
+                "ORDER BY start_time",
+                (meteringpoint_id, start.timestamp(), end.timestamp()),
+            ).fetchall()
+
+        return await self._hass.async_add_executor_job(self._execute, periods)
+
+    async def async_days(
+        self, meteringpoint_id: str, start: datetime, end: datetime
+    ) -> set[str]:
+        """Return the local days with periods starting between two times."""
+
+        def days(connection: sqlite3.Connection) -> set[str]:
+            found: set[str] = set()
+            day_end = None
+            cursor = connection.execute(
+                "SELECT start_time FROM periods "
+                "WHERE metering_point = ? AND start_time >= ? AND start_time < ? "
+                "ORDER BY start_time",
+                (meteringpoint_id, start.timestamp(), end.timestamp()),
+            )
+            for (period_start,) in cursor:
+                if day_end is None or period_start >= day_end:
+                    day = dt_util.as_local(
+                        dt_util.utc_from_timestamp(period_start)
+                    ).date()
+                    day_end = dt_util.start_of_local_day(
+                        day + timedelta(days=1)
+                    ).timestamp()
+                    found.add(day.isoformat())
+            return found
+
+        return await self._hass.async_add_executor_job(self._execute, days)
+
+    async def async_daily(
+        self, meteringpoint_id: str, start: datetime, end: datetime
+    ) -> list[dict]:
+        """Return the min, time-weighted mean and max price of every local day.
+
+        Days are taken from the periods starting between ``start`` and
+        ``end``, and periods without a price are left out.
+        """
+
+        def daily(connection: sqlite3.Connection) -> list[dict]:
+            # Per day: [day, min, max, price × seconds, seconds]
+            days: list[list] = []
+            day_end = None
+            cursor = connection.execute(
+                "SELECT start_time, end_time, price FROM periods "
+                "WHERE metering_point = ? AND start_time >= ? AND start_time < ? "
+                "AND price IS NOT NULL ORDER BY start_time",
+                (meteringpoint_id, start.timestamp(), end.timestamp()),
+            )
+            for period_start, period_end, price in cursor:
+                if day_end is None or period_start >= day_end:
+                    day = dt_util.as_local(
+                        dt_util.utc_from_timestamp(period_start)
+                    ).date()
+                    day_end = dt_util.start_of_local_day(
+                        day + timedelta(days=1)
+                    ).timestamp()
+                    days.append([day.isoformat(), price, price, 0.0, 0.0])
+                current = days[-1]
+                current[1] = min(current[1], price)
+                current[2] = max(current[2], price)
+                current[3] += price * (period_end - period_start)
+                current[4] += period_end - period_start
+            return [
+                {"day": day, "min": low, "mean": weighted / seconds, "max": high}
+                for day, low, high, weighted, seconds in days
+            ]
+
+        return await self._hass.async_add_executor_job(self._execute, daily)
+
+    async def async_level_changes(
+        self, meteringpoint_id: str, start: datetime, end: datetime
+    ) -> list[dict]:
+        """Return the days between ``start`` and ``end`` the level changed.
+
+        The first day the metering point was seen counts as a change.
+        """
+
+        def changes(connection: sqlite3.Connection) -> list[dict]:
+            cursor = connection.execute(
+                "SELECT day, level, previous FROM ("
+                "SELECT day, level, LAG(level) OVER (ORDER BY day) AS previous, "
+                "ROW_NUMBER() OVER (ORDER BY day) AS position "
+                "FROM levels WHERE metering_point = ? AND day <= ?"
+                ") WHERE day >= ? AND (position = 1 OR level IS NOT previous) "
+                "ORDER BY day",
+                (
+                    meteringpoint_id,
+                    dt_util.as_local(end - timedelta(seconds=1)).date().isoformat(),
+                    dt_util.as_local(start).date().isoformat(),
+                ),
+            )
+            return [
+                {"day": day, "level": level, "previous": previous}
+                for day, level, previous in cursor
+            ]
+
+        return await self._hass.async_add_executor_job(self._execute, changes)
+
+    async def async_close(self) -> None:
+        """Close the database, it is opened again when used."""
+
+        def close(connection: sqlite3.Connection) -> None:
+            connection.close()
+            self._connection = None
+
+        if self._connection is not None:
+            await self._hass.async_add_executor_job(self._execute, close)
@@ -0,0 +1,493 @@
+"""Parsed tariff data for Norgesnett."""
+
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Optional
+
+from homeassistant.util import dt as dt_util
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+def _clock_offset(value: str) -> timedelta:
+    """Return the time since midnight of "HH" or "HH:MM"."""
+    hours, _, minutes = value.strip().partition(":")
+    return timedelta(hours=int(hours), minutes=int(minutes or 0))
+
+
+def period_bounds(period: dict, day: datetime) -> tuple[float, Optional[float]]:
+    """Return the start and end timestamps of a tariff period.
+
+    ``startTime``/``expiredAt`` are used when present. Otherwise the period is
+    placed on ``day`` by its ``shortName`` ("13-14" or "13:15-13:30"). The
+    end is None when the API gives a start only.
+    """
+    if period.get("startTime"):
+        start = dt_util.parse_datetime(period["startTime"]).timestamp()
+        if not period.get("expiredAt"):
+            return start, None
+        return start, dt_util.parse_datetime(period["expiredAt"]).timestamp()
+    first, last = period["shortName"].split("-")
+    start = day + _clock_offset(first)
+    end = day + _clock_offset(last)
+    if end <= start:
+        end += timedelta(days=1)
+    return start.timestamp(), end.timestamp()
+
+
+class PriceIndex:
+    """Energy prices indexed by period start.
+
+    Lookups bisect the sorted start timestamps. The period found last is
+    remembered, so repeated reads within the same period cost a comparison.
+    """
+
+    __slots__ = ("_starts", "_ends", "_prices", "_current", "_as_list")
+
+    def __init__(self, periods: list[tuple[float, float, Optional[float]]]) -> None:
+        """Initialize from ``(start, end, price)`` tuples of POSIX timestamps."""
+        periods = sorted(periods)
+        self._starts = [period[0] for period in periods]
+        self._ends = [period[1] for period in periods]
+        self._prices = [period[2] for period in periods]
+        self._current = -1
+        self._as_list: Optional[list[dict]] = None
+
+    def __len__(self) -> int:
+        """Return the number of periods."""
+        return len(self._starts)
+
+    @classmethod
+    def from_hours(cls, hours: list) -> "PriceIndex":
+        """Build the index from the ``hours`` of a tariff.
+
+        Periods may have any length, see :func:`period_bounds`, and open
+        ends are filled in by :meth:`from_open_periods`.
+        """
+        day = dt_util.start_of_local_day()
+        periods = []
+        for hour in hours:
+            try:
+                start, end = period_bounds(hour, day)
+            except (KeyError, ValueError, AttributeError, TypeError):
+                _LOGGER.debug("PriceIndex: hopper over periode %s", hour)
+                continue
+            price = (hour.get("energyPrice") or {}).get("total")
+            periods.append([start, end, price])
+        return cls.from_open_periods(periods)
+
+    @classmethod
+    def from_open_periods(cls, periods: list[list]) -> "PriceIndex":
+        """Build the index from ``[start, end, price]`` lists, end maybe None.
+
+        A period without an end lasts until the next one starts, or as long
+        as the period before it if it is the last one.
+        """
+        periods.sort(key=lambda period: period[0])
+        for index, period in enumerate(periods):
+            if period[1] is not None:
+                continue
+            if index + 1 < len(periods):
+                period[1] = periods[index + 1][0]
+            elif index > 0:
+                period[1] = period[0] + periods[index - 1][1] - periods[index - 1][0]
+            else:
+                period[1] = period[0] + 3600
+        return cls([tuple(period) for period in periods])
+
+    def as_list(self) -> list[dict]:
+        """Return the periods as dicts with ISO start/end and price.
+
+        The list is built on first use and reused until the next update.
+        """
+        if self._as_list is None:
+            self._as_list = [
+                {
+                    "start": dt_util.as_local(
+                        dt_util.utc_from_timestamp(start)
+                    ).isoformat(),
+                    "end": dt_util.as_local(
+                        dt_util.utc_from_timestamp(end)
+                    ).isoformat(),
+                    "price": price,
+                }
+                for start, end, price in zip(self._starts, self._ends, self._prices)
+            ]
+        return self._as_list
+
+    def price_at(self, when: datetime) -> Optional[float]:
+        """Return the price of the period containing ``when``."""
+        timestamp = when.timestamp()
+        index = self._current
+        if index < 0 or not self._starts[index] <= timestamp < self._ends[index]:
+            index = bisect_right(self._starts, timestamp) - 1
+            if index < 0 or timestamp >= self._ends[index]:
+                return None
+            self._current = index
+        return self._prices[index]
+
+    def next_boundary(self, when: datetime) -> Optional[datetime]:
+        """Return the first period start or end after ``when``."""
+        timestamp = when.timestamp()
+        index = bisect_right(self._starts, timestamp)
+        candidates = []
+        if index < len(self._starts):
+            candidates.append(self._starts[index])
+        if index > 0 and self._ends[index - 1] > timestamp:
+            candidates.append(self._ends[index - 1])
+        if not candidates:
+            return None
+        return dt_util.utc_from_timestamp(min(candidates))
+
+    def periods(
+        self, after: Optional[datetime] = None, before: Optional[datetime] = None
+    ) -> list[tuple[float, float, Optional[float]]]:
+        """Return the periods starting at or after ``after`` and ending by ``before``.
+
+        Periods are ``(start, end, price)`` tuples of POSIX timestamps.
+        """
+        first = 0 if after is None else bisect_left(self._starts, after.timestamp())
+        periods = zip(self._starts[first:], self._ends[first:], self._prices[first:])
+        if before is None:
+            return list(periods)
+        limit = before.timestamp()
+        return [period for period in periods if period[1] <= limit]
+
+    @property
+    def start(self) -> Optional[datetime]:
+        """Return the start of the first period, None without periods."""
+        if not self._starts:
+            return None
+        return dt_util.utc_from_timestamp(self._starts[0])
+
+    def hourly(self) -> list[tuple[datetime, float, float, float]]:
+        """Return the start, mean, min and max price of every hour with prices.
+
+        Hours are whole UTC hours. The mean is weighted by how much of the
+        hour each period covers, and periods without a price are left out.
+        """
+        hours: dict[float, list[float]] = {}
+        for start, end, price in zip(self._starts, self._ends, self._prices):
+            if price is None:
+                continue
+            hour = start - start % 3600
+            while hour < end:
+                overlap = min(end, hour + 3600) - max(start, hour)
+                total = hours.setdefault(hour, [0.0, 0.0, price, price])
+                total[0] += price * overlap
+                total[1] += overlap
+                total[2] = min(total[2], price)
+                total[3] = max(total[3], price)
+                hour += 3600
+        return [
+            (dt_util.utc_from_timestamp(hour), weighted / seconds, low, high)
+            for hour, (weighted, seconds, low, high) in sorted(hours.items())
+        ]
+
+    @property
+    def end(self) -> Optional[datetime]:
+        """Return the end of the last period, None without periods."""
+        if not self._ends:
+            return None
+        return dt_util.utc_from_timestamp(max(self._ends))
+
+
+EMPTY_PRICES = PriceIndex([])
+NO_PRICE_LEVEL = "Effektnivå er ikke satt"
+
+
+class TariffParseError(ValueError):
+    """Raised when a tariff response does not have the expected shape."""
+
+
+def _as_list(value, what: str) -> list:
+    """Return ``value`` if it is a list, [] if it is missing."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise TariffParseError(f"{what} er ikke en liste")
+    return value
+
+
+def _as_dict(value, what: str) -> dict:
+    """Return ``value`` if it is a dict, {} if it is missing."""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise TariffParseError(f"{what} er ikke et objekt")
+    return value
+
+
+class PriceLevel:
+    """One fixed price level (effekttrinn) of a tariff."""
+
+    __slots__ = (
+        "id",
+        "value_min",
+        "value_max",
+        "monthly_total",
+        "monthly_total_ex_vat",
+        "monthly_ex_taxes",
+        "monthly_taxes",
+        "monthly_unit_of_measure",
+    )
+
+    def __init__(self, level: dict) -> None:
+        """Initialize from a ``priceLevels`` entry."""
+        level = _as_dict(level, "priceLevels[]")
+        self.id = level.get("id")
+        self.value_min = level.get("valueMin")
+        self.value_max = level.get("valueMax")
+        self.monthly_total = level.get("monthlyTotal")
+        self.monthly_total_ex_vat = level.get("monthlyTotalExVat")
+        self.monthly_ex_taxes = level.get("monthlyExTaxes")
+        self.monthly_taxes = level.get("monthlyTaxes")
+        self.monthly_unit_of_measure = level.get("monthlyUnitOfMeasure")
+
+    def as_dict(self) -> dict:
+        """Return the level's id, range and monthly total for attributes."""
+        return {
+            "id": self.id,
+            "value_min": self.value_min,
+            "value_max": self.value_max,
+            "monthly_total": self.monthly_total,
+        }
+
+
+class MeteringPoint:
+    """A metering point and the fixed price level it is on."""
+
+    __slots__ = ("id", "level_id")
+
+    def __init__(self, entry: dict) -> None:
+        """Initialize from a ``meteringPointsAndPriceLevels`` entry."""
+        entry = _as_dict(entry, "meteringPointsAndPriceLevels[]")
+        self.id = entry.get("meteringPointId")
+        level = _as_dict(entry.get("currentFixedPriceLevel"), "currentFixedPriceLevel")
+        self.level_id = level.get("id")
+
+
+class TariffCollection:
+    """One ``gridTariffCollections`` entry: a tariff and its metering points.
+
+    ``price_levels`` is sorted by ``value_min``. Levels can be looked up by
+    id through ``level_positions`` or by a power value with
+    :meth:`level_for_value`.
+    """
+
+    __slots__ = (
+        "metering_points",
+        "price_levels",
+        "level_positions",
+        "_thresholds",
+        "prices",
+    )
+
+    def __init__(self, collection: dict) -> None:
+        """Parse a ``gridTariffCollections`` entry."""
+        collection = _as_dict(collection, "gridTariffCollections[]")
+        self.metering_points = [
+            MeteringPoint(entry)
+            for entry in _as_list(
+                collection.get("meteringPointsAndPriceLevels"),
+                "meteringPointsAndPriceLevels",
+            )
+        ]
+        grid_tariff = _as_dict(collection.get("gridTariff"), "gridTariff")
+        tariff_price = _as_dict(grid_tariff.get("tariffPrice"), "tariffPrice")
+        price_info = _as_dict(tariff_price.get("priceInfo"), "priceInfo")
+        fixed_prices = _as_list(price_info.get("fixedPrices"), "fixedPrices")
+        levels = (
+            _as_dict(fixed_prices[0], "fixedPrices[]").get("priceLevels")
+            if fixed_prices
+            else None
+        )
+        self.price_levels = sorted(
+            (PriceLevel(level) for level in _as_list(levels, "priceLevels")),
+            key=lambda level: level.value_min or 0,
+        )
+        self.level_positions = {
+            level.id: position for position, level in enumerate(self.price_levels)
+        }
+        self._thresholds = [level.value_min or 0 for level in self.price_levels]
+        self.prices = PriceIndex.from_hours(
+            _as_list(tariff_price.get("hours"), "hours")
+        )
+
+    def level_for_value(self, value: float) -> Optional[PriceLevel]:
+        """Return the highest level whose ``value_min`` is at most ``value``."""
+        if not self.price_levels:
+            return None
+        position = max(bisect_right(self._thresholds, value) - 1, 0)
+        return self.price_levels[position]
+
+    def adjacent_levels(
+        self, level_id
+    ) -> tuple[Optional[PriceLevel], Optional[PriceLevel], Optional[PriceLevel]]:
+        """Return the previous, matching and next level for ``level_id``."""
+        position = self.level_positions.get(level_id)
+        if position is None:
+            return None, None, None
+        levels = self.price_levels
+        return (
+            levels[position - 1] if position > 0 else None,
+            levels[position],
+            levels[position + 1] if position + 1 < len(levels) else None,
+        )
+
+
+class MeteringPointTariff:
+    """The tariff of one metering point, precomputed for its entities.
+
+    ``fixed_prices`` maps the fixed-price sensor keys to the values of the
+    point's current price level, and ``fixed_price_attributes`` holds extra
+    attributes per key. ``collection`` is the collection the point is in,
+    for looking up its price levels.
+    """
+
+    __slots__ = (
+        "metering_point",
+        "collection",
+        "prices",
+        "fixed_prices",
+        "fixed_price_attributes",
+    )
+
+    def __init__(
+        self,
+        metering_point: Optional[MeteringPoint],
+        collection: Optional[TariffCollection],
+    ) -> None:
+        """Initialize from a metering point and the collection it is in."""
+        self.metering_point = metering_point
+        self.collection = collection
+        self.prices = collection.prices if collection else EMPTY_PRICES
+        level_id = metering_point.level_id if metering_point else None
+        previous, level, following = (
+            collection.adjacent_levels(level_id) if collection else (None, None, None)
+        )
+        self.fixed_prices = {
+            "currentFixedPriceLevel": level_id if metering_point else NO_PRICE_LEVEL,
+            "monthlyTotal": getattr(level, "monthly_total", None),
+            "monthlyTotalExVat": getattr(level, "monthly_total_ex_vat", None),
+            "monthlyExTaxes": getattr(level, "monthly_ex_taxes", None),
+            "monthlyTaxes": getattr(level, "monthly_taxes", None),
+            "monthlyUnitOfMeasure": getattr(level, "monthly_unit_of_measure", None),
+        }
+        self.fixed_price_attributes = {
+            "currentFixedPriceLevel": {
+                "value_min": getattr(level, "value_min", None),
+                "value_max": getattr(level, "value_max", None),
+                "previous_level": previous.as_dict() if previous else None,
+                "next_level": following.as_dict() if following else None,
+            }
+        }
+
+
+EMPTY_POINT = MeteringPointTariff(None, None)
+
+
+class TariffData:
+    """A ``MeteringPointsGridTariffs`` response parsed once per update.
+
+    Entities read these precomputed fields instead of walking the raw JSON.
+    ``points`` holds a :class:`MeteringPointTariff` per metering point id.
+    The first metering point of the first collection is the entry's own,
+    and the ``prices``, ``fixed_prices`` and ``fixed_price_attributes``
+    shortcuts refer to it.
+    """
+
+    __slots__ = ("collections", "points", "primary")
+
+    def __init__(self, collections: list[TariffCollection]) -> None:
+        """Initialize from parsed collections."""
+        self.collections = collections
+        self.points = {
+            point.id: MeteringPointTariff(point, collection)
+            for collection in collections
+            for point in collection.metering_points
+        }
+        if not collections:
+            self.primary = EMPTY_POINT
+        else:
+            points = collections[0].metering_points
+            self.primary = MeteringPointTariff(
+                points[0] if points else None, collections[0]
+            )
+
+    @classmethod
+    def parse(cls, data: Optional[dict]) -> "TariffData":
+        """Parse a response, raising :class:`TariffParseError` if malformed."""
+        data = _as_dict(data, "respons")
+        return cls(
+            [
+                TariffCollection(collection)
+                for collection in _as_list(
+                    data.get("gridTariffCollections"), "gridTariffCollections"
+                )
+            ]
+        )
+
+    def point(self, meteringpoint_id: Optional[str] = None) -> MeteringPointTariff:
+        """Return the tariff of ``meteringpoint_id``, or the entry's own.
+
+        A response that does not name its points is taken to be for
+        ``meteringpoint_id``. A point missing from a response that names
+        its points has no tariff.
+        """
+        point = self.points.get(meteringpoint_id)
+        if point is not None:
+            return point
+        if meteringpoint_id is None or not self.points or None in self.points:
+            return self.primary
+        return EMPTY_POINT
+
+    def next_boundary(self, when: datetime) -> Optional[datetime]:
+        """Return the first period boundary after ``when`` in any collection."""
+        boundaries = [
+            boundary
+            for boundary in (c.prices.next_boundary(when) for c in self.collections)
+            if boundary is not None
+        ]
+        return min(boundaries, default=None)
+
+    @property
+    def covered_until(self) -> Optional[datetime]:
+        """Return until when every collection has period prices.
+
+        None if there are no collections or one of them has no periods.
+        """
+        ends = [collection.prices.end for collection in self.collections]
+        if not ends or None in ends:
+            return None
+        return min(ends)
+
+    @property
+    def prices(self) -> PriceIndex:
+        """Return the period prices of the entry's metering point."""
+        return self.primary.prices
+
+    @property
+    def fixed_prices(self) -> dict:
+        """Return the fixed-price sensor values of the entry's metering point."""
+        return self.primary.fixed_prices
+
+    @property
+    def fixed_price_attributes(self) -> dict:
+        """Return the fixed-price attributes of the entry's metering point."""
+        return self.primary.fixed_price_attributes
+
+    @property
+    def price_levels(self) -> list[PriceLevel]:
+        """Return the fixed price levels of the first collection."""
+        if not self.collections:
+            return []
+        return self.collections[0].price_levels
+
+    @property
+    def metering_points(self) -> list[MeteringPoint]:
+        """Return the metering points of the first collection."""
+        if not self.collections:
+            return []
+        return self.collections[0].metering_points
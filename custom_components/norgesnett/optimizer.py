@@ -0,0 +1,167 @@
+"""Find the cheapest periods in the Norgesnett tariffs."""
+
+import heapq
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+
+from homeassistant.util import dt as dt_util
+
+from .model import PriceIndex
+
+Period = tuple[float, float, float]
+
+
+class PriceWindow:
+    """A set of periods picked for their price, sorted by start."""
+
+    __slots__ = ("periods",)
+
+    def __init__(self, periods: list[Period]) -> None:
+        """Initialize from ``(start, end, price)`` tuples."""
+        self.periods = periods
+
+    @property
+    def start(self) -> datetime:
+        """Return the start of the first period."""
+        return dt_util.utc_from_timestamp(self.periods[0][0])
+
+    @property
+    def end(self) -> datetime:
+        """Return the end of the last period."""
+        return dt_util.utc_from_timestamp(self.periods[-1][1])
+
+    @property
+    def mean_price(self) -> float:
+        """Return the mean price of the periods."""
+        return sum(period[2] for period in self.periods) / len(self.periods)
+
+    def cost(self, power: float) -> float:
+        """Return the cost of drawing ``power`` kW through all the periods."""
+        return sum(
+            price * power * (end - start) / 3600 for start, end, price in self.periods
+        )
+
+    def as_dict(self) -> dict:
+        """Return the window with ISO times, as returned by the services."""
+        return {
+            "start": dt_util.as_local(self.start).isoformat(),
+            "end": dt_util.as_local(self.end).isoformat(),
+            "mean_price": self.mean_price,
+            "periods": [
+                {
+                    "start": dt_util.as_local(
+                        dt_util.utc_from_timestamp(start)
+                    ).isoformat(),
+                    "end": dt_util.as_local(
+                        dt_util.utc_from_timestamp(end)
+                    ).isoformat(),
+                    "price": price,
+                }
+                for start, end, price in self.periods
+            ],
+        }
+
+
+def candidate_periods(
+    prices: PriceIndex, after: datetime, deadline: Optional[datetime] = None
+) -> list[Period]:
+    """Return the priced periods that start after ``after`` and end by ``deadline``."""
+    return [
+        period for period in prices.periods(after, deadline) if period[2] is not None
+    ]
+
+
+def periods_for(duration: timedelta, periods: list[Period]) -> int:
+    """Return how many periods of the length of the first one cover ``duration``."""
+    if not periods:
+        return 0
+    length = periods[0][1] - periods[0][0]
+    return max(1, math.ceil(duration.total_seconds() / length))
+
+
+def cheapest_window(periods: list[Period], count: int) -> Optional[PriceWindow]:
+    """Return the cheapest ``count`` back-to-back periods.
+
+    A sliding sum runs over ``periods`` once and starts over at every gap
+    between periods, so this is O(n).
+    """
+    if count < 1:
+        return None
+    best, best_total = None, math.inf
+    run_start, total = 0, 0.0
+    for index, (start, _end, price) in enumerate(periods):
+        if index > run_start and periods[index - 1][1] != start:
+            run_start, total = index, 0.0
+        total += price
+        if index - run_start >= count:
+            total -= periods[index - count][2]
+        if index - run_start + 1 >= count and total < best_total:
+            best, best_total = index + 1 - count, total
+    if best is None:
+        return None
+    return PriceWindow(periods[best : best + count])
+
+
+def cheapest_periods(periods: list[Period], count: int) -> Optional[PriceWindow]:
+    """Return the ``count`` cheapest periods, not necessarily back-to-back.
+
+    The periods are picked with a heap in O(n log count).
+    """
+    if count < 1 or count > len(periods):
+        return None
+    return PriceWindow(sorted(heapq.nsmallest(count, periods, key=lambda p: p[2])))
+
+
+class Load:
+    """An appliance to place: how many periods it runs, its power and deadline."""
+
+    __slots__ = ("name", "count", "power", "deadline")
+
+    def __init__(
+        self, name: str, count: int, power: float, deadline: Optional[float] = None
+    ) -> None:
+        """Initialize, ``deadline`` is a POSIX timestamp."""
+        self.name = name
+        self.count = count
+        self.power = power
+        self.deadline = deadline
+
+
+def plan_loads(
+    periods: list[Period], loads: list[Load], power_cap: Optional[float] = None
+) -> list[Optional[PriceWindow]]:
+    """Place every load in its cheapest window without exceeding ``power_cap``.
+
+    Greedy with bounds: the loads with the fewest possible start times are
+    placed first, each in the cheapest back-to-back window that ends by its
+    deadline and where the power already planned leaves room for it. That
+    is O(loads × periods). Returns the window of each load, in the order of
+    ``loads``, or None for loads that do not fit.
+    """
+    used = [0.0] * len(periods)
+    position = {period[0]: index for index, period in enumerate(periods)}
+
+    def fits(load: Load, index: int) -> bool:
+        if load.deadline is not None and periods[index][1] > load.deadline:
+            return False
+        return power_cap is None or used[index] + load.power <= power_cap
+
+    def slack(number: int) -> tuple[int, float]:
+        load = loads[number]
+        room = sum(1 for index in range(len(periods)) if fits(load, index))
+        return room - load.count, -load.power
+
+    plan: list[Optional[PriceWindow]] = [None] * len(loads)
+    for number in sorted(range(len(loads)), key=slack):
+        load = loads[number]
+        window = cheapest_window(
+            [period for index, period in enumerate(periods) if fits(load, index)],
+            load.count,
+        )
+        plan[number] = window
+        if window is None:
+            continue
+        for period in window.periods:
+            used[position[period[0]]] += load.power
+    return plan
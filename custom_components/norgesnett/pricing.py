@@ -0,0 +1,107 @@
+"""Total electricity price: spot price after subsidy plus the grid tariff."""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from homeassistant.core import State
+from homeassistant.util import dt as dt_util
+
+from .model import PriceIndex
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Attributes of a spot price entity holding today's and tomorrow's prices
+SPOT_PRICE_ATTRIBUTES = ("raw_today", "raw_tomorrow")
+
+
+def _timestamp(value) -> Optional[float]:
+    """Return the timestamp of a datetime or ISO string, None if neither."""
+    if isinstance(value, str):
+        value = dt_util.parse_datetime(value)
+    if not isinstance(value, datetime):
+        return None
+    return value.timestamp()
+
+
+def spot_price_index(state: Optional[State], now: datetime) -> PriceIndex:
+    """Return the price vector of a spot price entity.
+
+    The periods are read from the ``raw_today``/``raw_tomorrow`` attributes
+    of the Nord Pool integration, entries with a ``start`` (or ``hour``),
+    an optional ``end`` and a ``value`` (or ``price``). An entity without
+    them gives its state as the price of the current hour.
+    """
+    if state is None:
+        return PriceIndex([])
+    periods = []
+    for attribute in SPOT_PRICE_ATTRIBUTES:
+        for entry in state.attributes.get(attribute) or []:
+            if not isinstance(entry, dict):
+                continue
+            start = _timestamp(entry.get("start", entry.get("hour")))
+            price = entry.get("value", entry.get("price"))
+            if start is None or not isinstance(price, (int, float)):
+                _LOGGER.debug("Spotpris: hopper over periode %s", entry)
+                continue
+            periods.append([start, _timestamp(entry.get("end")), float(price)])
+    if periods:
+        return PriceIndex.from_open_periods(periods)
+    try:
+        price = float(state.state)
+    except ValueError:
+        return PriceIndex([])
+    hour = now.replace(minute=0, second=0, microsecond=0).timestamp()
+    return PriceIndex([(hour, hour + 3600, price)])
+
+
+class TotalPriceFormula:
+    """The price paid per kWh for a spot price and a grid tariff.
+
+    The subsidy (strømstøtte) covers ``rate`` of the spot price above
+    ``threshold``, and the supplier adds ``markup`` to every kWh.
+    """
+
+    __slots__ = ("threshold", "rate", "markup")
+
+    def __init__(self, threshold: float, rate: float, markup: float) -> None:
+        """Initialize with the subsidy threshold and rate and the markup."""
+        self.threshold = threshold
+        self.rate = rate
+        self.markup = markup
+
+    def __call__(self, spot: float, grid: float) -> float:
+        """Return the total price of one period."""
+        subsidy = max(spot - self.threshold, 0.0) * self.rate
+        return spot - subsidy + grid + self.markup
+
+    def combine(
+        self,
+        grid: PriceIndex,
+        spot: PriceIndex,
+        after: Optional[datetime] = None,
+        span: timedelta = timedelta(hours=48),
+    ) -> PriceIndex:
+        """Return the total prices of the ``span`` after ``after``.
+
+        Both vectors are walked once side by side. Each overlap of a grid
+        and a spot period becomes a period, so spot prices of 15 minutes
+        and hourly tariffs combine as well as two hourly vectors. Periods
+        missing either price are left out.
+        """
+        before = after + span if after is not None else None
+        grid_periods = grid.periods(after, before)
+        spot_periods = spot.periods(after, before)
+        totals = []
+        i = j = 0
+        while i < len(grid_periods) and j < len(spot_periods):
+            grid_start, grid_end, grid_price = grid_periods[i]
+            spot_start, spot_end, spot_price = spot_periods[j]
+            start, end = max(grid_start, spot_start), min(grid_end, spot_end)
+            if start < end and grid_price is not None and spot_price is not None:
+                totals.append((start, end, self(spot_price, grid_price)))
+            if grid_end <= spot_end:
+                i += 1
+            else:
+                j += 1
+        return PriceIndex(totals)
@@ -0,0 +1,160 @@
+"""Scheduling helpers for Norgesnett."""
+
+import logging
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Optional
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_time
+from homeassistant.util import dt as dt_util
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class BoundaryScheduler:
+    """Notify listeners when a tariff period starts or ends.
+
+    One timer is armed for the next boundary returned by ``next_boundary``
+    and re-armed after it fires, however many listeners there are.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        next_boundary: Callable[[datetime], Optional[datetime]],
+    ) -> None:
+        """Initialize without any listeners or timer."""
+        self._hass = hass
+        self._next_boundary = next_boundary
+        self._listeners: list[CALLBACK_TYPE] = []
+        self._unsub_timer: Optional[CALLBACK_TYPE] = None
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call ``update_callback`` at every boundary, return a remover."""
+        self._listeners.append(update_callback)
+        if self._unsub_timer is None:
+            self.async_rearm()
+
+        @callback
+        def remove_listener() -> None:
+            self._listeners.remove(update_callback)
+            if not self._listeners:
+                self._cancel()
+
+        return remove_listener
+
+    @callback
+    def async_rearm(self) -> None:
+        """Arm the timer for the next boundary, e.g. after new data arrived."""
+        self._cancel()
+        if not self._listeners:
+            return
+        boundary = self._next_boundary(dt_util.utcnow())
+        if boundary is None:
+            _LOGGER.debug("BoundaryScheduler: ingen flere periodegrenser")
+            return
+        self._unsub_timer = async_track_point_in_time(
+            self._hass, self._async_fire, boundary
+        )
+
+    @callback
+    def async_shutdown(self) -> None:
+        """Cancel the armed timer, e.g. when the coordinator is dropped."""
+        self._cancel()
+
+    @callback
+    def _async_fire(self, _now: datetime) -> None:
+        """Notify listeners and arm the timer for the following boundary."""
+        self._unsub_timer = None
+        for update_callback in list(self._listeners):
+            update_callback()
+        self.async_rearm()
+
+    @callback
+    def _cancel(self) -> None:
+        """Cancel the armed timer, if any."""
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+
+class RefreshSchedule:
+    """Choose when the tariffs are refreshed next.
+
+    Tomorrow's tariffs are expected at ``publish_time``, so refreshes are
+    aligned to it. Local midnight is a refresh time too, unless the fetched
+    periods already cover the new day. Until the data covers the wanted
+    period the API is polled with an exponential backoff from
+    ``retry_interval`` up to ``max_retry_interval``, never past the next
+    aligned time. Aligned refreshes get a random delay of up to ``jitter``,
+    so that many installations do not call the API at once.
+    """
+
+    def __init__(
+        self,
+        publish_time: time,
+        retry_interval: timedelta,
+        max_retry_interval: timedelta,
+        jitter: timedelta = timedelta(minutes=5),
+    ) -> None:
+        """Initialize without any missed refreshes."""
+        self.publish_time = publish_time
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._jitter = jitter
+        self._retries = 0
+
+    def _publish(self, day: date) -> datetime:
+        """Return the publish time on ``day``."""
+        return datetime.combine(
+            day, self.publish_time, tzinfo=dt_util.DEFAULT_TIME_ZONE
+        )
+
+    def wanted_until(self, now: datetime) -> datetime:
+        """Return the end of the periods that should be published by ``now``.
+
+        That is the end of today, or of tomorrow once the publish time has
+        passed.
+        """
+        today = dt_util.as_local(now).date()
+        days = 2 if now >= self._publish(today) else 1
+        return dt_util.start_of_local_day(today + timedelta(days=days))
+
+    def next_aligned(
+        self, now: datetime, covered_until: Optional[datetime] = None
+    ) -> datetime:
+        """Return the first publish time or needed local midnight after ``now``."""
+        today = dt_util.as_local(now).date()
+        tomorrow = today + timedelta(days=1)
+        if now < self._publish(today):
+            return self._publish(today)
+        if covered_until is not None and covered_until >= dt_util.start_of_local_day(
+            tomorrow + timedelta(days=1)
+        ):
+            return self._publish(tomorrow)
+        return dt_util.start_of_local_day(tomorrow)
+
+    def next_interval(
+        self, now: datetime, covered_until: Optional[datetime]
+    ) -> timedelta:
+        """Return the time from ``now`` until the next refresh.
+
+        ``covered_until`` is the end of the fetched periods.
+        """
+        aligned = self.next_aligned(now, covered_until) - now
+        if covered_until is None or covered_until < self.wanted_until(now):
+            self._retries += 1
+            retry = min(
+                self._retry_interval * 2 ** (self._retries - 1),
+                self._max_retry_interval,
+            )
+            _LOGGER.debug(
+                "RefreshSchedule: mangler perioder, prøver igjen om %s", retry
+            )
+            return min(retry, aligned)
+        self._retries = 0
+        return aligned + timedelta(
+            seconds=random.uniform(0, self._jitter.total_seconds())
+        )
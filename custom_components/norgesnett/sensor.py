@@ -1,66 +1,111 @@
 """Sensor platform for Norgesnett."""
 
 import logging
-
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.helpers.event import async_track_time_change
-from homeassistant.util.dt import now
-
-from .const import DEFAULT_NAME, DOMAIN, ICON
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity
+from homeassistant.const import ATTR_UNIT_OF_MEASUREMENT, UnitOfEnergy, UnitOfPower
+from homeassistant.core import callback
+from homeassistant.helpers.event import (
+    async_track_state_change_event,
+    async_track_utc_time_change,
+)
+from homeassistant.helpers.storage import Store
+from homeassistant.util.dt import as_local, now, start_of_local_day, utcnow
+
+from .api import split_meteringpoint_ids
+from .capacity import CapacityTracker
+from .const import (
+    CAPACITY_STORAGE_KEY,
+    CHEAPEST_WINDOW_HOURS,
+    CONF_METERINGPOINT_ID,
+    CONF_POWER_SENSOR,
+    CONF_SPOT_PRICE_SENSOR,
+    CONF_SUBSIDY_RATE,
+    CONF_SUBSIDY_THRESHOLD,
+    CONF_SUPPLIER_MARKUP,
+    DEFAULT_SUBSIDY_RATE,
+    DEFAULT_SUBSIDY_THRESHOLD,
+    DEFAULT_SUPPLIER_MARKUP,
+    DOMAIN,
+    ICON,
+    STORAGE_VERSION,
+    TOTAL_PRICE_HOURS,
+)
 from .entity import NorgesnettEntity
+from .model import PriceIndex
+from .optimizer import candidate_periods, cheapest_window, periods_for
+from .pricing import TotalPriceFormula, spot_price_index
+from .scheduler import BoundaryScheduler
 
 _LOGGER = logging.getLogger(__name__)
 
+# Factors from the units a source sensor may report to kW and kWh
+POWER_UNITS = {UnitOfPower.WATT: 0.001, UnitOfPower.KILO_WATT: 1.0}
+ENERGY_UNITS = {
+    UnitOfEnergy.WATT_HOUR: 0.001,
+    UnitOfEnergy.KILO_WATT_HOUR: 1.0,
+    UnitOfEnergy.MEGA_WATT_HOUR: 1000.0,
+}
+
 
 async def async_setup_entry(hass, entry, async_add_entities):
     """Setup sensor platform."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
-    data = coordinator.data or {}
+    tariff = coordinator.tariff
 
-    collections = data.get("gridTariffCollections") or []
-
-    if not collections:
+    if not tariff.collections:
         _LOGGER.error(
             "Norgesnett: Ingen gridTariffCollections i data, hopper over sensor-setup"
         )
         return None
 
-    mp_list = data["gridTariffCollections"][0]["meteringPointsAndPriceLevels"]
-
-    if not mp_list:
+    if not tariff.metering_points:
         _LOGGER.error(
             "Norgesnett: Ingen gridTariff, hopper over sensor-setup for prisnivå"
         )
-        # return None
-
-    if len(mp_list) > 0:
-        mp = mp_list[0]
-        currentPriceLevel = mp["currentFixedPriceLevel"]["id"]
-    else:
-        currentPriceLevel = "Effektnivå er ikke satt"
-
-    fixedPrices_list = data["gridTariffCollections"][0]["gridTariff"]["tariffPrice"][
-        "priceInfo"
-    ]["fixedPrices"]
-    fixedPrices = fixedPrices_list[0]
-
-    items = {
-        "currentFixedPriceLevel": currentPriceLevel,
-        "monthlyTotal": fixedPrices["priceLevels"][0]["monthlyTotal"],
-        "monthlyTotalExVat": fixedPrices["priceLevels"][0]["monthlyTotalExVat"],
-        "monthlyExTaxes": fixedPrices["priceLevels"][0]["monthlyExTaxes"],
-        "monthlyTaxes": fixedPrices["priceLevels"][0]["monthlyTaxes"],
-        "monthlyUnitOfMeasure": fixedPrices["priceLevels"][0]["monthlyUnitOfMeasure"],
-    }
-
-    entities = (
-        [NorgesnettHourlyPricesSensor(coordinator, entry)]
-        + [
-            NorgesnettSensor(coordinator, entry, key, value)
-            for key, value in items.items()
+
+    # In hub mode every metering point gets its own set of sensors.
+    meteringpoint_ids = split_meteringpoint_ids(entry.data.get(CONF_METERINGPOINT_ID))
+    if len(meteringpoint_ids) < 2:
+        meteringpoint_ids = [None]
+
+    entities = []
+    for meteringpoint_id in meteringpoint_ids:
+        point = tariff.point(meteringpoint_id)
+        entities += (
+            [NorgesnettHourlyPricesSensor(coordinator, entry, meteringpoint_id)]
+            + [
+                NorgesnettSensor(coordinator, entry, key, value, meteringpoint_id)
+                for key, value in point.fixed_prices.items()
+            ]
+            + [NorgesnettCurrentPriceSensor(coordinator, entry, meteringpoint_id)]
+            + [
+                NorgesnettCheapestWindowSensor(
+                    coordinator, entry, hours, meteringpoint_id
+                )
+                for hours in CHEAPEST_WINDOW_HOURS
+            ]
+        )
+
+    spot_price_sensor = entry.options.get(CONF_SPOT_PRICE_SENSOR)
+    if spot_price_sensor:
+        formula = TotalPriceFormula(
+            entry.options.get(CONF_SUBSIDY_THRESHOLD, DEFAULT_SUBSIDY_THRESHOLD),
+            entry.options.get(CONF_SUBSIDY_RATE, DEFAULT_SUBSIDY_RATE),
+            entry.options.get(CONF_SUPPLIER_MARKUP, DEFAULT_SUPPLIER_MARKUP),
+        )
+        entities += [
+            NorgesnettTotalPriceSensor(
+                coordinator, entry, spot_price_sensor, formula, meteringpoint_id
+            )
+            for meteringpoint_id in meteringpoint_ids
         ]
-        + [NorgesnettCurrentPriceSensor(coordinator, entry)]
-    )
+
+    # The power sensor measures the entry's own metering point
+    power_sensor = entry.options.get(CONF_POWER_SENSOR)
+    if power_sensor:
+        entities.append(NorgesnettCapacitySensor(coordinator, entry, power_sensor))
 
     async_add_entities(entities, update_before_add=True)
 
@@ -70,28 +115,29 @@ async def async_setup_entry(hass, entry, async_add_entities):
 class NorgesnettSensor(NorgesnettEntity):
     """norgesnett Sensor class."""
 
-    def __init__(self, coordinator, config_entry, key: str, initial_value):
-        super().__init__(coordinator, config_entry)
+    def __init__(
+        self, coordinator, config_entry, key: str, initial_value, meteringpoint_id=None
+    ):
+        super().__init__(coordinator, config_entry, meteringpoint_id)
         self._key = key
-        self._attr_unique_id = f"{config_entry.entry_id}_{key}"
+        self._attr_unique_id = f"{self.unique_id_prefix}_{key}"
         self._attr_native_value = initial_value
 
     @property
     def state(self):
-        # Return latest value from coordinator, fallback to init value
-        try:
-            value = self.coordinator.data.get(self._key, self._attr_native_value)
-            return value
-        except Exception as e:
-            _LOGGER.error(
-                f"NorgesnettSensor: Exception getting state for {self._key}: {e}"
-            )
-            return self._attr_native_value
+        # Return value from the latest update, fallback to init value
+        return self.tariff_point.fixed_prices.get(self._key, self._attr_native_value)
 
     @property
     def name(self):
         """Return the name of the sensor."""
-        return f"{DEFAULT_NAME}_{self._key}"
+        return f"{self.name_prefix}_{self._key}"
+
+    def _build_extra_state_attributes(self):
+        """Return the common attributes plus those precomputed for this key."""
+        attributes = super()._build_extra_state_attributes()
+        extra = self.tariff_point.fixed_price_attributes.get(self._key)
+        return {**attributes, **extra} if extra else attributes
 
     @property
     def icon(self):
@@ -105,12 +151,17 @@ class NorgesnettSensor(NorgesnettEntity):
 
 
 class NorgesnettHourlyPricesSensor(NorgesnettEntity, SensorEntity):
-    """Én sensor som inneholder alle tidsperioder som attributter."""
+    """Én sensor som inneholder alle tidsperioder som attributter.
 
-    def __init__(self, coordinator, config_entry):
-        super().__init__(coordinator, config_entry)
-        self._attr_name = f"{DEFAULT_NAME} Hourly Prices"
-        self._attr_unique_id = f"{config_entry.entry_id}_hourly_prices"
+    Prislisten lagres ikke i recorder, hent den med tjenesten ``get_prices``.
+    """
+
+    _unrecorded_attributes = frozenset({"prices"})
+
+    def __init__(self, coordinator, config_entry, meteringpoint_id=None):
+        super().__init__(coordinator, config_entry, meteringpoint_id)
+        self._attr_name = f"{self.name_prefix} Hourly Prices"
+        self._attr_unique_id = f"{self.unique_id_prefix}_hourly_prices"
 
     @property
     def icon(self):
@@ -128,37 +179,25 @@ class NorgesnettHourlyPricesSensor(NorgesnettEntity, SensorEntity):
 
     @property
     def state(self):
-        # Return number of periods (hours) as state, use attributes for details
-        try:
-            collections = self.coordinator.data.get("gridTariffCollections") or []
-            if (
-                not collections
-                or not isinstance(collections, list)
-                or len(collections) == 0
-            ):
-                return None
-            hours = (
-                collections[0]
-                .get("gridTariff", {})
-                .get("tariffPrice", {})
-                .get("hours", [])
-            )
-            if not hours or not isinstance(hours, list):
-                return None
-            return len(hours)
-        except Exception as e:
-            _LOGGER.error(f"NorgesnettHourlyPricesSensor: Exception getting state: {e}")
-            return None
+        # Return number of periods as state, use attributes for details
+        return len(self.tariff_point.prices) or None
 
     @property
     def name(self):
-        return f"{DEFAULT_NAME} Hourly Prices (JSON)"
+        return f"{self.name_prefix} Hourly Prices (JSON)"
+
+    def _build_extra_state_attributes(self):
+        """Return the common attributes plus every period with its price."""
+        return {
+            **super()._build_extra_state_attributes(),
+            "prices": self.tariff_point.prices.as_list(),
+        }
 
 
 class NorgesnettCurrentPriceSensor(NorgesnettEntity, SensorEntity):
     """Sensor som viser dagens pris for gjeldende time.
 
-    Oppdateres hvert minutt ved second=0 for å fange timebytte.
+    Oppdateres ved hver periodegrense via koordinatorens felles tidsplan.
     """
 
     @property
@@ -169,66 +208,275 @@ class NorgesnettCurrentPriceSensor(NorgesnettEntity, SensorEntity):
     def state_class(self):
         return "measurement"
 
-    def __init__(self, coordinator, config_entry):
-        super().__init__(coordinator, config_entry)
-        self._attr_name = f"{DEFAULT_NAME} Current Hour Price"
-        self._attr_unique_id = f"{config_entry.entry_id}_current_price"
+    def __init__(self, coordinator, config_entry, meteringpoint_id=None):
+        super().__init__(coordinator, config_entry, meteringpoint_id)
+        self._attr_name = f"{self.name_prefix} Current Hour Price"
+        self._attr_unique_id = f"{self.unique_id_prefix}_current_price"
         self._attr_unit_of_measurement = "NOK"
-        self._unsub_time_listener = None
 
     async def async_added_to_hass(self):
-        """Når sensoren legges til, planlegg oppdatering hvert minutt."""
-        # _update_state trigges hvert minutt når second=0
-        self._unsub_time_listener = async_track_time_change(
-            self.hass, self._update_state, second=0
-        )
-
-    async def async_will_remove_from_hass(self):
-        """Rydd opp når sensoren fjernes."""
-        if self._unsub_time_listener:
-            self._unsub_time_listener()
-            self._unsub_time_listener = None
-
-    def _update_state(self, now_time):
-        """Tving HA til å oppdatere state uten å hente ny data fra API.
-
-        Kalles hvert minutt fra :func:`async_added_to_hass` når second=0.
-        """
-        # force_refresh=False: vi bruker fremdeles gammel coordinator.data
-        self.hass.loop.call_soon_threadsafe(
-            self.async_schedule_update_ha_state, False  # force_refresh=False
+        """Når sensoren legges til, oppdater ved hver periodegrense."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self.coordinator.boundaries.async_add_listener(self.async_write_ha_state)
         )
 
     @property
     def state(self):
         """Return total price for current hour interval."""
+        return self.tariff_point.prices.price_at(now())
+
+
+class NorgesnettCheapestWindowSensor(NorgesnettEntity, SensorEntity):
+    """Sensor med starttidspunktet for det billigste sammenhengende vinduet.
+
+    Vinduet beregnes på nytt ved hver oppdatering og periodegrense, ikke ved
+    hver lesing av tilstanden.
+    """
+
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+
+    def __init__(self, coordinator, config_entry, hours: int, meteringpoint_id=None):
+        super().__init__(coordinator, config_entry, meteringpoint_id)
+        self._duration = timedelta(hours=hours)
+        self._attr_name = f"{self.name_prefix} Cheapest {hours}h Window"
+        self._attr_unique_id = f"{self.unique_id_prefix}_cheapest_{hours}h"
+        self._window = None
+
+    async def async_added_to_hass(self):
+        """Beregn vinduet nå og ved hver periodegrense."""
+        await super().async_added_to_hass()
+        self._update_window()
+        self.async_on_remove(
+            self.coordinator.boundaries.async_add_listener(self._async_boundary)
+        )
+
+    def _update_window(self) -> None:
+        """Find the cheapest window that has not started yet."""
+        periods = candidate_periods(self.tariff_point.prices, now())
+        self._window = cheapest_window(periods, periods_for(self._duration, periods))
+        self._attributes = None
+
+    @callback
+    def _async_boundary(self) -> None:
+        """Move the window on when a period starts."""
+        self._update_window()
+        self.async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Find the window in the new tariffs."""
+        self._update_window()
+        super()._handle_coordinator_update()
+
+    @property
+    def icon(self):
+        return ICON
+
+    @property
+    def native_value(self):
+        """Return when the cheapest window starts."""
+        return self._window.start if self._window else None
+
+    def _build_extra_state_attributes(self):
+        """Return the common attributes plus the end and mean price."""
+        return {
+            **super()._build_extra_state_attributes(),
+            "end": as_local(self._window.end).isoformat() if self._window else None,
+            "mean_price": self._window.mean_price if self._window else None,
+        }
+
+
+class NorgesnettCapacitySensor(NorgesnettEntity, SensorEntity):
+    """Sensor som anslår hvilket effekttrinn måneden ender på.
+
+    Følger en valgt effekt- eller energisensor og oppdaterer månedens
+    høyeste døgntopper for hver måling, uten oppslag i historikken.
+    Tilstanden er snittet av toppene i kW, attributtene gir trinnet og hvor
+    mye som gjenstår før neste trinn. Toppene lagres hver hele time.
+    """
+
+    _attr_device_class = SensorDeviceClass.POWER
+    _attr_native_unit_of_measurement = UnitOfPower.KILO_WATT
+
+    def __init__(self, coordinator, config_entry, source: str):
+        super().__init__(coordinator, config_entry)
+        self._source = source
+        self._tracker = CapacityTracker()
+        self._store = Store(
+            coordinator.hass,
+            STORAGE_VERSION,
+            f"{CAPACITY_STORAGE_KEY}.{config_entry.entry_id}",
+        )
+        self._attr_name = f"{self.name_prefix} Capacity Forecast"
+        self._attr_unique_id = f"{self.unique_id_prefix}_capacity_forecast"
+
+    async def async_added_to_hass(self):
+        """Hent lagrede topper og følg kildesensoren."""
+        await super().async_added_to_hass()
+        stored = await self._store.async_load()
+        if stored:
+            self._tracker = CapacityTracker.from_dict(stored)
+        state = self.hass.states.get(self._source)
+        if state is not None:
+            self._add_state(state, utcnow())
+        self.async_on_remove(
+            async_track_state_change_event(
+                self.hass, [self._source], self._async_source_changed
+            )
+        )
+        self.async_on_remove(
+            async_track_utc_time_change(self.hass, self._async_hour, minute=0, second=0)
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Lagre toppene før sensoren fjernes."""
+        await super().async_will_remove_from_hass()
+        await self._store.async_save(self._tracker.as_dict())
+
+    def _add_state(self, state, when) -> None:
+        """Add a state of the source sensor as a sample."""
+        unit = state.attributes.get(ATTR_UNIT_OF_MEASUREMENT)
         try:
-            collections = self.coordinator.data.get("gridTariffCollections") or []
-            if (
-                not collections
-                or not isinstance(collections, list)
-                or len(collections) == 0
-            ):
-                return None
-            hours = (
-                collections[0]
-                .get("gridTariff", {})
-                .get("tariffPrice", {})
-                .get("hours", [])
+            value = float(state.state)
+        except ValueError:
+            value = None
+        if unit in ENERGY_UNITS:
+            if value is not None:
+                self._tracker.add_energy(when, value * ENERGY_UNITS[unit])
+        elif unit in POWER_UNITS:
+            self._tracker.add_power(
+                when, value * POWER_UNITS[unit] if value is not None else None
+            )
+        else:
+            _LOGGER.debug("Norgesnett: %s har ukjent enhet %s", self._source, unit)
+            return
+        self._attributes = None
+
+    @callback
+    def _async_source_changed(self, event) -> None:
+        """Add the new state of the source sensor."""
+        state = event.data.get("new_state")
+        if state is None:
+            return
+        self._add_state(state, state.last_updated)
+        self.async_write_ha_state()
+
+    @callback
+    def _async_hour(self, when) -> None:
+        """Close the hour, even if the source has not changed, and save."""
+        self._tracker.flush(when)
+        self._attributes = None
+        self.hass.async_create_task(self._store.async_save(self._tracker.as_dict()))
+        self.async_write_ha_state()
+
+    @property
+    def icon(self):
+        return ICON
+
+    @property
+    def native_value(self):
+        """Return the mean of the month's highest daily peaks in kW."""
+        return round(self._tracker.average, 3)
+
+    def _build_extra_state_attributes(self):
+        """Return the common attributes plus the forecast tier and headroom."""
+        return {
+            **super()._build_extra_state_attributes(),
+            "source": self._source,
+            **self._tracker.forecast(self.tariff_point.collection),
+        }
+
+
+class NorgesnettTotalPriceSensor(NorgesnettEntity, SensorEntity):
+    """Sensor med totalprisen: spotpris etter strømstøtte, nettleie og påslag.
+
+    Prisvektoren til spotprissensoren leses inn én gang når den endres, og
+    kombineres med nettleien til en ferdig vektor for de neste 48 timene.
+    Tilstanden slås opp i vektoren ved hver grense mellom periodene.
+    """
+
+    _attr_native_unit_of_measurement = "NOK/kWh"
+    _attr_state_class = "measurement"
+    _unrecorded_attributes = frozenset({"prices"})
+
+    def __init__(
+        self,
+        coordinator,
+        config_entry,
+        source: str,
+        formula: TotalPriceFormula,
+        meteringpoint_id=None,
+    ):
+        super().__init__(coordinator, config_entry, meteringpoint_id)
+        self._source = source
+        self._formula = formula
+        self._spot = PriceIndex([])
+        self._total = PriceIndex([])
+        self._boundaries = BoundaryScheduler(
+            coordinator.hass, lambda when: self._total.next_boundary(when)
+        )
+        self._attr_name = f"{self.name_prefix} Total Price"
+        self._attr_unique_id = f"{self.unique_id_prefix}_total_price"
+
+    async def async_added_to_hass(self):
+        """Les spotprisene og følg spotprissensoren."""
+        await super().async_added_to_hass()
+        self._spot = spot_price_index(self.hass.states.get(self._source), now())
+        self._update_total()
+        self.async_on_remove(
+            async_track_state_change_event(
+                self.hass, [self._source], self._async_source_changed
             )
-            if not hours or not isinstance(hours, list):
-                _LOGGER.debug("CurrentPrice: ingen timer i data")
-                return None
-            current = now()
-            current_hour = current.hour
-            next_hour = (current_hour + 1) % 24
-            short_name = f"{current_hour:02d}-{next_hour:02d}"
-            for hour in hours:
-                if hour.get("shortName") == short_name:
-                    energy = hour.get("energyPrice") or {}
-                    return energy.get("total")
-            _LOGGER.debug(f"CurrentPrice: ingen match for shortName {short_name}")
-            return None
-        except Exception as e:
-            _LOGGER.error(f"NorgesnettCurrentPriceSensor: Exception getting state: {e}")
-            return None
+        )
+        self.async_on_remove(self._boundaries.async_add_listener(self._async_boundary))
+
+    def _update_total(self) -> None:
+        """Combine the spot and grid vectors from the start of today."""
+        self._total = self._formula.combine(
+            self.tariff_point.prices,
+            self._spot,
+            start_of_local_day(),
+            timedelta(hours=TOTAL_PRICE_HOURS),
+        )
+        self._attributes = None
+        self._boundaries.async_rearm()
+
+    @callback
+    def _async_source_changed(self, event) -> None:
+        """Read the new spot prices."""
+        self._spot = spot_price_index(event.data.get("new_state"), now())
+        self._update_total()
+        self.async_write_ha_state()
+
+    @callback
+    def _async_boundary(self) -> None:
+        """Show the price of the period that started."""
+        self._attributes = None
+        self.async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Combine the spot prices with the new tariffs."""
+        self._update_total()
+        super()._handle_coordinator_update()
+
+    @property
+    def icon(self):
+        return ICON
+
+    @property
+    def native_value(self):
+        """Return the total price of the current period."""
+        return self._total.price_at(now())
+
+    def _build_extra_state_attributes(self):
+        """Return the common attributes, the parts of the price and the vector."""
+        when = now()
+        return {
+            **super()._build_extra_state_attributes(),
+            "source": self._source,
+            "spot_price": self._spot.price_at(when),
+            "grid_price": self.tariff_point.prices.price_at(when),
+            "prices": self._total.as_list(),
+        }
@@ -0,0 +1,299 @@
+"""Services for Norgesnett."""
+
+from datetime import datetime
+from typing import Optional
+
+import voluptuous as vol
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .api import split_meteringpoint_ids
+from .const import CONF_METERINGPOINT_ID, DOMAIN
+from .cost import grid_cost
+from .optimizer import (
+    Load,
+    candidate_periods,
+    cheapest_periods,
+    cheapest_window,
+    periods_for,
+    plan_loads,
+)
+from .statistics import async_consumption_and_prices
+
+SERVICE_GET_PRICES = "get_prices"
+SERVICE_FIND_CHEAPEST = "find_cheapest"
+SERVICE_PLAN_LOADS = "plan_loads"
+SERVICE_CALCULATE_COST = "calculate_cost"
+SERVICE_GET_HISTORY = "get_history"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_CONSUMPTION_SENSOR = "consumption_sensor"
+ATTR_CONTIGUOUS = "contiguous"
+ATTR_DEADLINE = "deadline"
+ATTR_DURATION = "duration"
+ATTR_END = "end"
+ATTR_LOADS = "loads"
+ATTR_NAME = "name"
+ATTR_POWER = "power"
+ATTR_POWER_CAP = "power_cap"
+ATTR_START = "start"
+
+GET_PRICES_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+        vol.Optional(CONF_METERINGPOINT_ID): cv.string,
+    }
+)
+
+FIND_CHEAPEST_SCHEMA = GET_PRICES_SCHEMA.extend(
+    {
+        vol.Required(ATTR_DURATION): cv.positive_time_period,
+        vol.Optional(ATTR_DEADLINE): cv.datetime,
+        vol.Optional(ATTR_CONTIGUOUS, default=True): cv.boolean,
+    }
+)
+
+LOAD_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_NAME): cv.string,
+        vol.Required(ATTR_DURATION): cv.positive_time_period,
+        vol.Required(ATTR_POWER): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        vol.Optional(ATTR_DEADLINE): cv.datetime,
+    }
+)
+
+PLAN_LOADS_SCHEMA = GET_PRICES_SCHEMA.extend(
+    {
+        vol.Required(ATTR_LOADS): vol.All(cv.ensure_list, [LOAD_SCHEMA]),
+        vol.Optional(ATTR_POWER_CAP): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    }
+)
+
+CALCULATE_COST_SCHEMA = GET_PRICES_SCHEMA.extend(
+    {
+        vol.Required(ATTR_CONSUMPTION_SENSOR): cv.entity_id,
+        vol.Required(ATTR_START): cv.datetime,
+        vol.Optional(ATTR_END): cv.datetime,
+    }
+)
+
+GET_HISTORY_SCHEMA = GET_PRICES_SCHEMA.extend(
+    {
+        vol.Required(ATTR_START): cv.datetime,
+        vol.Optional(ATTR_END): cv.datetime,
+    }
+)
+
+
+def _aware(when: Optional[datetime]) -> Optional[datetime]:
+    """Return ``when`` in the local time zone if it has no time zone."""
+    if when is not None and when.tzinfo is None:
+        return when.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return when
+
+
+def _entry_point(hass: HomeAssistant, call: ServiceCall):
+    """Return the coordinator of a call's entry and the metering point.
+
+    The metering point defaults to the entry's first one.
+    """
+    entry_id = call.data[ATTR_CONFIG_ENTRY_ID]
+    coordinator = hass.data.get(DOMAIN, {}).get(entry_id)
+    entry = hass.config_entries.async_get_entry(entry_id)
+    if coordinator is None or entry is None:
+        raise HomeAssistantError(f"Norgesnett entry {entry_id} is not loaded")
+
+    meteringpoint_ids = split_meteringpoint_ids(entry.data.get(CONF_METERINGPOINT_ID))
+    meteringpoint_id = call.data.get(CONF_METERINGPOINT_ID, meteringpoint_ids[0])
+    if meteringpoint_id not in meteringpoint_ids:
+        raise HomeAssistantError(
+            f"Metering point {meteringpoint_id} is not part of entry {entry_id}"
+        )
+    return coordinator, meteringpoint_id
+
+
+def _point_tariff(hass: HomeAssistant, call: ServiceCall):
+    """Return the metering point of a call and its parsed tariff."""
+    coordinator, meteringpoint_id = _entry_point(hass, call)
+    return meteringpoint_id, coordinator.tariff.point(meteringpoint_id)
+
+
+async def async_get_prices(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Return every period with its price for a metering point of an entry."""
+    meteringpoint_id, point = _point_tariff(hass, call)
+    return {
+        "meteringpoint_id": meteringpoint_id,
+        "prices": point.prices.as_list(),
+    }
+
+
+async def async_find_cheapest(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Return the cheapest periods covering ``duration`` before ``deadline``.
+
+    The periods are back-to-back unless ``contiguous`` is false. The window
+    is None if not enough periods are known.
+    """
+    meteringpoint_id, point = _point_tariff(hass, call)
+    deadline = _aware(call.data.get(ATTR_DEADLINE))
+    periods = candidate_periods(point.prices, dt_util.now(), deadline)
+    count = periods_for(call.data[ATTR_DURATION], periods)
+    find = cheapest_window if call.data[ATTR_CONTIGUOUS] else cheapest_periods
+    window = find(periods, count)
+    return {
+        "meteringpoint_id": meteringpoint_id,
+        "window": window.as_dict() if window else None,
+    }
+
+
+async def async_plan_loads(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Place several loads in the cheapest periods under a power cap.
+
+    ``power_cap`` defaults to the upper limit of the metering point's
+    current capacity level, so the plan does not move it up a level.
+    """
+    meteringpoint_id, point = _point_tariff(hass, call)
+    power_cap = call.data.get(
+        ATTR_POWER_CAP,
+        point.fixed_price_attributes["currentFixedPriceLevel"]["value_max"],
+    )
+    periods = candidate_periods(point.prices, dt_util.now())
+    loads = []
+    for load in call.data[ATTR_LOADS]:
+        deadline = _aware(load.get(ATTR_DEADLINE))
+        loads.append(
+            Load(
+                load[ATTR_NAME],
+                periods_for(load[ATTR_DURATION], periods),
+                load[ATTR_POWER],
+                deadline.timestamp() if deadline else None,
+            )
+        )
+    plan = plan_loads(periods, loads, power_cap)
+    return {
+        "meteringpoint_id": meteringpoint_id,
+        "power_cap": power_cap,
+        "loads": [
+            {
+                "name": load.name,
+                "window": window.as_dict() if window else None,
+                "cost": window.cost(load.power) if window else None,
+            }
+            for load, window in zip(loads, plan)
+        ],
+    }
+
+
+async def async_calculate_cost(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Return what the grid rent of a consumption sensor came to.
+
+    The sensor's hourly statistics are priced with the imported tariff
+    statistics, and the current tariffs for the hours after them. The
+    fixed cost of each month follows the level its own peaks fall in,
+    with today's price levels.
+    """
+    meteringpoint_id, point = _point_tariff(hass, call)
+    if "recorder" not in hass.config.components:
+        raise HomeAssistantError("The recorder is needed to calculate costs")
+    start = _aware(call.data[ATTR_START])
+    end = _aware(call.data.get(ATTR_END)) or dt_util.now()
+    consumption, prices = await async_consumption_and_prices(
+        hass, call.data[ATTR_CONSUMPTION_SENSOR], meteringpoint_id, start, end
+    )
+    imported_until = prices[-1][1] if prices else start.timestamp()
+    prices += [
+        period for period in point.prices.periods() if period[0] >= imported_until
+    ]
+    cost = await hass.async_add_executor_job(
+        grid_cost, consumption, prices, point.collection, start, end
+    )
+    return {
+        "meteringpoint_id": meteringpoint_id,
+        "start": dt_util.as_local(start).isoformat(),
+        "end": dt_util.as_local(end).isoformat(),
+        **cost,
+    }
+
+
+async def async_get_history(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Return the daily prices and level changes stored for a metering point."""
+    coordinator, meteringpoint_id = _entry_point(hass, call)
+    if coordinator.history is None:
+        raise HomeAssistantError("Norgesnett has no tariff history")
+    start = _aware(call.data[ATTR_START])
+    end = _aware(call.data.get(ATTR_END)) or dt_util.now()
+    return {
+        "meteringpoint_id": meteringpoint_id,
+        "daily": await coordinator.history.async_daily(meteringpoint_id, start, end),
+        "level_changes": await coordinator.history.async_level_changes(
+            meteringpoint_id, start, end
+        ),
+    }
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the Norgesnett services."""
+
+    async def get_prices(call: ServiceCall) -> ServiceResponse:
+        return await async_get_prices(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_PRICES,
+        get_prices,
+        schema=GET_PRICES_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def find_cheapest(call: ServiceCall) -> ServiceResponse:
+        return await async_find_cheapest(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_FIND_CHEAPEST,
+        find_cheapest,
+        schema=FIND_CHEAPEST_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def plan_loads(call: ServiceCall) -> ServiceResponse:
+        return await async_plan_loads(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PLAN_LOADS,
+        plan_loads,
+        schema=PLAN_LOADS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def calculate_cost(call: ServiceCall) -> ServiceResponse:
+        return await async_calculate_cost(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_CALCULATE_COST,
+        calculate_cost,
+        schema=CALCULATE_COST_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def get_history(call: ServiceCall) -> ServiceResponse:
+        return await async_get_history(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_HISTORY,
+        get_history,
+        schema=GET_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
@@ -0,0 +1,171 @@
+"""Long-term statistics of the Norgesnett tariffs."""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+    statistics_during_period,
+)
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+from homeassistant.util import slugify
+
+from .const import DOMAIN
+from .cost import Period
+from .history import TariffHistory
+from .model import PriceIndex, TariffData
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+STATISTIC_UNIT = "NOK/kWh"
+# Longest gap in the statistics that is filled from the tariff history
+BACKFILL_MAX_DAYS = 31
+
+
+def statistic_id(meteringpoint_id: str) -> str:
+    """Return the id of the energy price statistics of a metering point."""
+    return f"{DOMAIN}:energy_price_{slugify(meteringpoint_id)}"
+
+
+def hourly_statistics(prices: PriceIndex) -> list[StatisticData]:
+    """Return the mean, min and max price of every hour in ``prices``."""
+    return [
+        StatisticData(start=start, mean=mean, min=low, max=high)
+        for start, mean, low, high in prices.hourly()
+    ]
+
+
+async def async_last_imported(hass: HomeAssistant, meteringpoint_id: str):
+    """Return the start of the last imported hour of a metering point."""
+    statistic = statistic_id(meteringpoint_id)
+    last = await get_instance(hass).async_add_executor_job(
+        get_last_statistics, hass, 1, statistic, False, {"mean"}
+    )
+    rows = last.get(statistic)
+    if not rows:
+        return None
+    return dt_util.utc_from_timestamp(rows[0]["start"])
+
+
+async def async_consumption_and_prices(
+    hass: HomeAssistant,
+    consumption_id: str,
+    meteringpoint_id: str,
+    start: datetime,
+    end: datetime,
+) -> tuple[list[Period], list[Period]]:
+    """Return the hourly consumption in kWh and prices between two times.
+
+    Both come from one query of the long-term statistics: the hourly change
+    of ``consumption_id`` and the imported prices of the metering point.
+    """
+    prices_id = statistic_id(meteringpoint_id)
+    rows = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start,
+        end,
+        {consumption_id, prices_id},
+        "hour",
+        {"energy": UnitOfEnergy.KILO_WATT_HOUR},
+        {"change", "mean"},
+    )
+    return (
+        [
+            (row["start"], row["end"], row.get("change"))
+            for row in rows.get(consumption_id, [])
+        ],
+        [
+            (row["start"], row["end"], row.get("mean"))
+            for row in rows.get(prices_id, [])
+        ],
+    )
+
+
+async def async_import_statistics(
+    hass: HomeAssistant, history: Optional[TariffHistory], tariff: TariffData
+) -> None:
+    """Write the hourly prices of every metering point as external statistics.
+
+    If hours are missing between the last imported hour and the new
+    tariffs, e.g. after downtime, they are read from ``history`` first,
+    going back at most ``BACKFILL_MAX_DAYS``. Days missing from the history
+    too are fetched by the history backfill, which imports them when they
+    arrive.
+    """
+    if "recorder" not in hass.config.components:
+        return
+    for meteringpoint_id, point in tariff.points.items():
+        if meteringpoint_id is None:
+            continue
+        statistics = hourly_statistics(point.prices)
+        if not statistics:
+            continue
+        last = await async_last_imported(hass, meteringpoint_id)
+        if last is not None and history is not None:
+            statistics = (
+                await _async_backfill(
+                    history, meteringpoint_id, last + timedelta(hours=1), point.prices
+                )
+                + statistics
+            )
+        _add_statistics(hass, meteringpoint_id, statistics)
+
+
+async def async_import_prices(
+    hass: HomeAssistant, meteringpoint_id: str, prices: PriceIndex
+) -> None:
+    """Write the hourly prices of one metering point as external statistics."""
+    if "recorder" not in hass.config.components:
+        return
+    statistics = hourly_statistics(prices)
+    if statistics:
+        _add_statistics(hass, meteringpoint_id, statistics)
+
+
+def _add_statistics(
+    hass: HomeAssistant, meteringpoint_id: str, statistics: list[StatisticData]
+) -> None:
+    """Write ``statistics`` of a metering point in one batched call.
+
+    The recorder replaces hours it already has, so importing the same
+    prices again changes nothing.
+    """
+    async_add_external_statistics(
+        hass,
+        StatisticMetaData(
+            has_mean=True,
+            has_sum=False,
+            name=f"Norgesnett {meteringpoint_id} energy price",
+            source=DOMAIN,
+            statistic_id=statistic_id(meteringpoint_id),
+            unit_of_measurement=STATISTIC_UNIT,
+        ),
+        statistics,
+    )
+
+
+async def _async_backfill(
+    history: TariffHistory,
+    meteringpoint_id: str,
+    start: datetime,
+    prices: PriceIndex,
+) -> list[StatisticData]:
+    """Return the statistics of the stored hours from ``start`` to ``prices``."""
+    end: Optional[datetime] = prices.start
+    if end is None or start >= end:
+        return []
+    start = max(start, end - timedelta(days=BACKFILL_MAX_DAYS))
+    _LOGGER.debug("Norgesnett: leser manglende priser %s - %s", start, end)
+    missing = PriceIndex(await history.async_periods(meteringpoint_id, start, end))
+    return [
+        statistic
+        for statistic in hourly_statistics(missing)
+        if start <= statistic["start"] < end
+    ]
@@ -1,9 +1,11 @@
 """Global fixtures for Norgesnett integration."""
 
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
+from custom_components.norgesnett.api import API_KEY_CACHE
+
 pytest_plugins = "pytest_homeassistant_custom_component"
 
 
@@ -14,6 +16,37 @@ def auto_enable_custom_integrations(enable_custom_integrations):
     yield
 
 
+# The apiKey cache is process-wide, so clear it to keep tests independent.
+@pytest.fixture(autouse=True)
+def clear_api_key_cache():
+    """Start every test with an empty apiKey cache."""
+    API_KEY_CACHE.clear()
+    yield
+    API_KEY_CACHE.clear()
+
+
+# Keep the tariff history database out of the test config dir.
+@pytest.fixture(autouse=True)
+def history_file(tmp_path):
+    """Write the tariff history to a temporary file."""
+    with patch(
+        "custom_components.norgesnett.HISTORY_FILE", str(tmp_path / "history.db")
+    ):
+        yield
+
+
+# Setting up an entry starts a history backfill from the API, which most
+# tests do not mock.
+@pytest.fixture(name="skip_backfill", autouse=True)
+def skip_backfill_fixture():
+    """Skip the history backfill."""
+    with patch(
+        "custom_components.norgesnett.backfill.HistoryBackfill.async_run",
+        AsyncMock(),
+    ) as run:
+        yield run
+
+
 # This fixture is used to prevent HomeAssistant from attempting to create and dismiss persistent
 # notifications. These calls would fail without this fixture since the persistent_notification
 # integration is never loaded during a test.
@@ -34,7 +67,10 @@ def bypass_get_data_fixture():
         "gridTariffCollections": [
             {
                 "meteringPointsAndPriceLevels": [
-                    {"currentFixedPriceLevel": {"id": "test_level"}}
+                    {
+                        "meteringPointId": "test_meteringpoint_id",
+                        "currentFixedPriceLevel": {"id": "test_level"},
+                    }
                 ],
                 "gridTariff": {
                     "tariffPrice": {
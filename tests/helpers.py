@@ -0,0 +1,31 @@
+"""Builders shared by the tests of the tariff calculations."""
+
+from datetime import datetime
+
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.model import TariffCollection
+
+
+def local_day(year: int, month: int, day: int) -> datetime:
+    """Return the local start of a day."""
+    return datetime(year, month, day, tzinfo=dt_util.DEFAULT_TIME_ZONE)
+
+
+def make_periods(values: list, start: float = 0.0, length: float = 3600.0) -> list:
+    """Return back-to-back ``(start, end, value)`` periods of ``length`` seconds."""
+    return [
+        (start + index * length, start + (index + 1) * length, value)
+        for index, value in enumerate(values)
+    ]
+
+
+def tariff_collection(levels: list[dict]) -> TariffCollection:
+    """Return a tariff collection with the fixed price ``levels``."""
+    return TariffCollection(
+        {
+            "gridTariff": {
+                "tariffPrice": {"priceInfo": {"fixedPrices": [{"priceLevels": levels}]}}
+            }
+        }
+    )
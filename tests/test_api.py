@@ -2,13 +2,21 @@
 
 import asyncio
 import logging
+from datetime import timedelta
+from email.utils import format_datetime
+from unittest.mock import AsyncMock, patch
 
 import aiohttp
 import pytest
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.util import dt as dt_util
 
 import custom_components.norgesnett.api as api_module
-from custom_components.norgesnett.api import NorgesnettApiClient
+from custom_components.norgesnett.api import (
+    NorgesnettApiClient,
+    RetryPolicy,
+    retry_after,
+)
 
 # Monkeypatch API URLs to use JSONPlaceholder for testing
 api_module.API_AUTH_URL = "https://jsonplaceholder.typicode.com/auth"
@@ -60,6 +68,15 @@ async def test_async_get_data(hass, aioclient_mock, caplog):
     tariffs = await api.async_get_data()
     assert tariffs == {"tariffs": "test_tariff_data"}
 
+    # Today's and tomorrow's tariffs are requested together
+    request = aioclient_mock.mock_calls[-1][2]
+    day = dt_util.start_of_local_day()
+    assert request["startTime"] == day.isoformat()
+    assert dt_util.parse_datetime(request["endTime"]) == dt_util.start_of_local_day(
+        day.date() + timedelta(days=2)
+    )
+    assert request["meteringPointIds"] == ["test_meteringpoint"]
+
     # Test logging of the api_wrapper calls
     assert f"api_wrapper: post {api_module.API_AUTH_URL}" in caplog.text
     assert f"api_wrapper: post {api_module.API_TARIFFS_URL}" in caplog.text
@@ -168,6 +185,88 @@ async def test_api_set_and_exceptions(hass, aioclient_mock, caplog):
     )
 
 
+def _response_error(status: int, headers=None) -> aiohttp.ClientResponseError:
+    """Return the error raised for a response with ``status``."""
+    return aiohttp.ClientResponseError(None, (), status=status, headers=headers)
+
+
+def test_retry_policy_classifies_errors():
+    """Test transient failures are retried and client errors are not."""
+    for exception in (
+        asyncio.TimeoutError(),
+        aiohttp.ClientConnectionError(),
+        _response_error(408),
+        _response_error(429),
+        _response_error(500),
+        _response_error(503),
+    ):
+        assert RetryPolicy.is_retryable(exception)
+    for exception in (
+        _response_error(400),
+        _response_error(401),
+        _response_error(404),
+        KeyError(),
+    ):
+        assert not RetryPolicy.is_retryable(exception)
+
+
+def test_retry_after():
+    """Test Retry-After is read as seconds or as an HTTP date."""
+    assert retry_after(_response_error(429)) is None
+    assert retry_after(_response_error(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(_response_error(429, {"Retry-After": "-3"})) == 0.0
+    assert retry_after(_response_error(429, {"Retry-After": "soon"})) is None
+    when = format_datetime(dt_util.utcnow() + timedelta(seconds=30), usegmt=True)
+    assert 28 < retry_after(_response_error(503, {"Retry-After": when})) <= 30
+
+
+def test_retry_policy_delay_uses_decorrelated_jitter():
+    """Test waits grow randomly from the previous one up to the cap."""
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    with patch("custom_components.norgesnett.api.random.uniform") as uniform:
+        uniform.side_effect = lambda low, high: high
+        assert policy.delay(1.0, asyncio.TimeoutError()) == 3.0
+        uniform.assert_called_with(1.0, 3.0)
+        assert policy.delay(3.0, asyncio.TimeoutError()) == 5.0
+        uniform.side_effect = lambda low, high: low
+        assert policy.delay(4.0, _response_error(500)) == 1.0
+    # The server's Retry-After wins over the jitter
+    assert policy.delay(1.0, _response_error(429, {"Retry-After": "2"})) == 2.0
+
+
+async def test_api_wrapper_does_not_retry_client_errors(hass, aioclient_mock):
+    """Test a 404 is raised after a single request."""
+    api = NorgesnettApiClient("test", "test", async_get_clientsession(hass))
+    url = "https://jsonplaceholder.typicode.com/missing"
+    aioclient_mock.get(url, status=404)
+
+    with patch("custom_components.norgesnett.api.asyncio.sleep", AsyncMock()):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await api.api_wrapper("get", url)
+    assert aioclient_mock.call_count == 1
+
+
+async def test_api_wrapper_retries_within_the_deadline(hass, aioclient_mock):
+    """Test retries honour Retry-After and stop at the overall deadline."""
+    api = NorgesnettApiClient("test", "test", async_get_clientsession(hass))
+    url = "https://jsonplaceholder.typicode.com/busy"
+    aioclient_mock.get(url, status=429, headers={"Retry-After": "2"})
+
+    with patch("custom_components.norgesnett.api.asyncio.sleep", AsyncMock()) as sleep:
+        with pytest.raises(aiohttp.ClientResponseError):
+            await api.api_wrapper("get", url)
+        assert aioclient_mock.call_count == 3
+        assert sleep.await_count == 2
+        sleep.assert_awaited_with(2.0)
+
+        # No wait is started that would end after the deadline
+        sleep.reset_mock()
+        with pytest.raises(aiohttp.ClientResponseError):
+            await api.api_wrapper("get", url, policy=RetryPolicy(deadline=1.0))
+        assert aioclient_mock.call_count == 4
+        sleep.assert_not_awaited()
+
+
 async def test_async_set_title_calls_patch(hass, aioclient_mock):
     """Test async_set_title sends PATCH request with expected payload."""
     api = NorgesnettApiClient("test", "test", async_get_clientsession(hass))
@@ -177,3 +276,177 @@ async def test_async_set_title_calls_patch(hass, aioclient_mock):
     )
 
     await api.async_set_title("updated")
+
+
+async def test_async_get_data_reuses_cached_api_key(hass, aioclient_mock):
+    """Test the apiKey is fetched once and shared between client instances."""
+    session = async_get_clientsession(hass)
+    aioclient_mock.post(api_module.API_AUTH_URL, json={"apiKey": "cached_key"})
+    aioclient_mock.post(api_module.API_TARIFFS_URL, json={"tariffs": "data"})
+
+    first = NorgesnettApiClient("test_customer", "test_meteringpoint", session)
+    second = NorgesnettApiClient("test_customer", "test_meteringpoint", session)
+
+    assert await first.async_get_data() == {"tariffs": "data"}
+    assert await second.async_get_data() == {"tariffs": "data"}
+
+    auth_calls = [c for c in aioclient_mock.mock_calls if "auth" in str(c[1])]
+    assert len(auth_calls) == 1
+    assert aioclient_mock.mock_calls[-1][3]["X-API-Key"] == "cached_key"
+
+
+def test_api_key_cache_expiry_and_invalidate(monkeypatch):
+    """Test cached apiKeys expire after the TTL and can be invalidated."""
+    clock = [1000.0]
+    monkeypatch.setattr(api_module.time, "monotonic", lambda: clock[0])
+    cache = api_module.ApiKeyCache(ttl=10)
+    key = ("customer", "meteringpoint")
+
+    assert cache.get(key) is None
+    cache.set(key, "abc")
+    assert cache.get(key) == "abc"
+
+    clock[0] += 10
+    assert cache.get(key) is None
+
+    cache.set(key, "def")
+    cache.invalidate(key)
+    assert cache.get(key) is None
+
+
+async def test_async_get_data_reauthenticates_on_401(hass, aioclient_mock):
+    """Test a rejected apiKey is invalidated and the request retried once."""
+    api = NorgesnettApiClient(
+        "test_customer", "test_meteringpoint", async_get_clientsession(hass)
+    )
+    api_module.API_KEY_CACHE.set(api.cache_key, "stale_key")
+
+    calls = []
+    deadlines = []
+
+    async def fake_get_tariffs(api_key, meteringpoint_ids, start, end, policy):
+        calls.append(api_key)
+        deadlines.append(policy.deadline)
+        if api_key == "stale_key":
+            raise aiohttp.ClientResponseError(None, (), status=401)
+        return {"tariffs": api_key}
+
+    aioclient_mock.post(api_module.API_AUTH_URL, json={"apiKey": "fresh_key"})
+    api._async_get_tariffs = fake_get_tariffs
+
+    assert await api.async_get_data() == {"tariffs": "fresh_key"}
+    assert calls == ["stale_key", "fresh_key"]
+    assert api_module.API_KEY_CACHE.get(api.cache_key) == "fresh_key"
+    # The retry gets what is left of the call's deadline, not a new one
+    assert api_module.TIMEOUT >= deadlines[0] >= deadlines[1]
+
+
+async def test_async_fetch_tariffs_shares_one_deadline(hass, aioclient_mock):
+    """Test requests of a call get no budget once its deadline has passed."""
+    api = NorgesnettApiClient("customer", "mp1", async_get_clientsession(hass))
+    aioclient_mock.post(api_module.API_AUTH_URL, json={"apiKey": "key"})
+    aioclient_mock.post(api_module.API_TARIFFS_URL, json={"tariffs": True})
+
+    assert await api.async_fetch_tariffs(["mp1"]) == {"tariffs": True}
+    expired = asyncio.get_running_loop().time() - 1
+    assert RetryPolicy().until(expired).deadline == 0.0
+    with pytest.raises(asyncio.TimeoutError):
+        await api.async_fetch_tariffs(["mp2"], expires=expired)
+    assert aioclient_mock.call_count == 2
+
+
+async def test_async_get_data_raises_non_auth_errors(hass):
+    """Test response errors other than 401/403 are not retried with a new key."""
+    api = NorgesnettApiClient(
+        "test_customer", "test_meteringpoint", async_get_clientsession(hass)
+    )
+    api_module.API_KEY_CACHE.set(api.cache_key, "key")
+
+    async def fake_get_tariffs(api_key, meteringpoint_ids, start, end, policy):
+        raise aiohttp.ClientResponseError(None, (), status=500)
+
+    api._async_get_tariffs = fake_get_tariffs
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        await api.async_get_data()
+    assert api_module.API_KEY_CACHE.get(api.cache_key) == "key"
+
+
+def _batched_response(meteringpoint_ids):
+    """Build a tariff response with one collection per metering point."""
+    return {
+        "gridTariffCollections": [
+            {
+                "meteringPointsAndPriceLevels": [{"meteringPointId": mp_id}],
+                "gridTariff": {"tariffKey": mp_id},
+            }
+            for mp_id in meteringpoint_ids
+        ]
+    }
+
+
+async def test_api_wrapper_coalesces_concurrent_identical_requests(
+    hass, aioclient_mock, caplog
+):
+    """Test identical concurrent requests share one HTTP call."""
+    caplog.set_level(logging.DEBUG)
+    api_module.REQUEST_COALESCER.reset()
+    session = async_get_clientsession(hass)
+    first = NorgesnettApiClient("customer", "mp1", session)
+    second = NorgesnettApiClient("customer", "mp2", session)
+    url = "https://jsonplaceholder.typicode.com/coalesce"
+    aioclient_mock.post(url, json={"shared": True})
+
+    results = await asyncio.gather(
+        first.api_wrapper("post", url, data={"a": 1, "b": [2]}),
+        second.api_wrapper("post", url, data={"b": [2], "a": 1}),
+        first.api_wrapper("post", url, data={"a": 2}),
+    )
+
+    assert results == [{"shared": True}] * 3
+    assert aioclient_mock.call_count == 2
+    assert api_module.REQUEST_COALESCER.calls == 3
+    assert api_module.REQUEST_COALESCER.coalesced == 1
+    assert "1 of 2 requests coalesced so far" in caplog.text
+
+    # Finished requests are no longer shared.
+    await first.api_wrapper("post", url, data={"a": 1, "b": [2]})
+    assert aioclient_mock.call_count == 3
+
+
+def test_split_meteringpoint_ids():
+    """Test comma separated metering point ids are split and trimmed."""
+    assert api_module.split_meteringpoint_ids("mp1, mp2 ,,mp3") == [
+        "mp1",
+        "mp2",
+        "mp3",
+    ]
+    assert api_module.split_meteringpoint_ids("mp1") == ["mp1"]
+    assert api_module.split_meteringpoint_ids(None) == []
+
+
+async def test_hub_client_merges_chunked_responses(hass, monkeypatch):
+    """Test all points are fetched in chunks and the collections merged."""
+    monkeypatch.setattr(api_module, "BATCH_SIZE", 2)
+    ids = ["mp1", "mp2", "mp3"]
+    api = NorgesnettApiClient(
+        "customer", "mp1", async_get_clientsession(hass), meteringpoint_ids=ids
+    )
+    requests = []
+    first = _batched_response(["mp1", "mp2"])
+
+    async def fetch(meteringpoint_ids, expires):
+        requests.append(list(meteringpoint_ids))
+        if meteringpoint_ids == ["mp1", "mp2"]:
+            return first
+        return _batched_response(meteringpoint_ids)
+
+    api.async_fetch_tariffs = fetch
+
+    tariffs = await api.async_get_data()
+
+    assert requests == [["mp1", "mp2"], ["mp3"]]
+    collections = tariffs["gridTariffCollections"]
+    assert [c["gridTariff"]["tariffKey"] for c in collections] == ids
+    # The first chunk may be shared with other callers and is left untouched
+    assert len(first["gridTariffCollections"]) == 2
@@ -0,0 +1,179 @@
+"""Tests for the Norgesnett history backfill."""
+
+import asyncio
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.backfill import (
+    HistoryBackfill,
+    TokenBucket,
+    request_windows,
+)
+from custom_components.norgesnett.const import BACKFILL_STORAGE_KEY
+from custom_components.norgesnett.history import TariffHistory
+
+
+# Replace the autouse fixture, these tests run the backfill.
+@pytest.fixture(name="skip_backfill")
+def skip_backfill_fixture():
+    """Run the history backfill."""
+    yield
+
+
+class FakeClient:
+    """Return an hourly tariff of price 1.0 for every requested range."""
+
+    def __init__(self, fail: int = 0) -> None:
+        """Initialize, failing the first ``fail`` requests."""
+        self.fail = fail
+        self.requests: list[tuple] = []
+        self.active = self.most_active = 0
+
+    async def async_fetch_tariffs(self, meteringpoint_ids, start, end) -> dict:
+        """Return the tariff of the only metering point between two times."""
+        self.requests.append((meteringpoint_ids[0], start, end))
+        self.active += 1
+        self.most_active = max(self.most_active, self.active)
+        await asyncio.sleep(0)
+        self.active -= 1
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("boom")
+        hours = []
+        time = start
+        while time < end:
+            hours.append(
+                {
+                    "startTime": time.isoformat(),
+                    "expiredAt": (time + timedelta(hours=1)).isoformat(),
+                    "energyPrice": {"total": 1.0},
+                }
+            )
+            time += timedelta(hours=1)
+        return {
+            "gridTariffCollections": [
+                {
+                    "meteringPointsAndPriceLevels": [
+                        {"meteringPointId": meteringpoint_ids[0]}
+                    ],
+                    "gridTariff": {"tariffPrice": {"hours": hours}},
+                }
+            ]
+        }
+
+
+def _limiter() -> TokenBucket:
+    """Return a limiter that never waits."""
+    return TokenBucket(1000.0, 1000.0)
+
+
+async def test_token_bucket_waits_for_tokens():
+    """Test taking more tokens than there are waits for the refill."""
+    bucket = TokenBucket(2.0, 2.0)
+    with patch(
+        "custom_components.norgesnett.backfill.time.monotonic", return_value=10.0
+    ) as monotonic, patch(
+        "custom_components.norgesnett.backfill.asyncio.sleep", AsyncMock()
+    ) as sleep:
+        await bucket.async_acquire()
+        await bucket.async_acquire()
+        sleep.assert_not_awaited()
+        await bucket.async_acquire()
+        sleep.assert_awaited_once_with(0.5)
+
+        # Tokens refill over time, up to the capacity
+        monotonic.return_value = 100.0
+        sleep.reset_mock()
+        await bucket.async_acquire()
+        await bucket.async_acquire()
+        sleep.assert_not_awaited()
+
+        bucket.clear()
+        await bucket.async_acquire()
+        sleep.assert_not_awaited()
+
+
+def test_request_windows():
+    """Test consecutive days are grouped into windows of limited size."""
+    days = [date(2024, 3, day) for day in (1, 2, 3, 5, 6, 7, 8, 9, 12)]
+    assert request_windows(days, 3) == [
+        (date(2024, 3, 1), date(2024, 3, 4)),
+        (date(2024, 3, 5), date(2024, 3, 8)),
+        (date(2024, 3, 8), date(2024, 3, 10)),
+        (date(2024, 3, 12), date(2024, 3, 13)),
+    ]
+    assert request_windows([], 3) == []
+
+
+async def test_backfill_fetches_missing_days(hass, hass_storage, tmp_path):
+    """Test missing days are fetched by a bounded pool and checkpointed."""
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    today = dt_util.now().date()
+    # The day before yesterday is already stored
+    stored = dt_util.start_of_local_day(today - timedelta(days=2))
+    await history.async_append(
+        "mp1", [(stored.timestamp(), stored.timestamp() + 3600, 2.0)]
+    )
+    client = FakeClient()
+    backfill = HistoryBackfill(hass, history, concurrency=2, limiter=_limiter())
+
+    await backfill.async_run(client, ["mp1", "mp2"], days=20)
+    await hass.async_block_till_done()
+
+    # Windows of at most seven days: 18 + 1 days for mp1 and 20 for mp2
+    assert len(client.requests) == 3 + 1 + 3
+    assert client.most_active == 2
+    first = dt_util.start_of_local_day(today - timedelta(days=20))
+    end = dt_util.start_of_local_day(today)
+    days = await history.async_days("mp2", first, end)
+    assert len(days) == 20
+    assert await history.async_days("mp1", first, end) == days
+    assert (await history.async_periods("mp1", stored, stored + timedelta(hours=1)))[0][
+        2
+    ] == 2.0
+    checkpoint = hass_storage[BACKFILL_STORAGE_KEY]["data"]
+    assert len(checkpoint["mp1"]) == 19
+    assert len(checkpoint["mp2"]) == 20
+
+    # Nothing is left to fetch
+    client.requests.clear()
+    await backfill.async_run(client, ["mp1", "mp2"], days=20)
+    assert client.requests == []
+    await history.async_close()
+
+
+async def test_backfill_resumes_and_retries(hass, hass_storage, tmp_path, caplog):
+    """Test a failed window is fetched again and checkpointed days are not."""
+    today = dt_util.now().date()
+    hass_storage[BACKFILL_STORAGE_KEY] = {
+        "version": 1,
+        "key": BACKFILL_STORAGE_KEY,
+        "data": {
+            # Days the API had no tariff for, and one that is too old to keep
+            "mp1": [
+                (today - timedelta(days=30)).isoformat(),
+                (today - timedelta(days=1)).isoformat(),
+            ]
+        },
+    }
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    client = FakeClient(fail=1)
+    backfill = HistoryBackfill(hass, history, concurrency=3, limiter=_limiter())
+
+    await backfill.async_run(client, ["mp1"], days=3)
+    assert len(client.requests) == 1
+    assert client.requests[0][2] == dt_util.start_of_local_day(
+        today - timedelta(days=1)
+    )
+    assert "could not backfill mp1" in caplog.text
+
+    await backfill.async_run(client, ["mp1"], days=3)
+    await hass.async_block_till_done()
+    assert len(client.requests) == 2
+    assert hass_storage[BACKFILL_STORAGE_KEY]["data"]["mp1"] == sorted(
+        (today - timedelta(days=offset)).isoformat() for offset in (1, 2, 3)
+    )
+    await history.async_close()
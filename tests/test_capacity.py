@@ -0,0 +1,183 @@
+"""Tests for the Norgesnett capacity tier tracker."""
+
+from datetime import timedelta
+
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.capacity import CapacityTracker
+
+from .helpers import local_day, tariff_collection
+
+HOUR = timedelta(hours=1)
+MINUTE = timedelta(minutes=1)
+
+
+LEVELS = [
+    {"id": "high", "valueMin": 5, "valueMax": 10},
+    {"id": "low", "valueMin": 0, "valueMax": 2},
+    {"id": "mid", "valueMin": 2, "valueMax": 5},
+]
+
+
+def test_power_samples_are_integrated_per_hour():
+    """Test held power is integrated and split at hour boundaries."""
+    tracker = CapacityTracker()
+    start = local_day(2024, 1, 2)
+    tracker.add_power(start, 2.0)
+    tracker.add_power(start + HOUR / 2, 4.0)
+    assert tracker.hour_energy == 1.0
+
+    tracker.add_power(start + HOUR, 1.0)
+    assert tracker.hour == dt_util.as_utc(start + HOUR)
+    assert tracker.day_peak == 3.0
+    assert tracker.hour_energy == 0.0
+
+    tracker.add_power(start + 3.5 * HOUR, 0.0)
+    assert tracker.day_peak == 3.0
+    assert tracker.hour_energy == 0.5
+
+    # A late sample does not move the clock back
+    tracker.add_power(start, 6.0)
+    assert tracker.hour == dt_util.as_utc(start + 3 * HOUR)
+    assert tracker.today_peak == 3.0
+
+
+def test_unavailable_source_stops_integration():
+    """Test no energy is added while the source is unavailable."""
+    tracker = CapacityTracker()
+    start = local_day(2024, 1, 2)
+    tracker.add_power(start, 2.0)
+    tracker.add_power(start + HOUR / 4, None)
+    tracker.flush(start + HOUR / 2)
+    assert tracker.hour_energy == 0.5
+
+
+def test_energy_readings_are_spread_over_their_interval():
+    """Test meter increases are spread evenly and resets are skipped."""
+    tracker = CapacityTracker()
+    start = local_day(2024, 1, 2)
+    tracker.add_energy(start, 100.0)
+    tracker.add_energy(start, 100.0)
+    tracker.add_energy(start + HOUR, 102.0)
+    assert tracker.day_peak == 2.0
+
+    tracker.add_energy(start + 2.5 * HOUR, 106.5)
+    assert tracker.day_peak == 3.0
+    assert tracker.hour_energy == 1.5
+
+    tracker.add_energy(start + 3 * HOUR, 5.0)
+    assert tracker.day_peak == 3.0
+    assert tracker.hour_energy == 0.0
+    tracker.add_energy(start + 4 * HOUR, 6.0)
+    assert tracker.day_peak == 3.0
+
+
+def test_flush_between_energy_readings():
+    """Test the hourly flush leaves the interval to the next reading."""
+    tracker = CapacityTracker()
+    start = local_day(2024, 1, 2) + 9 * HOUR
+    tracker.add_energy(start + 50 * MINUTE, 100.0)
+    tracker.flush(start + HOUR)
+    assert tracker.hour == dt_util.as_utc(start)
+
+    tracker.add_energy(start + HOUR + 5 * MINUTE, 101.0)
+    assert tracker.hour == dt_util.as_utc(start + HOUR)
+    assert round(tracker.day_peak, 3) == 0.667
+    assert round(tracker.hour_energy, 3) == 0.333
+
+
+def test_top_peaks_keep_the_highest_days_of_the_month():
+    """Test only the three highest finished days are kept."""
+    tracker = CapacityTracker()
+    assert tracker.top_peaks() == []
+    assert tracker.average == 0.0
+
+    for day, kw in enumerate([1.0, 5.0, 3.0, 4.0, 2.0], start=1):
+        tracker.add_power(local_day(2024, 1, day), kw)
+        tracker.add_power(local_day(2024, 1, day) + HOUR, 0.0)
+    tracker.flush(local_day(2024, 1, 6))
+
+    assert sorted(tracker.peaks) == [
+        (3.0, "2024-01-03"),
+        (4.0, "2024-01-04"),
+        (5.0, "2024-01-02"),
+    ]
+    assert tracker.today_peak == 0.0
+    assert tracker.average == 4.0
+
+    # Today counts as soon as it is among the highest
+    tracker.add_power(local_day(2024, 1, 6), 6.0)
+    tracker.flush(local_day(2024, 1, 6) + HOUR / 2)
+    assert tracker.top_peaks() == [
+        (5.0, "2024-01-02"),
+        (4.0, "2024-01-04"),
+        (3.0, "2024-01-06"),
+    ]
+
+
+def test_new_month_starts_without_peaks():
+    """Test the peaks are dropped when a new month begins."""
+    tracker = CapacityTracker()
+    tracker.add_power(local_day(2024, 1, 31), 4.0)
+    tracker.add_power(local_day(2024, 1, 31) + HOUR, 0.0)
+    tracker.flush(local_day(2024, 1, 31) + 2 * HOUR)
+    assert tracker.top_peaks() == [(4.0, "2024-01-31")]
+
+    tracker.flush(local_day(2024, 2, 1) + HOUR)
+    assert tracker.peaks == []
+    assert tracker.top_peaks() == [(0.0, "2024-02-01")]
+
+
+def test_forecast_level_and_headroom():
+    """Test the tier, headroom and today's limit against the levels."""
+    tracker = CapacityTracker()
+    for day, kw in ((1, 5.0), (2, 3.0)):
+        tracker.add_power(local_day(2024, 1, day), kw)
+        tracker.add_power(local_day(2024, 1, day) + HOUR, 0.0)
+    tracker.add_power(local_day(2024, 1, 3), 1.0)
+    tracker.flush(local_day(2024, 1, 3) + HOUR)
+
+    forecast = tracker.forecast(tariff_collection(LEVELS))
+    assert forecast == {
+        "level": "mid",
+        "next_threshold": 5,
+        "headroom": 2.0,
+        "today_limit": 7.0,
+        "peaks": [
+            {"day": "2024-01-01", "kwh": 5.0},
+            {"day": "2024-01-02", "kwh": 3.0},
+            {"day": "2024-01-03", "kwh": 1.0},
+        ],
+    }
+
+    # Already on the highest level there is no next threshold
+    tracker.add_power(local_day(2024, 1, 3) + HOUR, 9.0)
+    tracker.flush(local_day(2024, 1, 3) + 2 * HOUR)
+    forecast = tracker.forecast(tariff_collection(LEVELS))
+    assert forecast["level"] == "high"
+    assert forecast["headroom"] is None
+    assert forecast["today_limit"] is None
+
+    assert CapacityTracker().forecast(None)["level"] is None
+
+
+def test_round_trip_through_storage():
+    """Test a restored tracker continues the month where it left off."""
+    tracker = CapacityTracker()
+    tracker.add_power(local_day(2024, 1, 1), 2.0)
+    tracker.add_power(local_day(2024, 1, 1) + HOUR, 0.0)
+    tracker.add_power(local_day(2024, 1, 2), 1.0)
+    tracker.flush(local_day(2024, 1, 2) + HOUR / 2)
+
+    restored = CapacityTracker.from_dict(tracker.as_dict())
+    assert restored.hour == tracker.hour
+    assert restored.hour_energy == 0.5
+    assert restored.peaks == [(2.0, "2024-01-01")]
+
+    # The held sample is not restored
+    restored.flush(local_day(2024, 1, 2) + HOUR)
+    assert restored.today_peak == 0.5
+
+    empty = CapacityTracker.from_dict({})
+    assert empty.hour is None
+    assert empty.peaks == []
@@ -10,7 +10,9 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 import custom_components.norgesnett.config_flow as config_flow
 from custom_components.norgesnett.const import (
     CONF_CUSTOMER_ID,
+    CONF_MAX_STALENESS,
     CONF_METERINGPOINT_ID,
+    CONF_PUBLISH_HOUR,
     DOMAIN,
 )
 
@@ -131,6 +133,8 @@ async def test_options_flow(hass: HomeAssistant):
 
     # Submit options
     user_input = {p: False for p in config_flow.PLATFORMS}
+    user_input[CONF_MAX_STALENESS] = 12
+    user_input[CONF_PUBLISH_HOUR] = 14
     result2 = await options_handler.async_step_user(user_input)
     # Should create entry with updated options
     assert result2["type"] == FlowResultType.CREATE_ENTRY
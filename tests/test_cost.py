@@ -0,0 +1,102 @@
+"""Tests for the Norgesnett grid rent calculator."""
+
+import time
+from datetime import timedelta
+
+from custom_components.norgesnett.cost import grid_cost
+
+from .helpers import local_day, make_periods, tariff_collection
+
+HOUR = 3600
+
+
+LEVELS = [
+    {"id": "1", "valueMin": 0, "monthlyTotal": 100},
+    {"id": "2", "valueMin": 2, "monthlyTotal": 310},
+]
+
+
+def test_energy_and_fixed_cost_per_month():
+    """Test hours are priced and each month gets the level of its peaks."""
+    start = local_day(2024, 1, 30)
+    first = start.timestamp()
+    # Three days of 1 kWh an hour, with a 3 kWh peak on the second day
+    energy = [1.0] * 72
+    energy[30] = 3.0
+    energy[50] = None
+    consumption = make_periods(energy, first, HOUR)
+    # The last day has no prices
+    prices = make_periods([0.5] * 24 + [1.0, None] * 12, first, HOUR)
+    end = start + timedelta(days=3)
+
+    cost = grid_cost(consumption, prices, tariff_collection(LEVELS), start, end)
+    january, february = cost["months"]
+    assert january == {
+        "month": "2024-01",
+        "energy_kwh": 50.0,
+        "unpriced_kwh": 12.0,
+        "energy_cost": 12.0 + 14.0,
+        "peak_average": 2.0,
+        "level": "2",
+        "fixed_cost": 20.0,
+    }
+    assert february["month"] == "2024-02"
+    assert february["energy_kwh"] == 23.0
+    assert february["unpriced_kwh"] == 23.0
+    assert february["energy_cost"] == 0.0
+    assert february["level"] == "1"
+    assert february["fixed_cost"] == round(100 / 29, 2)
+    assert cost["energy_kwh"] == 73.0
+    assert cost["energy_cost"] == 26.0
+    assert cost["fixed_cost"] == round(20.0 + round(100 / 29, 2), 2)
+    assert cost["total_cost"] == round(26.0 + cost["fixed_cost"], 2)
+
+
+def test_quarter_hours_are_split_over_prices():
+    """Test periods are priced in proportion to each tariff they overlap."""
+    start = local_day(2024, 1, 30)
+    first = start.timestamp()
+    consumption = make_periods([1.0, 1.0], first + 900, 1800)
+    prices = make_periods([1.0, 3.0], first, HOUR)
+    # Consumption outside the range is left out
+    consumption.append((first + 7 * HOUR, first + 8 * HOUR, 5.0))
+
+    cost = grid_cost(consumption, prices, None, start, start + timedelta(hours=2))
+    (month,) = cost["months"]
+    assert month["energy_kwh"] == 2.0
+    assert month["energy_cost"] == 1.0 + 0.5 + 1.5
+    # Periods count towards the hour they start in
+    assert month["peak_average"] == 2.0
+    assert month["level"] is None
+    assert month["fixed_cost"] is None
+    assert cost["fixed_cost"] is None
+    assert cost["total_cost"] is None
+
+
+def test_no_consumption():
+    """Test an empty range costs nothing."""
+    start = local_day(2024, 1, 30)
+    cost = grid_cost(
+        [], [], tariff_collection(LEVELS), start, start + timedelta(days=1)
+    )
+    assert cost["months"] == []
+    assert cost["total_cost"] == 0.0
+
+
+def test_a_year_of_quarter_hours():
+    """Test a year of quarter-hour consumption is priced month by month."""
+    start = local_day(2024, 1, 1)
+    end = local_day(2025, 1, 1)
+    first = start.timestamp()
+    quarters = int((end.timestamp() - first) / 900)
+    consumption = make_periods([0.25] * quarters, first, 900)
+    prices = make_periods([0.4] * (quarters // 4), first, HOUR)
+
+    began = time.perf_counter()
+    cost = grid_cost(consumption, prices, tariff_collection(LEVELS), start, end)
+    # Generous bound, the calculation takes a few tens of milliseconds
+    assert time.perf_counter() - began < 1
+    assert quarters > 35000
+    assert len(cost["months"]) == 12
+    assert cost["energy_kwh"] == quarters / 4
+    assert cost["fixed_cost"] == 1200.0
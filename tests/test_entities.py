@@ -1,32 +1,46 @@
 """Unit tests for Norgesnett entity platforms."""
 
+from datetime import timedelta
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, MagicMock, PropertyMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from homeassistant.core import State
+from homeassistant.util import dt as dt_util
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
-from custom_components.norgesnett.binary_sensor import NorgesnettBinarySensor
+from custom_components.norgesnett.binary_sensor import (
+    NorgesnettBinarySensor,
+)
 from custom_components.norgesnett.binary_sensor import (
     async_setup_entry as async_setup_binary_sensor_entry,
 )
 from custom_components.norgesnett.const import (
     BINARY_SENSOR,
     BINARY_SENSOR_DEVICE_CLASS,
+    CONF_POWER_SENSOR,
+    CONF_SPOT_PRICE_SENSOR,
     DEFAULT_NAME,
     DOMAIN,
     ICON,
     SWITCH,
 )
+from custom_components.norgesnett.model import TariffData
+from custom_components.norgesnett.pricing import TotalPriceFormula
 from custom_components.norgesnett.sensor import (
+    NorgesnettCapacitySensor,
+    NorgesnettCheapestWindowSensor,
     NorgesnettCurrentPriceSensor,
     NorgesnettHourlyPricesSensor,
     NorgesnettSensor,
+    NorgesnettTotalPriceSensor,
 )
 from custom_components.norgesnett.sensor import (
     async_setup_entry as async_setup_sensor_entry,
 )
-from custom_components.norgesnett.switch import NorgesnettBinarySwitch
+from custom_components.norgesnett.switch import (
+    NorgesnettBinarySwitch,
+)
 from custom_components.norgesnett.switch import (
     async_setup_entry as async_setup_switch_entry,
 )
@@ -140,6 +154,7 @@ async def test_sensor_async_setup_entry_adds_expected_entities(config_entry):
         }
     )
 
+    coordinator.tariff = TariffData.parse(coordinator.data)
     hass = SimpleNamespace(data={DOMAIN: {config_entry.entry_id: coordinator}})
     captured = {}
 
@@ -151,10 +166,75 @@ async def test_sensor_async_setup_entry_adds_expected_entities(config_entry):
 
     assert captured["update_before_add"] is True
     entities = captured["entities"]
-    assert len(entities) == 8
+    assert len(entities) == 11
     assert any(isinstance(entity, NorgesnettHourlyPricesSensor) for entity in entities)
     assert any(isinstance(entity, NorgesnettCurrentPriceSensor) for entity in entities)
 
+    # A power sensor in the options adds the capacity forecast
+    coordinator.hass = hass
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={}, options={CONF_POWER_SENSOR: "sensor.power"}
+    )
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    await async_setup_sensor_entry(hass, entry, add_entities)
+    assert len(captured["entities"]) == 12
+    assert isinstance(captured["entities"][-1], NorgesnettCapacitySensor)
+
+    # A spot price sensor adds the total price
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={}, options={CONF_SPOT_PRICE_SENSOR: "sensor.spot"}
+    )
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    await async_setup_sensor_entry(hass, entry, add_entities)
+    assert len(captured["entities"]) == 12
+    total = captured["entities"][-1]
+    assert isinstance(total, NorgesnettTotalPriceSensor)
+    assert total._formula.threshold == 0.9375
+
+
+@pytest.mark.asyncio
+async def test_sensor_async_setup_entry_hub_mode():
+    """Test hub mode creates a set of sensors per metering point."""
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"meteringpoint_id": "mp1, mp2"}, entry_id="hub"
+    )
+    data = {
+        "gridTariffCollections": [
+            {
+                "meteringPointsAndPriceLevels": [{"meteringPointId": mp_id}],
+                "gridTariff": {
+                    "tariffPrice": {
+                        "hours": [
+                            {"shortName": "00-01", "energyPrice": {"total": price}}
+                        ]
+                    }
+                },
+            }
+            for mp_id, price in (("mp1", 1.0), ("mp2", 2.0))
+        ]
+    }
+    coordinator = SimpleNamespace(data=data, tariff=TariffData.parse(data))
+    hass = SimpleNamespace(data={DOMAIN: {entry.entry_id: coordinator}})
+    captured = {}
+
+    def add_entities(entities, update_before_add=True):
+        captured["entities"] = entities
+
+    await async_setup_sensor_entry(hass, entry, add_entities)
+
+    entities = captured["entities"]
+    assert len(entities) == 22
+    current = [e for e in entities if isinstance(e, NorgesnettCurrentPriceSensor)]
+    assert [e.unique_id for e in current] == [
+        "hub_mp1_current_price",
+        "hub_mp2_current_price",
+    ]
+    assert current[1].name == f"{DEFAULT_NAME}_mp2 Current Hour Price"
+    assert current[1].device_info["identifiers"] == {(DOMAIN, "mp2")}
+    mock_now = dt_util.start_of_local_day() + timedelta(minutes=30)
+    with patch("custom_components.norgesnett.sensor.now", return_value=mock_now):
+        assert [e.state for e in current] == [1.0, 2.0]
+
 
 @pytest.mark.asyncio
 async def test_sensor_async_setup_entry_handles_missing_collections(
@@ -162,6 +242,7 @@ async def test_sensor_async_setup_entry_handles_missing_collections(
 ):
     """Test setup returns early when tariff collections are missing."""
     coordinator = SimpleNamespace(data={})
+    coordinator.tariff = TariffData.parse(coordinator.data)
     hass = SimpleNamespace(data={DOMAIN: {config_entry.entry_id: coordinator}})
 
     def add_entities(entities, update_before_add=True):  # pragma: no cover
@@ -208,6 +289,7 @@ async def test_sensor_async_setup_entry_empty_mp_list_uses_fallback(
         }
     )
 
+    coordinator.tariff = TariffData.parse(coordinator.data)
     hass = SimpleNamespace(data={DOMAIN: {config_entry.entry_id: coordinator}})
     captured = {}
 
@@ -229,7 +311,8 @@ async def test_sensor_async_setup_entry_empty_mp_list_uses_fallback(
 
 def test_norgesnett_sensor_state_name_icon_and_device_class(config_entry):
     """Test generic Norgesnett sensor attributes and state fallback."""
-    coordinator = SimpleNamespace(data={"my_key": 123})
+    point = SimpleNamespace(fixed_prices={"my_key": 123})
+    coordinator = SimpleNamespace(tariff=SimpleNamespace(point=lambda _: point))
     entity = NorgesnettSensor(coordinator, config_entry, "my_key", 42)
 
     assert entity.state == 123
@@ -237,11 +320,49 @@ def test_norgesnett_sensor_state_name_icon_and_device_class(config_entry):
     assert entity.icon == ICON
     assert entity.device_class == "monetary"
 
-    coordinator.data = {}
+    coordinator.tariff = TariffData([])
     assert entity.state == 42
 
-    coordinator.data = None
-    assert entity.state == 42
+    level_entity = NorgesnettSensor(
+        coordinator, config_entry, "currentFixedPriceLevel", None
+    )
+    coordinator.data = {}
+    assert "next_level" in level_entity.extra_state_attributes
+    assert "next_level" not in entity.extra_state_attributes
+
+
+def test_norgesnett_sensor_follows_refreshed_tariff(config_entry):
+    """Test monthly sensors show the values of the latest update."""
+
+    def tariff(monthly_total):
+        return TariffData.parse(
+            {
+                "gridTariffCollections": [
+                    {
+                        "gridTariff": {
+                            "tariffPrice": {
+                                "priceInfo": {
+                                    "fixedPrices": [
+                                        {
+                                            "priceLevels": [
+                                                {"monthlyTotal": monthly_total}
+                                            ]
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        )
+
+    coordinator = SimpleNamespace(tariff=tariff(100))
+    entity = NorgesnettSensor(coordinator, config_entry, "monthlyTotal", 100)
+    assert entity.state == 100
+
+    coordinator.tariff = tariff(250)
+    assert entity.state == 250
 
 
 def test_hourly_prices_sensor_state_and_name(config_entry):
@@ -262,6 +383,7 @@ def test_hourly_prices_sensor_state_and_name(config_entry):
             ]
         }
     )
+    coordinator.tariff = TariffData.parse(coordinator.data)
     entity = NorgesnettHourlyPricesSensor(coordinator, config_entry)
 
     assert entity.state == 2
@@ -270,95 +392,271 @@ def test_hourly_prices_sensor_state_and_name(config_entry):
     assert entity.device_class == "monetary"
     assert entity.state_class == "measurement"
 
-    coordinator.data = {"gridTariffCollections": []}
-    assert entity.state is None
-
+    prices = entity.extra_state_attributes["prices"]
+    assert [period["price"] for period in prices] == [None, None]
+    assert prices[0]["end"] == prices[1]["start"]
+    assert "prices" in entity._unrecorded_attributes
 
-def test_hourly_prices_sensor_state_handles_exception(config_entry):
-    """Test hourly prices sensor returns None if coordinator data access fails."""
-    coordinator = SimpleNamespace(data=None)
-    entity = NorgesnettHourlyPricesSensor(coordinator, config_entry)
+    # Attributes are reused until the coordinator reports an update.
+    attributes = entity.extra_state_attributes
+    assert entity.extra_state_attributes is attributes
+    entity.async_write_ha_state = MagicMock()
+    entity._handle_coordinator_update()
+    assert entity.extra_state_attributes is not attributes
+    entity.async_write_ha_state.assert_called_once()
 
+    coordinator.tariff = TariffData([])
     assert entity.state is None
 
 
+def _price_coordinator(hours):
+    """Return a coordinator-like object with tariff hours and price index."""
+    data = {
+        "gridTariffCollections": [{"gridTariff": {"tariffPrice": {"hours": hours}}}]
+    }
+    return SimpleNamespace(data=data, tariff=TariffData.parse(data))
+
+
 @pytest.mark.asyncio
 async def test_current_price_sensor_lifecycle_and_state(config_entry):
-    """Test current price sensor scheduler hooks and current-hour lookup."""
-    coordinator = SimpleNamespace(
-        data={
-            "gridTariffCollections": [
-                {
-                    "gridTariff": {
-                        "tariffPrice": {
-                            "hours": [
-                                {"shortName": "09-10", "energyPrice": {"total": 1.23}},
-                                {"shortName": "10-11", "energyPrice": {"total": 2.34}},
-                            ]
-                        }
-                    }
-                }
-            ]
-        }
+    """Test current price sensor boundary listener and current-hour lookup."""
+    coordinator = _price_coordinator(
+        [
+            {"shortName": "09-10", "energyPrice": {"total": 1.23}},
+            {"shortName": "10-11", "energyPrice": {"total": 2.34}},
+        ]
+    )
+    unsubscribe = MagicMock()
+    coordinator.async_add_listener = MagicMock(return_value=MagicMock())
+    coordinator.boundaries = SimpleNamespace(
+        async_add_listener=MagicMock(return_value=unsubscribe)
     )
 
     entity = NorgesnettCurrentPriceSensor(coordinator, config_entry)
-    fake_hass = MagicMock()
-    fake_hass.loop = MagicMock()
-
-    unsubscribe = MagicMock()
-    with patch(
-        "custom_components.norgesnett.sensor.async_track_time_change",
-        return_value=unsubscribe,
-    ) as track_time_change:
-        await entity.async_added_to_hass()
-        track_time_change.assert_called_once()
+    await entity.async_added_to_hass()
+    coordinator.async_add_listener.assert_called_once()
+    coordinator.boundaries.async_add_listener.assert_called_once_with(
+        entity.async_write_ha_state
+    )
 
-    mock_now = SimpleNamespace(hour=10)
+    mock_now = dt_util.start_of_local_day() + timedelta(hours=10, minutes=30)
     with patch("custom_components.norgesnett.sensor.now", return_value=mock_now):
         assert entity.state == 2.34
 
-    with patch.object(
-        NorgesnettCurrentPriceSensor,
-        "hass",
-        new_callable=PropertyMock,
-        return_value=fake_hass,
-    ):
-        entity._update_state(now_time=None)
-    fake_hass.loop.call_soon_threadsafe.assert_called_once_with(
-        entity.async_schedule_update_ha_state,
-        False,
-    )
-
-    await entity.async_will_remove_from_hass()
+    entity._call_on_remove_callbacks()
     unsubscribe.assert_called_once()
 
-    coordinator.data = {"gridTariffCollections": []}
+    coordinator.tariff = TariffData([])
     assert entity.state is None
 
 
-def test_current_price_sensor_state_no_match_and_exception(config_entry):
-    """Test current price sensor when no hour matches and on malformed data."""
-    coordinator = SimpleNamespace(
-        data={
-            "gridTariffCollections": [
-                {
-                    "gridTariff": {
-                        "tariffPrice": {
-                            "hours": [
-                                {"shortName": "08-09", "energyPrice": {"total": 1.11}},
-                            ]
-                        }
-                    }
-                }
-            ]
-        }
+def test_current_price_sensor_state_no_match(config_entry):
+    """Test current price sensor when no hour matches."""
+    coordinator = _price_coordinator(
+        [{"shortName": "08-09", "energyPrice": {"total": 1.11}}]
     )
     entity = NorgesnettCurrentPriceSensor(coordinator, config_entry)
 
-    mock_now = SimpleNamespace(hour=10)
+    mock_now = dt_util.start_of_local_day() + timedelta(hours=10)
     with patch("custom_components.norgesnett.sensor.now", return_value=mock_now):
         assert entity.state is None
 
-    coordinator.data = None
-    assert entity.state is None
+
+@pytest.mark.asyncio
+async def test_cheapest_window_sensor_moves_with_time(config_entry):
+    """Test the cheapest window is recomputed at boundaries and updates."""
+    coordinator = _price_coordinator(
+        [
+            {"shortName": "00-01", "energyPrice": {"total": 1.0}},
+            {"shortName": "01-02", "energyPrice": {"total": 1.0}},
+            {"shortName": "02-03", "energyPrice": {"total": 5.0}},
+            {"shortName": "03-04", "energyPrice": {"total": 2.0}},
+        ]
+    )
+    coordinator.async_add_listener = MagicMock(return_value=MagicMock())
+    coordinator.boundaries = SimpleNamespace(
+        async_add_listener=MagicMock(return_value=MagicMock())
+    )
+    day = dt_util.start_of_local_day()
+    entity = NorgesnettCheapestWindowSensor(coordinator, config_entry, 2)
+    entity.async_write_ha_state = MagicMock()
+    assert entity.name == f"{DEFAULT_NAME} Cheapest 2h Window"
+    assert entity.unique_id == f"{config_entry.entry_id}_cheapest_2h"
+    assert entity.icon == ICON
+
+    with patch("custom_components.norgesnett.sensor.now", return_value=day):
+        await entity.async_added_to_hass()
+    assert entity.native_value == day
+    assert (
+        entity.extra_state_attributes["end"] == (day + timedelta(hours=2)).isoformat()
+    )
+    assert entity.extra_state_attributes["mean_price"] == 1.0
+
+    boundary = coordinator.boundaries.async_add_listener.call_args[0][0]
+    with patch(
+        "custom_components.norgesnett.sensor.now",
+        return_value=day + timedelta(hours=2),
+    ):
+        boundary()
+    assert entity.native_value == day + timedelta(hours=2)
+    assert entity.extra_state_attributes["mean_price"] == 3.5
+    entity.async_write_ha_state.assert_called_once()
+
+    coordinator.tariff = TariffData([])
+    entity._handle_coordinator_update()
+    assert entity.native_value is None
+    assert entity.extra_state_attributes["end"] is None
+
+
+@pytest.mark.asyncio
+async def test_capacity_sensor_follows_source_and_saves_peaks(hass, config_entry):
+    """Test the capacity sensor tracks its source and keeps the peaks."""
+    data = {
+        "gridTariffCollections": [
+            {
+                "meteringPointsAndPriceLevels": [
+                    {"meteringPointId": "mp", "currentFixedPriceLevel": {"id": "1"}}
+                ],
+                "gridTariff": {
+                    "tariffPrice": {
+                        "priceInfo": {
+                            "fixedPrices": [
+                                {
+                                    "priceLevels": [
+                                        {"id": "1", "valueMin": 0, "valueMax": 2},
+                                        {"id": "2", "valueMin": 2, "valueMax": 5},
+                                    ]
+                                }
+                            ]
+                        }
+                    }
+                },
+            }
+        ]
+    }
+    coordinator = SimpleNamespace(
+        hass=hass,
+        data=data,
+        tariff=TariffData.parse(data),
+        async_add_listener=MagicMock(return_value=MagicMock()),
+    )
+    start = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+    hass.states.async_set("sensor.power", "1500", {"unit_of_measurement": "W"})
+
+    entity = NorgesnettCapacitySensor(coordinator, config_entry, "sensor.power")
+    entity.hass = hass
+    entity.entity_id = "sensor.norgesnett_capacity_forecast"
+    entity.async_write_ha_state = MagicMock()
+    assert entity.name == f"{DEFAULT_NAME} Capacity Forecast"
+    assert entity.unique_id == f"{config_entry.entry_id}_capacity_forecast"
+    assert entity.icon == ICON
+
+    with patch("custom_components.norgesnett.sensor.utcnow", return_value=start):
+        await entity.async_added_to_hass()
+
+    # Samples arrive as state changes, an hour closes on the timer
+    entity._async_source_changed(
+        SimpleNamespace(
+            data={
+                "new_state": State(
+                    "sensor.power",
+                    "3.0",
+                    {"unit_of_measurement": "kW"},
+                    last_updated=start + timedelta(minutes=30),
+                )
+            }
+        )
+    )
+    entity._async_hour(start + timedelta(hours=1))
+    await hass.async_block_till_done()
+    assert entity.native_value == 2.25
+    attributes = entity.extra_state_attributes
+    assert attributes["source"] == "sensor.power"
+    assert attributes["level"] == "2"
+    assert attributes["next_threshold"] is None
+    assert entity.async_write_ha_state.call_count == 2
+
+    # Unknown units and removed sources are ignored
+    hass.states.async_set("sensor.power", "5", {"unit_of_measurement": "A"})
+    hass.states.async_remove("sensor.power")
+    await hass.async_block_till_done()
+    assert entity.native_value == 2.25
+
+    await entity.async_will_remove_from_hass()
+    entity._call_on_remove_callbacks()
+
+    # A new sensor continues from the saved peaks
+    restored = NorgesnettCapacitySensor(coordinator, config_entry, "sensor.energy")
+    restored.hass = hass
+    hass.states.async_set(
+        "sensor.energy", "unavailable", {"unit_of_measurement": "kWh"}
+    )
+    await restored.async_added_to_hass()
+    assert restored.native_value == 2.25
+    assert restored._tracker._last_meter is None
+    hass.states.async_set("sensor.energy", "12.5", {"unit_of_measurement": "kWh"})
+    await hass.async_block_till_done()
+    assert restored._tracker._last_meter == 12.5
+    restored._call_on_remove_callbacks()
+
+
+@pytest.mark.asyncio
+async def test_total_price_sensor_combines_spot_and_grid(hass, config_entry):
+    """Test the total price follows the spot sensor, tariffs and boundaries."""
+    coordinator = _price_coordinator(
+        [
+            {"shortName": "00-01", "energyPrice": {"total": 0.3}},
+            {"shortName": "01-02", "energyPrice": {"total": 0.4}},
+        ]
+    )
+    coordinator.hass = hass
+    coordinator.async_add_listener = MagicMock(return_value=MagicMock())
+    day = dt_util.start_of_local_day()
+    hass.states.async_set(
+        "sensor.spot",
+        "1.0",
+        {
+            "raw_today": [
+                {"start": day, "end": day + timedelta(hours=1), "value": 1.0},
+                {"start": day + timedelta(hours=1), "value": 2.0},
+            ]
+        },
+    )
+    formula = TotalPriceFormula(0.9375, 0.9, -0.01)
+    entity = NorgesnettTotalPriceSensor(
+        coordinator, config_entry, "sensor.spot", formula
+    )
+    entity.hass = hass
+    entity.entity_id = "sensor.norgesnett_total_price"
+    entity.async_write_ha_state = MagicMock()
+    assert entity.name == f"{DEFAULT_NAME} Total Price"
+    assert entity.unique_id == f"{config_entry.entry_id}_total_price"
+    assert entity.icon == ICON
+
+    with patch("custom_components.norgesnett.sensor.now", return_value=day):
+        await entity.async_added_to_hass()
+        assert entity.native_value == formula(1.0, 0.3)
+        attributes = entity.extra_state_attributes
+    assert attributes["spot_price"] == 1.0
+    assert attributes["grid_price"] == 0.3
+    assert len(attributes["prices"]) == 2
+
+    later = day + timedelta(hours=1, minutes=5)
+    with patch("custom_components.norgesnett.sensor.now", return_value=later):
+        entity._async_boundary()
+        assert entity.native_value == formula(2.0, 0.4)
+        assert entity.extra_state_attributes["spot_price"] == 2.0
+
+        # The spot sensor changes to a plain state without a vector
+        hass.states.async_set("sensor.spot", "0.5", {})
+        await hass.async_block_till_done()
+        assert entity.native_value == formula(0.5, 0.4)
+        assert len(entity.extra_state_attributes["prices"]) == 1
+
+        coordinator.tariff = TariffData([])
+        entity._handle_coordinator_update()
+        assert entity.native_value is None
+    assert entity.async_write_ha_state.call_count == 3
+
+    entity._call_on_remove_callbacks()
+    assert entity._boundaries._listeners == []
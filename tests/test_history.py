@@ -0,0 +1,125 @@
+"""Tests for the Norgesnett tariff history."""
+
+from datetime import timedelta
+
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.history import TariffHistory
+from custom_components.norgesnett.model import TariffData
+
+from .helpers import local_day, make_periods
+
+HOUR = 3600
+
+
+async def test_append_keeps_the_first_period(hass, tmp_path):
+    """Test stored periods are not replaced and ranges are read back."""
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    day = local_day(2024, 3, 4)
+    first = day.timestamp()
+    assert await history.async_append("mp1", make_periods([1.0, 2.0], first)) == 2
+    assert await history.async_append("mp1", make_periods([5.0, 5.0, 3.0], first)) == 1
+    assert await history.async_append("mp2", make_periods([9.0], first)) == 1
+
+    periods = await history.async_periods("mp1", day, day + timedelta(days=1))
+    assert periods == make_periods([1.0, 2.0, 3.0], first)
+    assert await history.async_periods(
+        "mp1", day + timedelta(hours=1), day + timedelta(hours=2)
+    ) == make_periods([2.0], first + HOUR)
+
+    # The database is opened again after it is closed
+    await history.async_close()
+    await history.async_close()
+    reopened = TariffHistory(hass, str(tmp_path / "history.db"))
+    assert len(await reopened.async_periods("mp2", day, day + timedelta(hours=1))) == 1
+    await reopened.async_close()
+
+
+async def test_daily_aggregates(hass, tmp_path):
+    """Test every local day gets its min, weighted mean and max."""
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    day = local_day(2024, 3, 4)
+    first = day.timestamp()
+    await history.async_append(
+        "mp1",
+        make_periods([1.0] * 12 + [2.0] * 11 + [None] + [4.0] * 24, first)
+        + [(first + 48 * HOUR, first + 48.5 * HOUR, 1.0)],
+    )
+    await history.async_append("mp1", [(first + 48.5 * HOUR, first + 49 * HOUR, 3.0)])
+
+    daily = await history.async_daily("mp1", day, day + timedelta(days=3))
+    assert daily == [
+        {"day": "2024-03-04", "min": 1.0, "mean": 34.0 / 23, "max": 2.0},
+        {"day": "2024-03-05", "min": 4.0, "mean": 4.0, "max": 4.0},
+        {"day": "2024-03-06", "min": 1.0, "mean": 2.0, "max": 3.0},
+    ]
+    assert await history.async_daily("mp2", day, day + timedelta(hours=1)) == []
+    await history.async_close()
+
+
+async def test_level_changes(hass, tmp_path):
+    """Test only the days a level changed on are returned."""
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    for date, level in (
+        ("2024-03-01", "1"),
+        ("2024-03-02", "1"),
+        ("2024-03-03", "2"),
+        ("2024-03-04", "2"),
+        ("2024-03-05", "1"),
+        ("2024-03-06", "3"),
+    ):
+        await history.async_append("mp1", [], level, date)
+    await history.async_append("mp1", [], "2", "2024-03-04")
+    day = local_day(2024, 3, 4)
+
+    changes = await history.async_level_changes(
+        "mp1", day - timedelta(days=2), day + timedelta(days=2)
+    )
+    assert changes == [
+        {"day": "2024-03-03", "level": "2", "previous": "1"},
+        {"day": "2024-03-05", "level": "1", "previous": "2"},
+    ]
+    assert await history.async_level_changes(
+        "mp1", day - timedelta(days=5), day - timedelta(days=2)
+    ) == [{"day": "2024-03-01", "level": "1", "previous": None}]
+    await history.async_close()
+
+
+async def test_append_tariff(hass, tmp_path, caplog):
+    """Test every metering point of a response is stored with its level."""
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    day = dt_util.start_of_local_day()
+    tariff = TariffData.parse(
+        {
+            "gridTariffCollections": [
+                {
+                    "meteringPointsAndPriceLevels": [
+                        {
+                            "meteringPointId": "mp1",
+                            "currentFixedPriceLevel": {"id": "2"},
+                        },
+                        {"currentFixedPriceLevel": {"id": "1"}},
+                    ],
+                    "gridTariff": {
+                        "tariffPrice": {
+                            "hours": [
+                                {"shortName": "00-01", "energyPrice": {"total": 1.0}}
+                            ]
+                        }
+                    },
+                }
+            ]
+        }
+    )
+    await history.async_append_tariff(tariff)
+    assert await history.async_periods("mp1", day, day + timedelta(hours=1)) == [
+        (day.timestamp(), day.timestamp() + HOUR, 1.0)
+    ]
+    assert await history.async_level_changes("mp1", day, day + timedelta(days=1)) == [
+        {"day": day.date().isoformat(), "level": "2", "previous": None}
+    ]
+    await history.async_close()
+
+    broken = TariffHistory(hass, str(tmp_path / "missing" / "history.db"))
+    await broken.async_append_tariff(tariff)
+    assert "could not store tariff history" in caplog.text
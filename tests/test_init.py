@@ -3,21 +3,24 @@
 import importlib
 import sys
 import types
-from unittest.mock import AsyncMock, patch
+from datetime import time, timedelta
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.util import dt as dt_util
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 import custom_components.norgesnett as norgesnett_module
 from custom_components.norgesnett import (
     NorgesnettDataUpdateCoordinator,
     async_reload_entry,
+    async_remove_entry,
     async_setup_entry,
     async_unload_entry,
 )
-from custom_components.norgesnett.const import DOMAIN
+from custom_components.norgesnett.const import CONF_METERINGPOINT_ID, DOMAIN
 
 from .const import MOCK_CONFIG
 
@@ -27,7 +30,7 @@ from .const import MOCK_CONFIG
 # Home Assistant using the pytest_homeassistant_custom_component plugin.
 # Assertions allow you to verify that the return value of whatever is on the left
 # side of the assertion matches with the right side.
-async def test_setup_unload_and_reload_entry(hass, bypass_get_data):
+async def test_setup_unload_and_reload_entry(hass, bypass_get_data, skip_backfill):
     """Test entry setup and unload."""
     # Create a mock entry so we don't have to go through config flow
     config_entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
@@ -42,6 +45,10 @@ async def test_setup_unload_and_reload_entry(hass, bypass_get_data):
         type(hass.data[DOMAIN][config_entry.entry_id])
         is NorgesnettDataUpdateCoordinator
     )
+    # The history of the entry's metering point is backfilled
+    await hass.async_block_till_done()
+    skip_backfill.assert_awaited_once()
+    assert skip_backfill.await_args[0][1] == [MOCK_CONFIG[CONF_METERINGPOINT_ID]]
 
     # Reload the entry and assert that the data from above is still there
     assert await async_reload_entry(hass, config_entry) is None
@@ -134,3 +141,318 @@ def test_module_reload_config_schema_fallback_branch():
         clear=False,
     ):
         importlib.reload(norgesnett_module)
+
+
+def _stored_tariffs(fetched):
+    """Return a storage payload as written by the coordinator."""
+    return {
+        "version": 1,
+        "minor_version": 1,
+        "key": "norgesnett.tariffs.test",
+        "data": {
+            "fetched": fetched,
+            "data": {"gridTariffCollections": [{"stored": True}]},
+        },
+    }
+
+
+async def test_setup_entry_uses_stored_data(hass, hass_storage, error_on_get_data):
+    """Test setup starts from today's stored tariffs without waiting for the API."""
+    fetched = dt_util.utcnow().isoformat()
+    hass_storage["norgesnett.tariffs.test_customer_id"] = _stored_tariffs(fetched)
+    config_entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
+
+    with patch.object(
+        hass.config_entries, "async_forward_entry_setups", AsyncMock()
+    ) as forward:
+        assert await async_setup_entry(hass, config_entry)
+        forward.assert_awaited_once()
+
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    assert coordinator.data == {"gridTariffCollections": [{"stored": True}]}
+
+    # The background refresh fails, but today's stored data is kept.
+    await hass.async_block_till_done()
+    assert coordinator.last_update_success
+    assert coordinator.stale
+    assert coordinator.data == {"gridTariffCollections": [{"stored": True}]}
+    await coordinator.async_shutdown()
+
+
+async def test_coordinator_stores_and_ignores_stale_data(hass, hass_storage):
+    """Test payloads are saved after refresh and old ones are not loaded."""
+    hass_storage["norgesnett.tariffs.test"] = _stored_tariffs(
+        "2000-01-01T00:00:00+00:00"
+    )
+    result = {"gridTariffCollections": [{"fresh": True}]}
+    client = types.SimpleNamespace(async_get_data=AsyncMock(return_value=result))
+    coordinator = NorgesnettDataUpdateCoordinator(
+        hass, client=client, storage_id="test"
+    )
+
+    assert not await coordinator.async_load_stored_data()
+    assert await coordinator._async_update_data() == result
+    await hass.async_block_till_done()
+    assert hass_storage["norgesnett.tariffs.test"]["data"] == {
+        "fetched": coordinator.last_fetched.isoformat(),
+        "data": result,
+    }
+
+    # Unreadable stored data is ignored.
+    hass_storage["norgesnett.tariffs.test"] = _stored_tariffs(
+        dt_util.utcnow().isoformat()
+    )
+    hass_storage["norgesnett.tariffs.test"]["data"]["data"] = {
+        "gridTariffCollections": "broken"
+    }
+    coordinator = NorgesnettDataUpdateCoordinator(
+        hass, client=client, storage_id="test"
+    )
+    assert not await coordinator.async_load_stored_data()
+
+    # Without a storage id nothing is stored.
+    coordinator = NorgesnettDataUpdateCoordinator(hass, client=client)
+    assert not await coordinator.async_load_stored_data()
+
+    # Nothing stored yet for a new customer.
+    coordinator = NorgesnettDataUpdateCoordinator(hass, client=client, storage_id="new")
+    assert not await coordinator.async_load_stored_data()
+
+
+async def test_coordinator_loads_prefetched_data_from_yesterday(hass, hass_storage):
+    """Test data fetched yesterday is used if it covers the rest of today."""
+    day = dt_util.start_of_local_day()
+    yesterday = (day - timedelta(hours=1)).isoformat()
+    stored = _stored_tariffs(yesterday)
+    hours = [
+        {
+            "startTime": (day + timedelta(hours=hour)).isoformat(),
+            "expiredAt": (day + timedelta(hours=hour + 1)).isoformat(),
+        }
+        for hour in range(-24, 24)
+    ]
+    stored["data"]["data"] = {
+        "gridTariffCollections": [{"gridTariff": {"tariffPrice": {"hours": hours}}}]
+    }
+    hass_storage["norgesnett.tariffs.test"] = stored
+    client = types.SimpleNamespace(async_get_data=AsyncMock())
+
+    coordinator = NorgesnettDataUpdateCoordinator(
+        hass, client=client, storage_id="test"
+    )
+    assert await coordinator.async_load_stored_data()
+    assert len(coordinator.tariff.prices) == 48
+
+    stored["data"]["data"]["gridTariffCollections"][0]["gridTariff"]["tariffPrice"][
+        "hours"
+    ] = hours[:24]
+    coordinator = NorgesnettDataUpdateCoordinator(
+        hass, client=client, storage_id="test"
+    )
+    assert not await coordinator.async_load_stored_data()
+
+
+async def test_remove_entry_deletes_stored_data(hass, hass_storage):
+    """Test removing a customer's last entry removes its stored tariffs."""
+    key = "norgesnett.tariffs.test_customer_id"
+    hass_storage[key] = _stored_tariffs("2000-01-01T00:00:00+00:00")
+    config_entry = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="test")
+    other = MockConfigEntry(domain=DOMAIN, data=MOCK_CONFIG, entry_id="other")
+    config_entry.add_to_hass(hass)
+    other.add_to_hass(hass)
+
+    await async_remove_entry(hass, config_entry)
+    assert key in hass_storage
+
+    await hass.config_entries.async_remove(other.entry_id)
+    await async_remove_entry(hass, config_entry)
+    assert key not in hass_storage
+
+
+async def test_coordinator_serves_stale_data_with_backoff(hass):
+    """Test failed refreshes keep the last good data until max_staleness."""
+    result = {"gridTariffCollections": [{"fresh": True}]}
+    client = types.SimpleNamespace(async_get_data=AsyncMock(return_value=result))
+    coordinator = NorgesnettDataUpdateCoordinator(
+        hass, client=client, max_staleness=timedelta(hours=2)
+    )
+    assert coordinator.data_age is None
+
+    coordinator.data = await coordinator._async_update_data()
+    client.async_get_data.side_effect = Exception("API down")
+
+    assert await coordinator._async_update_data() == result
+    assert coordinator.stale
+    assert coordinator.update_interval == norgesnett_module.RETRY_INTERVAL
+    assert await coordinator._async_update_data() == result
+    assert coordinator.update_interval == norgesnett_module.RETRY_INTERVAL * 2
+
+    coordinator.last_fetched = dt_util.utcnow() - timedelta(hours=2)
+    with pytest.raises(UpdateFailed):
+        await coordinator._async_update_data()
+    # Unavailable entities are retried on the same capped backoff
+    assert coordinator.update_interval == norgesnett_module.RETRY_INTERVAL * 4
+    for _ in range(5):
+        with pytest.raises(UpdateFailed):
+            await coordinator._async_update_data()
+    assert coordinator.update_interval == norgesnett_module.MAX_RETRY_INTERVAL
+
+    client.async_get_data.side_effect = None
+    assert await coordinator._async_update_data() == result
+    assert not coordinator.stale
+    # Both responses had no periods, so the refresh schedule backs off.
+    assert coordinator.update_interval <= timedelta(minutes=10)
+    assert coordinator.data_age < timedelta(minutes=1)
+
+
+async def test_coordinator_keeps_data_that_covers_now(hass):
+    """Test a failed aligned refresh keeps data that still covers the time."""
+    day = dt_util.start_of_local_day()
+    result = {
+        "gridTariffCollections": [
+            {
+                "gridTariff": {
+                    "tariffPrice": {
+                        "hours": [
+                            {
+                                "startTime": (day + timedelta(hours=hour)).isoformat(),
+                                "expiredAt": (
+                                    day + timedelta(hours=hour + 1)
+                                ).isoformat(),
+                                "energyPrice": {"total": 1.0},
+                            }
+                            for hour in range(48)
+                        ]
+                    }
+                }
+            }
+        ]
+    }
+    client = types.SimpleNamespace(async_get_data=AsyncMock(return_value=result))
+    coordinator = NorgesnettDataUpdateCoordinator(hass, client=client)
+    coordinator.data = await coordinator._async_update_data()
+    # The next aligned refresh comes a day later, when the data is that old
+    assert coordinator.update_interval > timedelta(hours=1)
+    coordinator.last_fetched = dt_util.utcnow() - timedelta(hours=25)
+    client.async_get_data.side_effect = Exception("API down")
+
+    assert await coordinator._async_update_data() == result
+    assert coordinator.stale
+    assert coordinator.tariff.prices.price_at(dt_util.utcnow()) == 1.0
+
+    # Once the periods have run out the entities go unavailable
+    with patch(
+        "custom_components.norgesnett.dt_util.utcnow",
+        return_value=day + timedelta(days=2),
+    ), pytest.raises(UpdateFailed):
+        await coordinator._async_update_data()
+
+
+def _customer_entry(entry_id, meteringpoint_id, customer_id="customer"):
+    """Return an entry for ``meteringpoint_id`` of ``customer_id``."""
+    return MockConfigEntry(
+        domain=DOMAIN,
+        data={"customer_id": customer_id, "meteringpoint_id": meteringpoint_id},
+        entry_id=entry_id,
+    )
+
+
+def _points_response(meteringpoint_ids):
+    """Return a response with one collection per metering point."""
+    return {
+        "gridTariffCollections": [
+            {"meteringPointsAndPriceLevels": [{"meteringPointId": mp_id}]}
+            for mp_id in meteringpoint_ids
+        ]
+    }
+
+
+async def test_entries_of_a_customer_share_one_coordinator(hass):
+    """Test entries attach to one coordinator per customer and detach again."""
+    requested = []
+
+    async def get_data(client):
+        requested.append(list(client._meteringpoint_ids))
+        return _points_response(client._meteringpoint_ids)
+
+    first = _customer_entry("first", "mp1")
+    second = _customer_entry("second", "mp2, mp1")
+    other = _customer_entry("other", "mp9", customer_id="other")
+    with patch(
+        "custom_components.norgesnett.NorgesnettApiClient.async_get_data", get_data
+    ), patch.object(hass.config_entries, "async_forward_entry_setups", AsyncMock()):
+        assert await async_setup_entry(hass, first)
+        assert await async_setup_entry(hass, second)
+        assert await async_setup_entry(hass, other)
+        # Known metering points are served without another refresh.
+        assert await async_setup_entry(hass, _customer_entry("third", "mp2"))
+
+    registry = hass.data[DOMAIN][norgesnett_module.REGISTRY]
+    coordinator = registry.get("customer")
+    assert hass.data[DOMAIN]["first"] is coordinator
+    assert hass.data[DOMAIN]["second"] is coordinator
+    assert hass.data[DOMAIN]["other"] is registry.get("other")
+    assert requested == [["mp1"], ["mp1", "mp2"], ["mp9"]]
+    assert registry.meteringpoint_ids("customer") == ["mp1", "mp2"]
+
+    assert await async_unload_entry(hass, first)
+    assert coordinator.api._meteringpoint_ids == ["mp2", "mp1"]
+    await registry.async_detach(_customer_entry("third", "mp2"))
+    cancel_timer = coordinator.boundaries._unsub_timer = Mock()
+    assert await async_unload_entry(hass, second)
+    assert registry.get("customer") is None
+    # The dropped coordinator has no refresh or boundary timer left
+    cancel_timer.assert_called_once()
+    assert coordinator._unsub_refresh is None
+    assert await async_unload_entry(hass, other)
+    assert registry.get("other") is None
+
+
+async def test_attach_applies_options_to_shared_coordinator(hass):
+    """Test the options of an entry attaching later apply to the coordinator."""
+    registry = norgesnett_module.CoordinatorRegistry(hass)
+    coordinator, created = registry.attach(_customer_entry("first", "mp1"))
+    assert created
+    assert coordinator.max_staleness == timedelta(hours=24)
+
+    second = MockConfigEntry(
+        domain=DOMAIN,
+        data={"customer_id": "customer", "meteringpoint_id": "mp2"},
+        options={"max_staleness": 6, "publish_hour": 14},
+        entry_id="second",
+    )
+    assert registry.attach(second) == (coordinator, False)
+    assert coordinator.max_staleness == timedelta(hours=6)
+    assert coordinator.refresh_schedule.publish_time == time(14)
+
+
+async def test_setup_entry_detaches_when_new_points_fail(hass):
+    """Test an entry whose metering points cannot be fetched is detached."""
+    first = _customer_entry("first", "mp1")
+    with patch(
+        "custom_components.norgesnett.NorgesnettApiClient.async_get_data",
+        AsyncMock(return_value=_points_response(["mp1"])),
+    ), patch.object(hass.config_entries, "async_forward_entry_setups", AsyncMock()):
+        assert await async_setup_entry(hass, first)
+    coordinator = hass.data[DOMAIN]["first"]
+    coordinator.last_fetched -= timedelta(days=2)
+
+    with patch(
+        "custom_components.norgesnett.NorgesnettApiClient.async_get_data",
+        side_effect=Exception,
+    ), pytest.raises(ConfigEntryNotReady):
+        await async_setup_entry(hass, _customer_entry("second", "mp2"))
+
+    registry = hass.data[DOMAIN][norgesnett_module.REGISTRY]
+    assert registry.meteringpoint_ids("customer") == ["mp1"]
+    assert coordinator.api._meteringpoint_ids == ["mp1"]
+
+    # A response without the new metering point does not set it up either
+    with patch(
+        "custom_components.norgesnett.NorgesnettApiClient.async_get_data",
+        AsyncMock(return_value=_points_response(["mp1"])),
+    ), pytest.raises(ConfigEntryNotReady):
+        await async_setup_entry(hass, _customer_entry("second", "mp2"))
+    assert coordinator.last_update_success
+    assert registry.meteringpoint_ids("customer") == ["mp1"]
+    await registry.async_detach(first)
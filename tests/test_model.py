@@ -0,0 +1,358 @@
+"""Tests for Norgesnett parsed tariff data."""
+
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.model import (
+    PriceIndex,
+    TariffData,
+    TariffParseError,
+)
+
+
+def _data(hours):
+    """Wrap tariff hours in a MeteringPointsGridTariffs response."""
+    return {
+        "gridTariffCollections": [{"gridTariff": {"tariffPrice": {"hours": hours}}}]
+    }
+
+
+def test_price_index_lookup():
+    """Test prices are found by period and unknown periods return None."""
+    index = PriceIndex.from_hours(
+        [
+            {"shortName": "01-02", "energyPrice": {"total": 2.0}},
+            {"shortName": "00-01", "energyPrice": {"total": 1.0}},
+            {"shortName": "03-04"},
+            {"shortName": "bad"},
+            {"energyPrice": {"total": 9.9}},
+        ]
+    )
+    day = dt_util.start_of_local_day()
+
+    assert len(index) == 3
+    assert index.price_at(day - timedelta(seconds=1)) is None
+    assert index.price_at(day) == 1.0
+    assert index.price_at(day + timedelta(minutes=59)) == 1.0
+    assert index.price_at(day + timedelta(hours=1, minutes=30)) == 2.0
+    assert index.price_at(day + timedelta(hours=1, minutes=45)) == 2.0
+    assert index.price_at(day + timedelta(hours=2, minutes=30)) is None
+    assert index.price_at(day + timedelta(hours=3)) is None
+    assert index.price_at(day + timedelta(hours=5)) is None
+    assert PriceIndex([]).price_at(day) is None
+
+
+def test_price_index_next_boundary():
+    """Test the next boundary is the next period start or current period end."""
+    index = PriceIndex.from_hours(
+        [{"shortName": "01-02"}, {"shortName": "02-03"}, {"shortName": "05-06"}]
+    )
+    day = dt_util.start_of_local_day()
+
+    assert index.next_boundary(day) == day + timedelta(hours=1)
+    assert index.next_boundary(day + timedelta(hours=1)) == day + timedelta(hours=2)
+    assert index.next_boundary(day + timedelta(hours=2, minutes=5)) == day + timedelta(
+        hours=3
+    )
+    assert index.next_boundary(day + timedelta(hours=4)) == day + timedelta(hours=5)
+    assert index.next_boundary(day + timedelta(hours=6)) is None
+
+
+def _quarters(day, count):
+    """Return ``count`` 15-minute periods from local midnight of ``day``."""
+    oslo = ZoneInfo("Europe/Oslo")
+    start = datetime(day.year, day.month, day.day, tzinfo=oslo).astimezone(timezone.utc)
+    return [
+        {
+            "startTime": (start + timedelta(minutes=15 * i))
+            .astimezone(oslo)
+            .isoformat(),
+            "expiredAt": (start + timedelta(minutes=15 * (i + 1)))
+            .astimezone(oslo)
+            .isoformat(),
+            "energyPrice": {"total": float(i)},
+        }
+        for i in range(count)
+    ]
+
+
+def test_price_index_quarter_hours_on_dst_day():
+    """Test 15-minute periods with real timestamps across a DST change."""
+    index = PriceIndex.from_hours(_quarters(datetime(2024, 3, 31), 92))
+    oslo = ZoneInfo("Europe/Oslo")
+
+    assert len(index) == 92
+    assert index.price_at(datetime(2024, 3, 31, 1, 50, tzinfo=oslo)) == 7.0
+    # 02:00 does not exist, 03:00 local is the ninth quarter after midnight.
+    assert index.price_at(datetime(2024, 3, 31, 3, 0, tzinfo=oslo)) == 8.0
+    assert index.price_at(datetime(2024, 3, 31, 23, 59, tzinfo=oslo)) == 91.0
+    assert index.price_at(datetime(2024, 4, 1, 0, 0, tzinfo=oslo)) is None
+    assert index.next_boundary(datetime(2024, 3, 31, 1, 50, tzinfo=oslo)) == (
+        datetime(2024, 3, 31, 3, 0, tzinfo=oslo)
+    )
+
+    prices = index.as_list()
+    assert len(prices) == 92
+    assert prices is index.as_list()
+    assert prices[8]["price"] == 8.0
+    assert datetime.fromisoformat(prices[8]["start"]) == datetime(
+        2024, 3, 31, 3, 0, tzinfo=oslo
+    )
+
+
+def test_price_index_fills_missing_ends():
+    """Test periods without an end run until the next start."""
+    index = PriceIndex.from_hours(
+        [
+            {"startTime": "2024-01-01T00:00:00+00:00", "energyPrice": {"total": 1}},
+            {"startTime": "2024-01-01T00:30:00+00:00", "energyPrice": {"total": 2}},
+            {"startTime": "2024-01-01T00:45:00+00:00", "energyPrice": {"total": 3}},
+            {"startTime": "not a time"},
+        ]
+    )
+
+    assert len(index) == 3
+    assert index.price_at(datetime(2024, 1, 1, 0, 29, tzinfo=timezone.utc)) == 1
+    assert index.price_at(datetime(2024, 1, 1, 0, 59, tzinfo=timezone.utc)) == 3
+    assert index.price_at(datetime(2024, 1, 1, 1, 0, tzinfo=timezone.utc)) is None
+
+    lone = PriceIndex.from_hours([{"startTime": "2024-01-01T00:00:00+00:00"}])
+    assert lone.next_boundary(datetime(2024, 1, 1, tzinfo=timezone.utc)) == datetime(
+        2024, 1, 1, 1, tzinfo=timezone.utc
+    )
+
+
+def test_price_index_short_names_with_minutes():
+    """Test shortName periods with minutes and across midnight."""
+    index = PriceIndex.from_hours(
+        [
+            {"shortName": "13:15-13:30", "energyPrice": {"total": 1}},
+            {"shortName": "23-00", "energyPrice": {"total": 2}},
+        ]
+    )
+    day = dt_util.start_of_local_day()
+
+    assert index.price_at(day + timedelta(hours=13, minutes=20)) == 1
+    assert index.price_at(day + timedelta(hours=13, minutes=30)) is None
+    assert index.price_at(day + timedelta(hours=23, minutes=59)) == 2
+
+
+def test_tariff_data_parse():
+    """Test a response is parsed into metering points, levels and prices."""
+    tariff = TariffData.parse(
+        {
+            "gridTariffCollections": [
+                {
+                    "meteringPointsAndPriceLevels": [
+                        {
+                            "meteringPointId": "mp1",
+                            "currentFixedPriceLevel": {"id": "L2"},
+                        }
+                    ],
+                    "gridTariff": {
+                        "tariffPrice": {
+                            "priceInfo": {
+                                "fixedPrices": [
+                                    {
+                                        "priceLevels": [
+                                            {
+                                                "id": "L2",
+                                                "valueMin": 2,
+                                                "valueMax": 5,
+                                                "monthlyTotal": 10,
+                                                "monthlyUnitOfMeasure": "NOK",
+                                            }
+                                        ]
+                                    }
+                                ]
+                            },
+                            "hours": [
+                                {"shortName": "00-01", "energyPrice": {"total": 1}}
+                            ],
+                        }
+                    },
+                }
+            ]
+        }
+    )
+
+    assert [(mp.id, mp.level_id) for mp in tariff.metering_points] == [("mp1", "L2")]
+    level = tariff.price_levels[0]
+    assert (level.id, level.value_min, level.value_max) == ("L2", 2, 5)
+    assert (level.monthly_total, level.monthly_unit_of_measure) == (10, "NOK")
+    assert level.monthly_taxes is None
+    assert len(tariff.prices) == 1
+
+
+def test_tariff_data_parse_empty_and_malformed():
+    """Test missing parts parse as empty and wrong types raise once."""
+    empty = TariffData.parse(None)
+    assert empty.collections == []
+    assert empty.metering_points == []
+    assert empty.price_levels == []
+    assert len(empty.prices) == 0
+
+    bare = TariffData.parse({"gridTariffCollections": [{}]})
+    assert bare.price_levels == []
+    assert len(bare.prices) == 0
+
+    for data in (
+        [],
+        {"gridTariffCollections": {}},
+        {"gridTariffCollections": [{"gridTariff": {"tariffPrice": {"hours": {}}}}]},
+    ):
+        with pytest.raises(TariffParseError):
+            TariffData.parse(data)
+
+
+def _levels_response(level_id):
+    """Return a response with three price levels listed out of order."""
+    return {
+        "gridTariffCollections": [
+            {
+                "meteringPointsAndPriceLevels": [
+                    {
+                        "meteringPointId": "mp1",
+                        "currentFixedPriceLevel": {"id": level_id},
+                    }
+                ],
+                "gridTariff": {
+                    "tariffPrice": {
+                        "priceInfo": {
+                            "fixedPrices": [
+                                {
+                                    "priceLevels": [
+                                        {
+                                            "id": "L3",
+                                            "valueMin": 5,
+                                            "monthlyTotal": 300,
+                                        },
+                                        {
+                                            "id": "L1",
+                                            "valueMin": 0,
+                                            "monthlyTotal": 100,
+                                        },
+                                        {
+                                            "id": "L2",
+                                            "valueMin": 2,
+                                            "monthlyTotal": 200,
+                                        },
+                                    ]
+                                }
+                            ]
+                        }
+                    }
+                },
+            }
+        ]
+    }
+
+
+def test_tariff_data_uses_current_price_level():
+    """Test fixed prices come from the metering point's level, with neighbours."""
+    tariff = TariffData.parse(_levels_response("L2"))
+
+    assert [level.id for level in tariff.price_levels] == ["L1", "L2", "L3"]
+    assert tariff.fixed_prices["currentFixedPriceLevel"] == "L2"
+    assert tariff.fixed_prices["monthlyTotal"] == 200
+    attributes = tariff.fixed_price_attributes["currentFixedPriceLevel"]
+    assert attributes["value_min"] == 2
+    assert attributes["previous_level"]["id"] == "L1"
+    assert attributes["next_level"] == {
+        "id": "L3",
+        "value_min": 5,
+        "value_max": None,
+        "monthly_total": 300,
+    }
+
+    top = TariffData.parse(_levels_response("L3"))
+    assert top.fixed_price_attributes["currentFixedPriceLevel"]["next_level"] is None
+
+    unknown = TariffData.parse(_levels_response("missing"))
+    assert unknown.fixed_prices["monthlyTotal"] is None
+    assert TariffData([]).fixed_prices["monthlyTotal"] is None
+
+
+def test_tariff_collection_level_for_value():
+    """Test levels are found by power value with bisect."""
+    collection = TariffData.parse(_levels_response("L1")).collections[0]
+
+    assert collection.level_for_value(-1).id == "L1"
+    assert collection.level_for_value(1.9).id == "L1"
+    assert collection.level_for_value(2).id == "L2"
+    assert collection.level_for_value(100).id == "L3"
+    assert (
+        TariffData.parse({"gridTariffCollections": [{}]})
+        .collections[0]
+        .level_for_value(1)
+        is None
+    )
+
+
+def test_tariff_data_points_per_metering_point():
+    """Test every metering point gets its own precomputed tariff."""
+    first = _levels_response("L1")["gridTariffCollections"][0]
+    second = _levels_response("L3")["gridTariffCollections"][0]
+    second["meteringPointsAndPriceLevels"][0]["meteringPointId"] = "mp2"
+    tariff = TariffData([])
+    assert tariff.point("mp1") is tariff.point()
+
+    tariff = TariffData.parse({"gridTariffCollections": [first, second]})
+
+    assert set(tariff.points) == {"mp1", "mp2"}
+    assert tariff.point().fixed_prices["monthlyTotal"] == 100
+    assert tariff.point("mp1").fixed_prices["monthlyTotal"] == 100
+    assert tariff.point("mp2").fixed_prices["monthlyTotal"] == 300
+    assert tariff.point("unknown").fixed_prices["monthlyTotal"] is None
+
+
+def test_tariff_data_point_missing_from_response():
+    """Test only a response that does not name its points stands in for any."""
+    response = _levels_response("L1")
+    tariff = TariffData.parse(response)
+    assert tariff.point("mp2").fixed_prices["monthlyTotal"] is None
+
+    del response["gridTariffCollections"][0]["meteringPointsAndPriceLevels"][0][
+        "meteringPointId"
+    ]
+    tariff = TariffData.parse(response)
+    assert tariff.point("mp2").fixed_prices["monthlyTotal"] == 100
+
+
+def test_tariff_data_next_boundary_over_collections():
+    """Test the next boundary is the earliest of all collections."""
+    day = dt_util.start_of_local_day()
+    tariff = TariffData.parse(
+        {
+            "gridTariffCollections": [
+                _data([{"shortName": "00-02"}])["gridTariffCollections"][0],
+                _data([{"shortName": "00-01"}])["gridTariffCollections"][0],
+            ]
+        }
+    )
+
+    assert tariff.next_boundary(day) == day + timedelta(hours=1)
+    assert tariff.next_boundary(day + timedelta(hours=1)) == day + timedelta(hours=2)
+    assert tariff.next_boundary(day + timedelta(hours=3)) is None
+    assert TariffData([]).next_boundary(day) is None
+
+
+def test_tariff_data_covered_until():
+    """Test coverage ends with the earliest last period of all collections."""
+    day = dt_util.start_of_local_day()
+    tariff = TariffData.parse(
+        {
+            "gridTariffCollections": [
+                _data([{"shortName": "00-24"}])["gridTariffCollections"][0],
+                _data([{"shortName": "00-12"}])["gridTariffCollections"][0],
+            ]
+        }
+    )
+
+    assert tariff.collections[0].prices.end == day + timedelta(hours=24)
+    assert tariff.covered_until == day + timedelta(hours=12)
+    assert TariffData([]).covered_until is None
+    assert TariffData.parse(_data([])).covered_until is None
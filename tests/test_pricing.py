@@ -0,0 +1,97 @@
+"""Tests for the Norgesnett total price."""
+
+from datetime import datetime, timedelta
+
+from homeassistant.core import State
+from homeassistant.util import dt as dt_util
+
+from custom_components.norgesnett.model import PriceIndex
+from custom_components.norgesnett.pricing import TotalPriceFormula, spot_price_index
+
+from .helpers import local_day, make_periods
+
+HOUR = timedelta(hours=1)
+FORMULA = TotalPriceFormula(0.9375, 0.9, -0.01)
+
+
+def _index(start: datetime, length: timedelta, prices: list) -> PriceIndex:
+    """Return consecutive periods of ``length`` from ``start``."""
+    return PriceIndex(make_periods(prices, start.timestamp(), length.total_seconds()))
+
+
+def test_formula_applies_subsidy_above_threshold():
+    """Test the subsidy only covers the spot price above the threshold."""
+    assert FORMULA(0.5, 0.3) == 0.5 + 0.3 - 0.01
+    assert round(FORMULA(1.9375, 0.3), 6) == round(1.0375 + 0.3 - 0.01, 6)
+
+
+def test_spot_price_index_reads_nordpool_attributes():
+    """Test today's and tomorrow's prices are read from the attributes."""
+    day = local_day(2024, 1, 15)
+    state = State(
+        "sensor.nordpool",
+        "1.0",
+        {
+            "raw_today": [
+                {"start": day, "end": day + HOUR, "value": 1.0},
+                {"start": (day + HOUR).isoformat(), "value": 2.0},
+                {"start": day + 2 * HOUR, "value": None},
+                "garbage",
+            ],
+            "raw_tomorrow": [{"hour": day + 24 * HOUR, "price": 3}],
+        },
+    )
+    index = spot_price_index(state, day)
+    assert index.periods() == [
+        (day.timestamp(), (day + HOUR).timestamp(), 1.0),
+        ((day + HOUR).timestamp(), (day + 24 * HOUR).timestamp(), 2.0),
+        ((day + 24 * HOUR).timestamp(), (day + 47 * HOUR).timestamp(), 3.0),
+    ]
+
+
+def test_spot_price_index_falls_back_to_state():
+    """Test an entity without a vector gives the current hour's price."""
+    day = local_day(2024, 1, 15)
+    when = day + timedelta(hours=5, minutes=20)
+    index = spot_price_index(State("sensor.spot", "1.5", {}), when)
+    assert index.price_at(when) == 1.5
+    assert index.start == dt_util.as_utc(day + 5 * HOUR)
+    assert len(spot_price_index(State("sensor.spot", "unknown", {}), when)) == 0
+    assert len(spot_price_index(None, when)) == 0
+
+
+def test_combine_hourly_vectors():
+    """Test equal hourly vectors are added element-wise."""
+    day = local_day(2024, 1, 15)
+    grid = _index(day, HOUR, [0.3, 0.4, None, 0.5])
+    spot = _index(day, HOUR, [1.0, 0.5, 0.5])
+    total = FORMULA.combine(grid, spot, day)
+    assert [round(price, 4) for _, _, price in total.periods()] == [
+        round(FORMULA(1.0, 0.3), 4),
+        round(FORMULA(0.5, 0.4), 4),
+    ]
+    assert total.end == dt_util.as_utc(day + 2 * HOUR)
+
+
+def test_combine_quarter_hour_spot_with_hourly_grid():
+    """Test every spot quarter gets the grid price of its hour."""
+    day = local_day(2024, 1, 15)
+    grid = _index(day, HOUR, [0.2, 0.4])
+    spot = _index(day + HOUR / 2, HOUR / 4, [0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+    total = FORMULA.combine(grid, spot)
+    assert len(total) == 6
+    assert total.price_at(day + HOUR / 2) == FORMULA(0.1, 0.2)
+    assert total.price_at(day + HOUR) == FORMULA(0.3, 0.4)
+
+    # The span limits the vector
+    assert len(FORMULA.combine(grid, spot, day, HOUR)) == 2
+
+
+def test_combine_two_days_of_quarter_hours():
+    """Test two days of quarter-hour prices combine in one pass."""
+    day = local_day(2024, 1, 15)
+    grid = _index(day, HOUR, [0.3] * 48)
+    spot = _index(day, HOUR / 4, [1.0] * 192)
+    total = FORMULA.combine(grid, spot, day)
+    assert len(total) == 192
+    assert total.price_at(day + 47.9 * HOUR) == FORMULA(1.0, 0.3)
@@ -0,0 +1,103 @@
+"""Tests for Norgesnett scheduling helpers."""
+
+from datetime import time, timedelta
+from unittest.mock import MagicMock, patch
+
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.norgesnett.scheduler import BoundaryScheduler, RefreshSchedule
+
+
+async def test_boundary_scheduler_fires_and_rearms(hass):
+    """Test one timer notifies all listeners and is re-armed after firing."""
+    start = dt_util.utcnow()
+    boundaries = [start + timedelta(minutes=15), start + timedelta(minutes=30)]
+
+    def next_boundary(when):
+        return next((b for b in boundaries if b > when), None)
+
+    scheduler = BoundaryScheduler(hass, next_boundary)
+    first, second = MagicMock(), MagicMock()
+    remove_first = scheduler.async_add_listener(first)
+    remove_second = scheduler.async_add_listener(second)
+
+    async_fire_time_changed(hass, boundaries[0])
+    await hass.async_block_till_done()
+    assert first.call_count == 1
+    assert second.call_count == 1
+
+    remove_first()
+    async_fire_time_changed(hass, boundaries[1])
+    await hass.async_block_till_done()
+    assert first.call_count == 1
+    assert second.call_count == 2
+
+    # No boundaries left: nothing is armed until new data re-arms it.
+    boundaries.append(start + timedelta(minutes=45))
+    scheduler.async_rearm()
+    remove_second()
+    async_fire_time_changed(hass, boundaries[2])
+    await hass.async_block_till_done()
+    assert second.call_count == 2
+
+    scheduler.async_rearm()
+
+
+def test_refresh_schedule_aligns_to_publish_time_and_midnight():
+    """Test refreshes are planned at the publish time and at midnight."""
+    schedule = RefreshSchedule(
+        time(13),
+        retry_interval=timedelta(minutes=5),
+        max_retry_interval=timedelta(hours=1),
+        jitter=timedelta(minutes=5),
+    )
+    day = dt_util.start_of_local_day()
+    midnight = dt_util.start_of_local_day(day.date() + timedelta(days=1))
+    day_after = dt_util.start_of_local_day(day.date() + timedelta(days=2))
+    morning = day + timedelta(hours=9)
+    afternoon = day + timedelta(hours=14)
+
+    assert schedule.wanted_until(morning) == midnight
+    assert schedule.wanted_until(afternoon) == day_after
+    assert schedule.next_aligned(morning) == day + timedelta(hours=13)
+    assert schedule.next_aligned(afternoon) == midnight
+    # With tomorrow prefetched, midnight is an in-memory switch.
+    assert schedule.next_aligned(afternoon, day_after) == midnight + timedelta(hours=13)
+
+    with patch("custom_components.norgesnett.scheduler.random.uniform") as uniform:
+        uniform.return_value = 120
+        interval = schedule.next_interval(morning, midnight)
+    assert interval == timedelta(hours=4, minutes=2)
+    uniform.assert_called_once_with(0, 300)
+
+
+def test_refresh_schedule_backs_off_until_data_is_published():
+    """Test missing periods are polled with a capped exponential backoff."""
+    schedule = RefreshSchedule(
+        time(13),
+        retry_interval=timedelta(minutes=5),
+        max_retry_interval=timedelta(minutes=15),
+        jitter=timedelta(0),
+    )
+    day = dt_util.start_of_local_day()
+    midnight = dt_util.start_of_local_day(day.date() + timedelta(days=1))
+    day_after = dt_util.start_of_local_day(day.date() + timedelta(days=2))
+    now = day + timedelta(minutes=1)
+
+    intervals = [schedule.next_interval(now, day) for _ in range(4)]
+    assert intervals == [timedelta(minutes=m) for m in (5, 10, 15, 15)]
+    # The backoff never postpones the next aligned refresh.
+    assert schedule.next_interval(
+        day + timedelta(hours=12, minutes=55), None
+    ) == timedelta(minutes=5)
+
+    # Once the data shows up the backoff starts over.
+    assert schedule.next_interval(now, midnight) == timedelta(hours=12, minutes=59)
+    assert schedule.next_interval(now, None) == timedelta(minutes=5)
+
+    # After the publish time tomorrow's periods are polled for.
+    schedule.next_interval(now, midnight)
+    afternoon = day + timedelta(hours=14)
+    assert schedule.next_interval(afternoon, midnight) == timedelta(minutes=5)
+    assert schedule.next_interval(afternoon, day_after) == timedelta(hours=23)
@@ -0,0 +1,293 @@
+"""Tests for Norgesnett services."""
+
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.norgesnett import async_setup
+from custom_components.norgesnett.const import DOMAIN
+from custom_components.norgesnett.history import TariffHistory
+from custom_components.norgesnett.model import TariffData
+from custom_components.norgesnett.services import (
+    SERVICE_CALCULATE_COST,
+    SERVICE_FIND_CHEAPEST,
+    SERVICE_GET_HISTORY,
+    SERVICE_GET_PRICES,
+    SERVICE_PLAN_LOADS,
+)
+
+
+def _tariff():
+    """Return tariffs with one period for each of two metering points."""
+    return TariffData.parse(
+        {
+            "gridTariffCollections": [
+                {
+                    "meteringPointsAndPriceLevels": [{"meteringPointId": mp_id}],
+                    "gridTariff": {
+                        "tariffPrice": {
+                            "hours": [
+                                {"shortName": "00-01", "energyPrice": {"total": price}}
+                            ]
+                        }
+                    },
+                }
+                for mp_id, price in (("mp1", 1.0), ("mp2", 2.0))
+            ]
+        }
+    )
+
+
+async def test_get_prices_returns_price_series(hass):
+    """Test the service returns the periods of the requested metering point."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={"customer_id": "c", "meteringpoint_id": "mp1, mp2"},
+        entry_id="hub",
+    )
+    entry.add_to_hass(hass)
+    assert await async_setup(hass, {})
+    hass.data[DOMAIN] = {entry.entry_id: SimpleNamespace(tariff=_tariff())}
+
+    async def get_prices(**data):
+        return await hass.services.async_call(
+            DOMAIN, SERVICE_GET_PRICES, data, blocking=True, return_response=True
+        )
+
+    response = await get_prices(config_entry_id="hub")
+    assert response["meteringpoint_id"] == "mp1"
+    assert [period["price"] for period in response["prices"]] == [1.0]
+
+    response = await get_prices(config_entry_id="hub", meteringpoint_id="mp2")
+    assert [period["price"] for period in response["prices"]] == [2.0]
+
+    with pytest.raises(HomeAssistantError):
+        await get_prices(config_entry_id="hub", meteringpoint_id="mp3")
+    with pytest.raises(HomeAssistantError):
+        await get_prices(config_entry_id="missing")
+
+
+async def test_find_cheapest_returns_window(hass):
+    """Test the service finds contiguous and separate cheapest periods."""
+    day = dt_util.start_of_local_day()
+    hours = [
+        {
+            "startTime": (day + timedelta(hours=hour)).isoformat(),
+            "expiredAt": (day + timedelta(hours=hour + 1)).isoformat(),
+            "energyPrice": {"total": price},
+        }
+        for hour, price in enumerate([1.0, 5.0, 2.0, 2.0, 9.0, 1.0])
+    ]
+    tariff = TariffData.parse(
+        {"gridTariffCollections": [{"gridTariff": {"tariffPrice": {"hours": hours}}}]}
+    )
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"customer_id": "c", "meteringpoint_id": "mp1"}
+    )
+    entry.add_to_hass(hass)
+    assert await async_setup(hass, {})
+    hass.data[DOMAIN] = {entry.entry_id: SimpleNamespace(tariff=tariff)}
+
+    async def find_cheapest(**data):
+        with patch(
+            "custom_components.norgesnett.services.dt_util.now", return_value=day
+        ):
+            response = await hass.services.async_call(
+                DOMAIN,
+                SERVICE_FIND_CHEAPEST,
+                {"config_entry_id": entry.entry_id, **data},
+                blocking=True,
+                return_response=True,
+            )
+        return response["window"]
+
+    window = await find_cheapest(duration={"hours": 2})
+    assert window["start"] == (day + timedelta(hours=2)).isoformat()
+    assert window["mean_price"] == 2.0
+
+    window = await find_cheapest(duration={"hours": 2}, contiguous=False)
+    assert [period["price"] for period in window["periods"]] == [1.0, 1.0]
+
+    deadline = dt_util.as_local(day + timedelta(hours=2)).replace(tzinfo=None)
+    window = await find_cheapest(duration={"hours": 2}, deadline=deadline)
+    assert window["start"] == day.isoformat()
+    assert window["mean_price"] == 3.0
+
+    assert await find_cheapest(duration={"hours": 7}) is None
+
+
+async def test_plan_loads_places_loads_under_capacity_level(hass):
+    """Test loads are planned under the upper limit of the current level."""
+    day = dt_util.start_of_local_day()
+    hours = [
+        {
+            "startTime": (day + timedelta(hours=hour)).isoformat(),
+            "expiredAt": (day + timedelta(hours=hour + 1)).isoformat(),
+            "energyPrice": {"total": price},
+        }
+        for hour, price in enumerate([1.0, 1.0, 2.0, 3.0])
+    ]
+    tariff = TariffData.parse(
+        {
+            "gridTariffCollections": [
+                {
+                    "meteringPointsAndPriceLevels": [
+                        {
+                            "meteringPointId": "mp1",
+                            "currentFixedPriceLevel": {"id": "L1"},
+                        }
+                    ],
+                    "gridTariff": {
+                        "tariffPrice": {
+                            "hours": hours,
+                            "priceInfo": {
+                                "fixedPrices": [
+                                    {
+                                        "priceLevels": [
+                                            {"id": "L1", "valueMin": 0, "valueMax": 10}
+                                        ]
+                                    }
+                                ]
+                            },
+                        }
+                    },
+                }
+            ]
+        }
+    )
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"customer_id": "c", "meteringpoint_id": "mp1"}
+    )
+    entry.add_to_hass(hass)
+    assert await async_setup(hass, {})
+    hass.data[DOMAIN] = {entry.entry_id: SimpleNamespace(tariff=tariff)}
+
+    with patch("custom_components.norgesnett.services.dt_util.now", return_value=day):
+        response = await hass.services.async_call(
+            DOMAIN,
+            SERVICE_PLAN_LOADS,
+            {
+                "config_entry_id": entry.entry_id,
+                "loads": [
+                    {"name": "ev", "duration": "02:00:00", "power": 7},
+                    {
+                        "name": "boost",
+                        "duration": {"hours": 1},
+                        "power": 4,
+                        "deadline": dt_util.as_local(day + timedelta(hours=3)).replace(
+                            tzinfo=None
+                        ),
+                    },
+                    {"name": "oven", "duration": "01:00:00", "power": 11},
+                ],
+            },
+            blocking=True,
+            return_response=True,
+        )
+
+    assert response["power_cap"] == 10
+    ev, boost, oven = response["loads"]
+    assert ev["window"]["start"] == day.isoformat()
+    assert ev["cost"] == 14.0
+    assert boost["window"]["start"] == (day + timedelta(hours=2)).isoformat()
+    assert oven == {"name": "oven", "window": None, "cost": None}
+
+
+async def test_calculate_cost_prices_recorded_consumption(hass):
+    """Test consumption is priced with imported and current tariffs."""
+    day = dt_util.start_of_local_day()
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"customer_id": "c", "meteringpoint_id": "mp1"}
+    )
+    entry.add_to_hass(hass)
+    assert await async_setup(hass, {})
+    hass.data[DOMAIN] = {entry.entry_id: SimpleNamespace(tariff=_tariff())}
+    first = day.timestamp()
+    statistics = AsyncMock(return_value=([(first, first + 3600, 2.0)], []))
+
+    async def calculate_cost(**data):
+        return await hass.services.async_call(
+            DOMAIN,
+            SERVICE_CALCULATE_COST,
+            {"config_entry_id": entry.entry_id, **data},
+            blocking=True,
+            return_response=True,
+        )
+
+    with patch(
+        "custom_components.norgesnett.services.async_consumption_and_prices",
+        statistics,
+    ):
+        with pytest.raises(HomeAssistantError):
+            await calculate_cost(consumption_sensor="sensor.energy", start=day)
+
+        hass.config.components.add("recorder")
+        end = day + timedelta(hours=1)
+        response = await calculate_cost(
+            consumption_sensor="sensor.energy",
+            start=dt_util.as_local(day).replace(tzinfo=None),
+            end=end,
+        )
+        assert response["meteringpoint_id"] == "mp1"
+        assert response["start"] == day.isoformat()
+        assert response["end"] == dt_util.as_local(end).isoformat()
+        assert response["energy_cost"] == 2.0
+        assert response["fixed_cost"] is None
+        statistics.assert_awaited_once_with(hass, "sensor.energy", "mp1", day, end)
+
+        # Imported prices take precedence over the current tariffs
+        statistics.return_value = (
+            [(first, first + 3600, 2.0)],
+            [(first, first + 3600, 5.0)],
+        )
+        response = await calculate_cost(consumption_sensor="sensor.energy", start=day)
+        assert response["energy_cost"] == 10.0
+
+
+async def test_get_history_returns_daily_prices_and_levels(hass, tmp_path):
+    """Test the service reads the stored history of a metering point."""
+    day = dt_util.start_of_local_day() - timedelta(days=1)
+    entry = MockConfigEntry(
+        domain=DOMAIN, data={"customer_id": "c", "meteringpoint_id": "mp1"}
+    )
+    entry.add_to_hass(hass)
+    assert await async_setup(hass, {})
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    await history.async_append(
+        "mp1",
+        [(day.timestamp(), day.timestamp() + 3600, 2.0)],
+        "L1",
+        day.date().isoformat(),
+    )
+    coordinator = SimpleNamespace(tariff=_tariff(), history=None)
+    hass.data[DOMAIN] = {entry.entry_id: coordinator}
+
+    async def get_history(**data):
+        return await hass.services.async_call(
+            DOMAIN,
+            SERVICE_GET_HISTORY,
+            {"config_entry_id": entry.entry_id, **data},
+            blocking=True,
+            return_response=True,
+        )
+
+    with pytest.raises(HomeAssistantError):
+        await get_history(start=day)
+
+    coordinator.history = history
+    response = await get_history(start=dt_util.as_local(day).replace(tzinfo=None))
+    assert response == {
+        "meteringpoint_id": "mp1",
+        "daily": [{"day": day.date().isoformat(), "min": 2.0, "mean": 2.0, "max": 2.0}],
+        "level_changes": [
+            {"day": day.date().isoformat(), "level": "L1", "previous": None}
+        ],
+    }
+    response = await get_history(start=day, end=day)
+    assert response["daily"] == []
+    await history.async_close()
@@ -0,0 +1,182 @@
+"""Tests for Norgesnett long-term statistics."""
+
+from datetime import timedelta
+
+import pytest
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    statistics_during_period,
+)
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from custom_components.norgesnett.history import TariffHistory
+from custom_components.norgesnett.model import PriceIndex, TariffData
+from custom_components.norgesnett.statistics import (
+    async_consumption_and_prices,
+    async_import_prices,
+    async_import_statistics,
+    statistic_id,
+)
+
+
+# The recorder has to be set up before hass, which the autouse fixture in
+# conftest.py would otherwise create first.
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(recorder_mock, enable_custom_integrations):
+    """Enable custom integrations with a recorder."""
+    yield
+
+
+def _response(start, prices, meteringpoint_id="mp1"):
+    """Return a response with quarter-hour periods from ``start``."""
+    hours = [
+        {
+            "startTime": (start + timedelta(minutes=15 * index)).isoformat(),
+            "expiredAt": (start + timedelta(minutes=15 * (index + 1))).isoformat(),
+            "energyPrice": {"total": price},
+        }
+        for index, price in enumerate(prices)
+    ]
+    return {
+        "gridTariffCollections": [
+            {
+                "meteringPointsAndPriceLevels": [{"meteringPointId": meteringpoint_id}],
+                "gridTariff": {"tariffPrice": {"hours": hours}},
+            }
+        ]
+    }
+
+
+def test_price_index_hourly():
+    """Test hours get the time-weighted mean, min and max of their periods."""
+    hour = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+    index = PriceIndex(
+        [
+            (hour.timestamp(), hour.timestamp() + 900, 1.0),
+            (hour.timestamp() + 900, hour.timestamp() + 3600, 2.0),
+            (hour.timestamp() + 3600, hour.timestamp() + 9000, 3.0),
+            (hour.timestamp() + 9000, hour.timestamp() + 10800, None),
+        ]
+    )
+
+    assert index.start == hour
+    assert index.hourly() == [
+        (hour, 1.75, 1.0, 2.0),
+        (hour + timedelta(hours=1), 3.0, 3.0, 3.0),
+        (hour + timedelta(hours=2), 3.0, 3.0, 3.0),
+    ]
+    assert PriceIndex([]).start is None
+
+
+async def _statistics(hass, start):
+    """Return the imported hourly statistics of mp1 from ``start``."""
+    await async_wait_recording_done(hass)
+    result = await hass.async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start,
+        None,
+        {statistic_id("mp1")},
+        "hour",
+        None,
+        {"mean", "min", "max"},
+    )
+    return result.get(statistic_id("mp1"), [])
+
+
+async def test_import_statistics_is_idempotent_and_backfills(hass, tmp_path):
+    """Test hours are imported once and gaps are read from the history."""
+    day = dt_util.start_of_local_day() - timedelta(days=3)
+    history = TariffHistory(hass, str(tmp_path / "history.db"))
+    tariff = TariffData.parse(_response(day, [1.0, 2.0, 3.0, 4.0, 5.0]))
+
+    await async_import_statistics(hass, history, tariff)
+    await async_import_statistics(hass, history, tariff)
+    rows = await _statistics(hass, day)
+    assert [(row["mean"], row["min"], row["max"]) for row in rows] == [
+        (2.5, 1.0, 4.0),
+        (5.0, 5.0, 5.0),
+    ]
+
+    # Two days later the stored hours in between are imported with the new ones.
+    later = day + timedelta(days=2)
+    stored = TariffData.parse(_response(day + timedelta(hours=2), [6.0] * 4 * 46))
+    await history.async_append("mp1", stored.point("mp1").prices.periods())
+    await async_import_statistics(
+        hass, history, TariffData.parse(_response(later, [7.0] * 4))
+    )
+    rows = await _statistics(hass, day)
+    assert len(rows) == 49
+    assert rows[-2]["mean"] == 6.0
+    assert rows[-1]["mean"] == 7.0
+
+    # Hours missing from the history are left to the history backfill.
+    last = later + timedelta(days=1)
+    await async_import_statistics(
+        hass, history, TariffData.parse(_response(last, [8.0] * 4))
+    )
+    rows = await _statistics(hass, day)
+    assert len(rows) == 50
+    assert rows[-1]["mean"] == 8.0
+    await history.async_close()
+
+
+async def test_import_statistics_skips_without_recorder_or_prices(hass):
+    """Test nothing is imported without the recorder, prices or a point id."""
+    day = dt_util.start_of_local_day()
+    await async_import_statistics(hass, None, TariffData.parse(_response(day, [])))
+    await async_import_statistics(
+        hass, None, TariffData.parse(_response(day, [1.0], None))
+    )
+    await async_import_prices(hass, "mp1", PriceIndex([]))
+
+    hass.config.components.discard("recorder")
+    tariff = TariffData.parse(_response(day, [1.0]))
+    await async_import_statistics(hass, None, tariff)
+    await async_import_prices(hass, "mp1", tariff.point("mp1").prices)
+    hass.config.components.add("recorder")
+    assert await _statistics(hass, day) == []
+
+    await async_import_prices(hass, "mp1", tariff.point("mp1").prices)
+    assert [row["mean"] for row in await _statistics(hass, day)] == [1.0]
+
+
+async def test_consumption_and_prices_are_read_together(hass):
+    """Test the hourly consumption and prices come back as periods."""
+    day = dt_util.start_of_local_day() - timedelta(days=1)
+    await async_import_statistics(
+        hass, None, TariffData.parse(_response(day, [1.0] * 4 + [2.0] * 4))
+    )
+    async_add_external_statistics(
+        hass,
+        StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name="Consumption",
+            source="test",
+            statistic_id="test:consumption",
+            unit_of_measurement="Wh",
+        ),
+        [
+            StatisticData(start=day + timedelta(hours=hour), sum=total, state=total)
+            for hour, total in enumerate((0.0, 1500.0, 2500.0))
+        ],
+    )
+    await async_wait_recording_done(hass)
+
+    consumption, prices = await async_consumption_and_prices(
+        hass, "test:consumption", "mp1", day, day + timedelta(hours=3)
+    )
+    first = day.timestamp()
+    assert prices == [
+        (first, first + 3600, 1.0),
+        (first + 3600, first + 7200, 2.0),
+    ]
+    assert consumption[1:] == [
+        (first + 3600, first + 7200, 1.5),
+        (first + 7200, first + 10800, 1.0),
+    ]